@@ -1,5 +1,9 @@
 import hmac
 import streamlit as st
+from utils import metrics, warmup
+
+# Prometheus-format /metrics on a local port, started once per process
+metrics.start_server()
 
 
 def check_password():
@@ -21,10 +25,12 @@ def check_password():
             st.secrets.passwords[st.session_state["username"]],
         ):
             st.session_state["password_correct"] = True
+            metrics.LOGIN_ATTEMPTS.inc(result="success")
             del st.session_state["password"]  # Don't store the username or password.
             del st.session_state["username"]
         else:
             st.session_state["password_correct"] = False
+            metrics.LOGIN_ATTEMPTS.inc(result="failure")
 
     # Return True if the username + password is validated.
     if st.session_state.get("password_correct", False):
@@ -40,6 +46,10 @@ def check_password():
 if not check_password():
     st.stop()
 
+# Logged in: import the heavy libraries and build the shared clients in the
+# background (APP_WARMUP=0 skips it), so the first review page starts warm
+warmup.start()
+
 # Main Streamlit app starts here
 #st.write("Here goes your normal Streamlit app...")
 #st.button("Click me")
@@ -0,0 +1,47 @@
+-- Indexes for the lookups the pages run on every rerun.
+--
+-- ensure_index() only creates an index when no existing index already leads
+-- with the column, so primary keys and hand-made indexes are not duplicated.
+-- Prompt text can exceed the btree row size limit, so equality lookups on it
+-- use hash indexes.
+
+CREATE FUNCTION pg_temp.ensure_index(tbl text, col text, method text) RETURNS void AS $$
+BEGIN
+    IF to_regclass(tbl) IS NULL THEN
+        RAISE NOTICE 'Skipping %.%: table does not exist', tbl, col;
+        RETURN;
+    END IF;
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = ic.relam
+        WHERE i.indrelid = tbl::regclass
+          AND a.attname = col
+          AND (am.amname = method OR am.amname = 'btree')
+    ) THEN
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I USING %s (%I)',
+                       tbl || '_' || col || '_idx', tbl, method, col);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- check_duplicate_prompt, get_prompt_feedback
+SELECT pg_temp.ensure_index('upload_prompts', 'image_prompts', 'hash');
+SELECT pg_temp.ensure_index('prompts', 'image_prompts', 'hash');
+
+-- prompts for an image (page loader, image_prompt.get_prompts, approve/reject)
+SELECT pg_temp.ensure_index('prompts', 'sno', 'btree');
+SELECT pg_temp.ensure_index('upload_prompts', 'sno', 'btree');
+
+-- image feedback lookups and rating updates
+SELECT pg_temp.ensure_index('images', 'image', 'btree');
+SELECT pg_temp.ensure_index('upload_images', 'image', 'btree');
+
+-- get_next_serial_number (MAX(sno)) and serial lookups
+SELECT pg_temp.ensure_index('upload_images', 'sno', 'btree');
+
+-- prompt updates by primary key
+SELECT pg_temp.ensure_index('prompts', 'serial_nos', 'btree');
+SELECT pg_temp.ensure_index('upload_prompts', 'serial_nos', 'btree');
@@ -0,0 +1,47 @@
+-- Normalised prompt fingerprints for O(1) duplicate checks on upload_prompts.
+--
+-- The fingerprint is md5 of the prompt lower-cased with runs of whitespace
+-- collapsed to one space and trimmed, so prompts differing only in case or
+-- spacing collide. It is the only definition: utils.prompts leaves every
+-- case/spacing duplicate check to this function via the unique index.
+
+CREATE OR REPLACE FUNCTION prompt_fingerprint(prompt text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT md5(lower(btrim(regexp_replace(prompt, '\s+', ' ', 'g'))))
+$$;
+
+ALTER TABLE upload_prompts ADD COLUMN IF NOT EXISTS prompt_fingerprint text;
+
+-- Backfill existing rows
+UPDATE upload_prompts
+SET prompt_fingerprint = prompt_fingerprint(image_prompts)
+WHERE prompt_fingerprint IS NULL AND image_prompts IS NOT NULL;
+
+-- Duplicates that predate the index keep their rows but only the earliest
+-- one keeps its fingerprint, so the unique index below can be built.
+UPDATE upload_prompts p
+SET prompt_fingerprint = NULL
+FROM (
+    SELECT serial_nos,
+           row_number() OVER (PARTITION BY sno, prompt_fingerprint ORDER BY serial_nos) AS rn
+    FROM upload_prompts
+    WHERE prompt_fingerprint IS NOT NULL
+) dupes
+WHERE p.serial_nos = dupes.serial_nos AND dupes.rn > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS upload_prompts_sno_fingerprint_key
+    ON upload_prompts (sno, prompt_fingerprint);
+
+-- Compute the fingerprint on every insert and prompt edit
+CREATE OR REPLACE FUNCTION upload_prompts_set_fingerprint() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.prompt_fingerprint := prompt_fingerprint(NEW.image_prompts);
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS upload_prompts_fingerprint ON upload_prompts;
+CREATE TRIGGER upload_prompts_fingerprint
+    BEFORE INSERT OR UPDATE OF image_prompts ON upload_prompts
+    FOR EACH ROW EXECUTE FUNCTION upload_prompts_set_fingerprint();
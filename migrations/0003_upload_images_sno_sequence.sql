@@ -0,0 +1,18 @@
+-- Allocate upload_images.sno from a sequence instead of MAX(sno) + 1, which
+-- hands the same serial to concurrent uploads and scans the table each time.
+-- If sno is already a serial column its sequence has this name and is reused.
+
+CREATE SEQUENCE IF NOT EXISTS upload_images_sno_seq;
+
+-- Never move the sequence backwards
+SELECT setval(
+    'upload_images_sno_seq',
+    GREATEST(
+        (SELECT COALESCE(MAX(sno), 0) FROM upload_images),
+        (SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM upload_images_sno_seq)
+    ) + 1,
+    false
+);
+
+ALTER SEQUENCE upload_images_sno_seq OWNED BY upload_images.sno;
+ALTER TABLE upload_images ALTER COLUMN sno SET DEFAULT nextval('upload_images_sno_seq');
@@ -0,0 +1,20 @@
+-- Persisted listing of the review image prefixes so pages can answer
+-- "highest image number", "does image N exist" and "which extension" from
+-- memory instead of listing the bucket or probing blobs on every rerun.
+-- Maintained by utils/manifest.py.
+
+CREATE TABLE IF NOT EXISTS image_manifest (
+    blob_name text PRIMARY KEY,
+    prefix text NOT NULL,
+    serial integer NOT NULL,
+    extension text NOT NULL,
+    size bigint NOT NULL,
+    generation bigint NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS image_manifest_prefix_serial_idx ON image_manifest (prefix, serial);
+
+CREATE TABLE IF NOT EXISTS image_manifest_refresh (
+    prefix text PRIMARY KEY,
+    refreshed_at timestamptz NOT NULL
+);
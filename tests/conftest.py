@@ -0,0 +1,83 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from utils import db, query_cache
+
+
+class FakeCursor:
+    """Records ``(query, params)`` and answers ``fetchone``/``fetchall`` from ``respond(query, params)``."""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._result = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self._connection.executed.append((query, params))
+        result = self._connection.respond(query, params)
+        self._result = list(result or [])
+        self.rowcount = len(self._result)
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+
+class FakeConnection:
+    def __init__(self, respond=None):
+        self.respond = respond or (lambda query, params: [])
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = 0
+        # thread id -> connections it currently holds through the fake ``db.get_connection``
+        self.checked_out = {}
+
+    def held_by_current_thread(self):
+        return self.checked_out.get(threading.get_ident(), 0)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Routes ``db.get_connection`` (and so ``fetch_*``/``execute``) to one ``FakeConnection``."""
+    connection = FakeConnection()
+
+    @contextmanager
+    def get_connection(pool=None):
+        thread = threading.get_ident()
+        connection.checked_out[thread] = connection.checked_out.get(thread, 0) + 1
+        try:
+            yield connection
+            connection.commit()
+        finally:
+            connection.checked_out[thread] -= 1
+
+    monkeypatch.setattr(db, "get_connection", get_connection)
+    return connection
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """A fresh query cache in place of the process-wide one."""
+    fresh = query_cache.QueryCache()
+    monkeypatch.setattr(query_cache, "get_query_cache", lambda: fresh)
+    return fresh
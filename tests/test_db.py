@@ -0,0 +1,159 @@
+import threading
+
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+
+from utils import db
+
+
+class PoolConnection:
+    """Just enough of a psycopg2 connection for the pool: close, rollback and ``SELECT 1``."""
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.rollbacks = 0
+        self.commits = 0
+        self.healthy = True
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        if not self.healthy:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(db.ConnectionPool):
+    def _connect(self):
+        self.connections = getattr(self, "connections", [])
+        self.connections.append(PoolConnection(len(self.connections)))
+        return self.connections[-1]
+
+
+def test_returned_connection_is_reused():
+    pool = FakePool(1, 2)
+    first = pool.getconn()
+    pool.putconn(first)
+    second = pool.getconn()
+
+    assert second is first
+    assert len(pool.connections) == 1
+    assert pool.stats() == {"open": 1, "in_use": 1, "idle": 0, "leaked": 0}
+
+
+def test_overlapping_checkouts_keep_their_connections_warm():
+    pool = FakePool(0, 3)
+    held = [pool.getconn() for _ in range(3)]
+    for conn in held:
+        pool.putconn(conn)
+
+    assert pool.stats()["idle"] == 3
+    assert {id(pool.getconn()) for _ in range(3)} == {id(conn) for conn in held}
+    assert len(pool.connections) == 3
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted():
+    pool = FakePool(0, 1, checkout_timeout=0.05)
+    pool.getconn()
+
+    with pytest.raises(PoolError):
+        pool.getconn()
+
+
+def test_waiting_checkout_gets_the_returned_connection():
+    pool = FakePool(0, 1, checkout_timeout=5)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+
+    pool.putconn(conn)
+    waiter.join(timeout=5)
+    assert got == [conn]
+
+
+def test_closed_idle_connection_is_replaced():
+    pool = FakePool(1, 1)
+    stale = pool.connections[0]
+    stale.closed = 1
+
+    conn = pool.getconn()
+    assert conn is not stale
+    assert len(pool.connections) == 2
+
+
+def test_idle_connection_failing_its_health_check_is_replaced(monkeypatch):
+    monkeypatch.setattr(db, "POOL_HEALTH_CHECK_AFTER", 0)
+    pool = FakePool(1, 1)
+    pool.connections[0].healthy = False
+
+    conn = pool.getconn()
+    assert conn is pool.connections[1]
+    assert pool.connections[0].closed
+
+
+def test_recently_used_connection_skips_the_health_check():
+    pool = FakePool(1, 1)
+    pool.connections[0].healthy = False
+
+    assert pool.getconn() is pool.connections[0]
+
+
+def test_get_connection_commits_and_returns_the_connection():
+    pool = FakePool(1, 1)
+    with db.get_connection(pool) as conn:
+        assert pool.stats()["in_use"] == 1
+
+    assert conn.commits == 1
+    assert pool.stats() == {"open": 1, "in_use": 0, "idle": 1, "leaked": 0}
+
+
+def test_get_connection_discards_a_broken_connection():
+    pool = FakePool(1, 1)
+    with pytest.raises(psycopg2.OperationalError):
+        with db.get_connection(pool) as conn:
+            raise psycopg2.OperationalError("terminating connection")
+
+    assert conn.rollbacks == 1
+    assert conn.closed
+    assert pool.stats()["open"] == 0
+    # The slot was released along with it
+    assert pool.getconn() is not conn
+
+
+def test_get_connection_keeps_the_connection_after_a_query_error():
+    pool = FakePool(1, 1)
+    with pytest.raises(psycopg2.DataError):
+        with db.get_connection(pool) as conn:
+            raise psycopg2.DataError("invalid input syntax")
+
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_release_session_closes_connections_it_leaked():
+    pool = FakePool(0, 2)
+    leaked = pool.getconn(owner="session-a")
+    kept = pool.getconn(owner="session-b")
+
+    pool.release_session("session-a")
+    assert leaked.closed
+    assert not kept.closed
+    assert pool.stats()["in_use"] == 1
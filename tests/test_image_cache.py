@@ -0,0 +1,136 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from utils.image_cache import ImageCache
+from utils.storage import LocalStorage
+
+
+class CountingStorage(LocalStorage):
+    """``LocalStorage`` that counts full and conditional gets."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.gets = []
+
+    def get(self, name, if_generation_not_match=None):
+        self.gets.append((name, if_generation_not_match is not None))
+        return super().get(name, if_generation_not_match)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return CountingStorage(tmp_path / "bucket")
+
+
+def make_cache(tmp_path, **kwargs):
+    return ImageCache(directory=tmp_path / "cache", **kwargs)
+
+
+def cached_files(tmp_path):
+    return sorted(path.name for path in (tmp_path / "cache").iterdir())
+
+
+def test_fresh_entry_is_served_from_memory(storage, tmp_path):
+    storage.put("a.jpg", b"a" * 10)
+    cache = make_cache(tmp_path)
+
+    assert cache.get(storage, "a.jpg") == b"a" * 10
+    assert cache.get(storage, "a.jpg") == b"a" * 10
+    assert storage.gets == [("a.jpg", False)]
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_entry_is_revalidated_and_picks_up_a_new_version(storage, tmp_path):
+    storage.put("a.jpg", b"old")
+    cache = make_cache(tmp_path, revalidate_after=0)
+
+    assert cache.get(storage, "a.jpg") == b"old"
+    assert cache.get(storage, "a.jpg") == b"old"
+    assert cache.stats()["revalidations"] == 1
+
+    storage.put("a.jpg", b"new")
+    assert cache.get(storage, "a.jpg") == b"new"
+    assert storage.gets == [("a.jpg", False), ("a.jpg", True), ("a.jpg", True)]
+    # Only the current generation is kept on disk
+    assert len(cached_files(tmp_path)) == 1
+
+
+def test_deleted_blob_is_dropped_from_disk(storage, tmp_path):
+    storage.put("a.jpg", b"a")
+    cache = make_cache(tmp_path, revalidate_after=0)
+    cache.get(storage, "a.jpg")
+
+    storage.delete("a.jpg")
+    assert cache.get(storage, "a.jpg") is None
+    assert cached_files(tmp_path) == []
+
+
+def test_memory_tier_evicts_least_recently_used(storage, tmp_path):
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        storage.put(name, name[0].encode() * 100)
+    cache = make_cache(tmp_path, memory_budget=250)
+
+    cache.get(storage, "a.jpg")
+    cache.get(storage, "b.jpg")
+    cache.get(storage, "a.jpg")
+    cache.get(storage, "c.jpg")
+
+    assert cache.stats()["memory_bytes"] == 200
+    # b was least recently used: it comes back from disk, a is still in memory
+    assert cache.get(storage, "a.jpg") == b"a" * 100
+    assert cache.get(storage, "b.jpg") == b"b" * 100
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used_and_survives_restart(storage, tmp_path):
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        storage.put(name, name[0].encode() * 100)
+    cache = make_cache(tmp_path, disk_budget=250)
+    cache.get(storage, "a.jpg")
+    cache.get(storage, "b.jpg")
+    cache.get(storage, "c.jpg")
+
+    assert cache.stats()["disk_bytes"] == 200
+    assert len(cached_files(tmp_path)) == 2
+
+    restarted = make_cache(tmp_path, disk_budget=250)
+    storage.gets.clear()
+    assert restarted.get(storage, "c.jpg") == b"c" * 100
+    assert restarted.get(storage, "a.jpg") == b"a" * 100
+    assert storage.gets == [("c.jpg", True), ("a.jpg", False)]
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_interrupted_write_is_cleaned_up_on_start(storage, tmp_path):
+    (tmp_path / "cache").mkdir()
+    (tmp_path / "cache" / "deadbeef.x1y2.tmp").write_bytes(b"partial")
+
+    assert make_cache(tmp_path).stats()["disk_bytes"] == 0
+    assert cached_files(tmp_path) == []
+
+
+def test_disk_io_runs_outside_the_lock(storage, tmp_path, monkeypatch):
+    storage.put("a.jpg", b"a" * 10)
+    cache = make_cache(tmp_path, memory_budget=0)
+    held = []
+    read_bytes, replace = Path.read_bytes, os.replace
+
+    def checked_read_bytes(path):
+        held.append(cache._lock.locked())
+        return read_bytes(path)
+
+    def checked_replace(src, dst):
+        held.append(cache._lock.locked())
+        return replace(src, dst)
+
+    monkeypatch.setattr(Path, "read_bytes", checked_read_bytes)
+    monkeypatch.setattr(os, "replace", checked_replace)
+    cache.get(storage, "a.jpg")
+    # Too big for memory, so this one is read back from disk
+    cache.get(storage, "a.jpg")
+
+    assert cache.stats()["disk_hits"] == 1
+    assert held and not any(held)
@@ -0,0 +1,94 @@
+import pytest
+
+from utils.manifest import ImageManifest
+from utils.storage import LocalStorage
+
+PREFIX = "Upload_images/Moodboard Images/"
+
+
+class ListingStorage(LocalStorage):
+    """``LocalStorage`` that runs ``during_list`` after taking its listing, before refresh() sees it."""
+
+    during_list = None
+
+    def list(self, prefix, delimiter=None):
+        stats = list(super().list(prefix, delimiter))
+        if self.during_list is not None:
+            during_list, self.during_list = self.during_list, None
+            during_list()
+        return iter(stats)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return ListingStorage(tmp_path)
+
+
+@pytest.fixture
+def manifest(storage):
+    manifest = ImageManifest(storage, PREFIX)
+    # In memory only; persistence needs the image_manifest tables
+    manifest._persist = False
+    return manifest
+
+
+def upload(storage, manifest, serial, data=b"jpg", extension="jpg"):
+    stat = storage.put(f"{PREFIX}image{serial}.{extension}", data)
+    manifest.record(stat)
+    return stat
+
+
+def test_refresh_picks_up_and_drops_objects(storage, manifest):
+    storage.put(f"{PREFIX}image1.jpg", b"1")
+    storage.put(f"{PREFIX}image2.png", b"2")
+    storage.put(f"{PREFIX}thumbnails/image1.webp", b"t")
+    storage.put(f"{PREFIX}notes.txt", b"n")
+
+    assert manifest.refresh() == (2, 0)
+    assert manifest.max_serial() == 2
+    assert manifest.lookup(2).extension == "png"
+
+    storage.delete(f"{PREFIX}image2.png")
+    assert manifest.refresh() == (0, 1)
+    assert manifest.lookup(2) is None
+
+
+def test_upload_recorded_during_the_listing_is_kept(storage, manifest):
+    upload(storage, manifest, 1)
+    storage.during_list = lambda: upload(storage, manifest, 2)
+
+    manifest.refresh()
+
+    assert manifest.exists(2)
+    assert manifest.exists(1)
+
+
+def test_new_version_recorded_during_the_listing_wins_over_the_listed_one(storage, manifest):
+    upload(storage, manifest, 1, b"old")
+    manifest.refresh()
+    newer = []
+    storage.during_list = lambda: newer.append(upload(storage, manifest, 1, b"new version"))
+
+    manifest.refresh()
+
+    assert manifest.lookup(1).generation == newer[0].generation
+    assert manifest.lookup(1).size == len(b"new version")
+
+
+def test_recorded_object_deleted_later_goes_on_the_next_refresh(storage, manifest):
+    storage.during_list = lambda: upload(storage, manifest, 3)
+    manifest.refresh()
+    assert manifest.exists(3)
+
+    storage.delete(f"{PREFIX}image3.jpg")
+    manifest.refresh()
+    assert not manifest.exists(3)
+
+
+def test_lookup_prefers_extensions_in_order(storage, manifest):
+    upload(storage, manifest, 4, extension="png")
+    upload(storage, manifest, 4, extension="jpg")
+
+    assert manifest.lookup(4).extension == "jpg"
+    assert manifest.lookup(4, ("png", "jpg")).extension == "png"
+    assert manifest.max_serial("png") == 4
@@ -0,0 +1,29 @@
+import pytest
+
+from utils import metrics
+
+
+def test_query_name_from_str():
+    assert metrics.query_name("SELECT * FROM prompts WHERE sno = %s") == "select:prompts"
+    assert metrics.query_name('\n  UPDATE "images" SET status = %s') == "update:images"
+    assert metrics.query_name("   ") == "empty"
+
+
+def test_query_name_from_bytes():
+    # execute_values sends the statement already rendered, as bytes
+    query = b"\nINSERT INTO upload_prompts (prompt) VALUES ('a red coat'),('a blue hat')"
+    assert metrics.query_name(query) == "insert:upload_prompts"
+
+
+def test_query_name_from_composed():
+    sql = pytest.importorskip("psycopg2.sql")
+    query = sql.SQL("SELECT {} FROM {} WHERE sno = {} AND status = {}").format(
+        sql.Identifier("prompt"), sql.Identifier("prompts"), sql.Placeholder(), sql.Literal("secret"))
+    assert metrics.query_name(query) == "select:prompts"
+
+
+def test_statement_text_keeps_values_out_of_composed():
+    sql = pytest.importorskip("psycopg2.sql")
+    query = sql.SQL("UPDATE {} SET prompt = {} WHERE sno = {}").format(
+        sql.Identifier("prompts"), sql.Literal("secret"), sql.Placeholder("sno"))
+    assert metrics.statement_text(query) == 'UPDATE "prompts" SET prompt = %s WHERE sno = %(sno)s'
@@ -0,0 +1,34 @@
+import pytest
+
+from utils import metrics, moderation, page_loader
+
+
+def test_set_image_status_clears_the_entry_the_page_reads(fake_db, cache):
+    status = {"upload_images": "PENDING", "upload_prompts": "PENDING"}
+
+    def respond(query, params):
+        text = metrics.statement_text(query)
+        if text.lstrip().startswith("SELECT"):
+            return [({"image_feedback": 8, "status": status["upload_images"]},
+                     {"prompt_feedback": 9, "status": status["upload_prompts"]}, [])]
+        status[metrics.query_name(text).split(":")[1]] = params[0]
+        return []
+
+    fake_db.respond = respond
+    read = lambda: page_loader.fetch_review_data(7, "image7.jpg", "upload_images", "upload_prompts")
+
+    assert read().image_status == "PENDING"
+    assert read().image_status == "PENDING"
+    assert cache.stats()["hits"] == 1
+
+    moderation.set_image_status("APPROVED", 7, "image7.jpg", "upload_images", "upload_prompts")
+
+    data = read()
+    assert (data.image_status, data.prompt_status) == ("APPROVED", "APPROVED")
+    assert cache.stats()["misses"] == 2
+
+
+def test_set_image_status_rejects_unknown_status(fake_db, cache):
+    with pytest.raises(ValueError):
+        moderation.set_image_status("DONE", 1, "image1.jpg", "images", "prompts")
+    assert fake_db.executed == []
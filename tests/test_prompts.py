@@ -0,0 +1,65 @@
+import io
+
+import psycopg2.extras
+
+from utils import prompts
+
+
+class UploadedFile(io.BytesIO):
+    """``BytesIO`` with the ``name`` Streamlit's ``UploadedFile`` carries."""
+
+    def __init__(self, name, text):
+        super().__init__(text.encode("utf-8"))
+        self.name = name
+
+
+def test_csv_rows_accept_either_column_name_and_reject_bad_rows():
+    uploaded = UploadedFile("prompts.csv", (
+        "\ufeffserial_no,image_prompt\n"  # Excel's byte-order mark
+        "1, a red dress \n"
+        "x,not a serial\n"
+        "2,\n"
+        '3,"with, a comma"\n'
+    ))
+
+    assert list(prompts.iter_prompt_file(uploaded)) == [(1, "a red dress"), None, None, (3, "with, a comma")]
+    # The upload buffer is left open for the caller
+    assert not uploaded.closed
+
+
+def test_csv_with_alternate_headers():
+    uploaded = UploadedFile("prompts.CSV", "sno,image_prompts\n4,linen shirt\n")
+
+    assert list(prompts.iter_prompt_file(uploaded)) == [(4, "linen shirt")]
+
+
+def test_jsonl_counts_malformed_and_non_object_lines_as_rejected():
+    uploaded = UploadedFile("prompts.jsonl", (
+        '{"sno": 5, "image_prompt": "wool coat"}\n'
+        "\n"
+        '{"sno": 6, "image_prompt": \n'
+        '["not", "an", "object"]\n'
+        '{"serial_no": "7", "image_prompts": "silk scarf"}\n'
+    ))
+
+    assert list(prompts.iter_prompt_file(uploaded)) == [(5, "wool coat"), None, None, (7, "silk scarf")]
+
+
+def test_clean_prompts_drops_blanks_and_exact_repeats_keeping_the_first():
+    assert prompts._clean_prompts(["A cat", "", "  ", "a dog", " A cat "]) == ["A cat", "a dog"]
+
+
+def test_case_and_spacing_variants_are_left_to_the_fingerprint_index(fake_db, monkeypatch):
+    sent = []
+
+    def execute_values(cursor, query, rows, page_size=None, fetch=False):
+        sent.extend(row[2] for row in rows)
+        # The database keeps the first of each fingerprint
+        return [("A cat",), ("a\u00a0dog",)]
+
+    monkeypatch.setattr(psycopg2.extras, "execute_values", execute_values)
+    inserted, skipped = prompts.insert_prompts_bulk(1, ["A cat", "a  CAT", "a\u00a0dog", "A cat"])
+
+    assert sent == ["A cat", "a  CAT", "a\u00a0dog"]
+    assert inserted == ["A cat", "a\u00a0dog"]
+    assert skipped == ["a  CAT"]
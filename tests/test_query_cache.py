@@ -0,0 +1,70 @@
+from utils import query_cache
+from utils.query_cache import QueryCache
+
+
+class Loader:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_value_is_loaded_once_until_it_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    cache = QueryCache(ttl=10)
+    loader = Loader("row")
+
+    assert cache.read_through("prompts", 42, "page", loader) == "row"
+    now[0] += 9
+    assert cache.read_through("prompts", 42, "page", loader) == "row"
+    assert loader.calls == 1
+
+    now[0] += 2
+    cache.read_through("prompts", 42, "page", loader)
+    assert loader.calls == 2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_invalidate_drops_every_lookup_of_the_row_only():
+    cache = QueryCache()
+    cache.read_through("prompts", 42, "page", Loader(1))
+    cache.read_through("prompts", 42, "count", Loader(2))
+    cache.read_through("prompts", 43, "page", Loader(3))
+
+    cache.invalidate("prompts", 42)
+
+    assert cache.stats()["entries"] == 1
+    again = Loader(4)
+    assert cache.read_through("prompts", 42, "page", again) == 4
+    assert cache.read_through("prompts", 43, "page", again) == 3
+    assert again.calls == 1
+
+
+def test_invalidating_a_dependency_drops_the_dependent_entry():
+    cache = QueryCache()
+    cache.read_through("prompts", 42, "page", Loader("v1"), depends_on=[("images", "image42.jpg")])
+
+    cache.invalidate("images", "image42.jpg")
+
+    reload = Loader("v2")
+    assert cache.read_through("prompts", 42, "page", reload) == "v2"
+    assert reload.calls == 1
+    # The dependency link is consumed with the invalidation
+    cache.invalidate("images", "image42.jpg")
+    assert cache.read_through("prompts", 42, "page", reload) == "v2"
+    assert reload.calls == 1
+
+
+def test_invalidate_rows_uses_the_first_column(cache):
+    cache.read_through("prompts", 7, "page", Loader(1))
+    cache.read_through("prompts", 8, "page", Loader(2))
+
+    query_cache.invalidate_rows("prompts", [(7,), (7,), (9,)])
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,78 @@
+import pytest
+
+from utils import metrics, table_browser
+
+COLUMNS = [("sno", "integer"), ("image", "text"), ("image_feedback", "integer")]
+
+
+@pytest.fixture
+def browse(fake_db, monkeypatch):
+    """Runs ``fetch_page`` and returns ``(sql, params)`` of the statement it sent."""
+    monkeypatch.setattr(table_browser, "get_columns", lambda table_name: COLUMNS)
+
+    def run(sort_column, descending=False, filters=None, cursor=None, key_column="sno", page_size=50):
+        table_browser.fetch_page("upload_images", key_column, sort_column, descending,
+                                 filters or {}, cursor, page_size)
+        query, params = fake_db.executed[-1]
+        return " ".join(metrics.statement_text(query).split()), params
+
+    return run
+
+
+def test_first_page_orders_by_sort_then_key(browse):
+    query, params = browse("image_feedback", page_size=20)
+
+    # statement_text renders the LIMIT literal as a placeholder
+    assert query == ('SELECT "sno", "image", "image_feedback" FROM "upload_images" '
+                     'ORDER BY "image_feedback" ASC NULLS LAST, "sno" ASC LIMIT %s;')
+    assert params == []
+
+
+def test_next_page_seeks_past_the_cursor_and_into_nulls(browse):
+    query, params = browse("image_feedback", descending=True, cursor=(3, 120))
+
+    assert ('WHERE ("image_feedback" < %s OR ("image_feedback" = %s AND "sno" < %s) OR "image_feedback" IS NULL)'
+            in query)
+    assert 'ORDER BY "image_feedback" DESC NULLS LAST, "sno" DESC' in query
+    assert params == [3, 3, 120]
+
+
+def test_cursor_inside_the_nulls_only_advances_the_key(browse):
+    query, params = browse("image_feedback", cursor=(None, 120))
+
+    assert 'WHERE ("image_feedback" IS NULL AND "sno" > %s)' in query
+    assert params == [120]
+
+
+def test_sorting_by_the_key_uses_a_single_column_seek(browse):
+    query, params = browse("sno", cursor=(120, 120))
+
+    assert 'WHERE "sno" > %s ORDER BY "sno" ASC NULLS LAST LIMIT %s;' in query
+    assert params == [120]
+
+
+def test_filters_are_pushed_down_by_column_type(browse):
+    query, params = browse("sno", filters={"image": " cat ", "image_feedback": "4", "sno": ""}, cursor=(9, 9))
+
+    assert 'WHERE "image"::text ILIKE %s AND "image_feedback" = %s AND "sno" > %s' in query
+    assert params == ["%cat%", 4, 9]
+
+
+def test_non_numeric_filter_on_a_numeric_column_is_ignored(browse):
+    query, params = browse("sno", filters={"image_feedback": "four"})
+
+    assert "WHERE" not in query
+    assert params == []
+
+
+def test_one_extra_row_is_fetched_to_tell_if_there_is_more(fake_db, monkeypatch):
+    monkeypatch.setattr(table_browser, "get_columns", lambda table_name: COLUMNS)
+    fake_db.respond = lambda query, params: [(n, f"image{n}.jpg", None) for n in range(3)]
+
+    page, has_more = table_browser.fetch_page("upload_images", "sno", "sno", False, {}, None, 2)
+    assert len(page) == 2
+    assert has_more
+
+    page, has_more = table_browser.fetch_page("upload_images", "sno", "sno", False, {}, None, 3)
+    assert len(page) == 3
+    assert not has_more
@@ -0,0 +1,66 @@
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import uploads
+from utils.storage import LocalStorage
+
+WORKERS = 16
+
+
+def test_concurrent_create_image_gets_distinct_serials_and_blobs(fake_db, tmp_path):
+    serials = itertools.count(100)
+    lock = threading.Lock()
+    rows = []
+
+    def respond(query, params):
+        if "nextval" in query:
+            with lock:
+                return [(next(serials),) for _ in range(params[0])]
+        rows.append(params)
+        return []
+
+    fake_db.respond = respond
+    storage = LocalStorage(tmp_path)
+    barrier = threading.Barrier(WORKERS, timeout=10)
+    held_during_upload = []
+
+    def upload_one(worker):
+        def upload(filename, blob_name):
+            held_during_upload.append(fake_db.held_by_current_thread())
+            storage.put(blob_name, f"worker {worker}".encode())
+
+        barrier.wait()
+        sno, _ = uploads.create_image(upload)
+        return sno, storage.get(f"{uploads.UPLOAD_PREFIX}{uploads.image_filename(sno)}")[0]
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        results = list(executor.map(upload_one, range(WORKERS)))
+
+    assert len({sno for sno, _ in results}) == WORKERS
+    assert len({data for _, data in results}) == WORKERS
+    assert sorted(row[0] for row in rows) == sorted(sno for sno, _ in results)
+    # No worker holds a connection (or a transaction) while its bytes are uploaded
+    assert held_during_upload == [0] * WORKERS
+
+
+def test_failed_upload_writes_no_row(fake_db):
+    fake_db.respond = lambda query, params: [(7,)] if "nextval" in query else pytest.fail("row written")
+
+    def upload(filename, blob_name):
+        raise OSError("bucket unavailable")
+
+    with pytest.raises(OSError):
+        uploads.create_image(upload)
+
+
+@pytest.mark.skipif(not os.environ.get("UPLOAD_STRESS_DB"),
+                    reason="set UPLOAD_STRESS_DB=1 to run against the database (scratch schema, dropped afterwards)")
+def test_stress_allocation_against_the_database():
+    results = uploads.stress_test_allocation(WORKERS)
+    assert len({sno for sno, _, _ in results}) == WORKERS
+    assert len({blob_name for _, blob_name, _ in results}) == WORKERS
+    assert len({data for _, _, data in results}) == WORKERS
@@ -0,0 +1,144 @@
+import json
+
+import psycopg2
+import pytest
+
+from utils import write_behind
+
+GROUP = ("prompts", "prompt_feedback", "serial_nos", "sno")
+
+
+class FakeDatabase:
+    """Stands in for ``_write_group``: applies rows to ``table`` unless the batch holds a rejected key."""
+
+    def __init__(self):
+        self.table = {}
+        self.batches = []
+        self.rejected_keys = set()
+        self.down = False
+
+    def write_group(self, table, column, key_column, cache_column, rows):
+        self.batches.append(list(rows))
+        if self.down:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        if any(key in self.rejected_keys for key, _ in rows):
+            raise psycopg2.DataError("value out of range")
+        for key, value in rows:
+            self.table[key] = value
+        return [(key,) for key, _ in rows]
+
+
+@pytest.fixture
+def database(monkeypatch, cache):
+    fake = FakeDatabase()
+    monkeypatch.setattr(write_behind.WriteBehindBuffer, "_write_group",
+                        lambda self, *args: fake.write_group(*args))
+    return fake
+
+
+@pytest.fixture
+def make_buffer(tmp_path):
+    buffers = []
+
+    def make(**kwargs):
+        buffer = write_behind.WriteBehindBuffer(
+            journal_path=tmp_path / "journal.jsonl", dead_letter_path=tmp_path / "dead_letter.jsonl",
+            flush_interval=3600, flush_threshold=1000, **kwargs)
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer._stopped = True
+        buffer._wake.set()
+
+
+def submit(buffer, key, value):
+    buffer.submit(GROUP[0], GROUP[1], GROUP[2], key, value, cache_column=GROUP[3])
+
+
+def journal_lines(tmp_path):
+    return [json.loads(line) for line in (tmp_path / "journal.jsonl").read_text().splitlines()]
+
+
+def test_repeated_ratings_coalesce_into_one_row(database, make_buffer):
+    buffer = make_buffer()
+    submit(buffer, 1, 2)
+    submit(buffer, 1, 5)
+    submit(buffer, 2, 3)
+
+    assert buffer.flush() == 2
+    assert database.batches == [[(1, 5), (2, 3)]]
+    assert database.table == {1: 5, 2: 3}
+    assert buffer.stats() == {"pending": 0, "flushed": 2, "coalesced": 1, "stuck": 0, "dead_lettered": 0}
+
+
+def test_unflushed_ratings_are_replayed_after_a_restart(database, make_buffer, tmp_path):
+    crashed = make_buffer()
+    submit(crashed, 1, 2)
+    submit(crashed, 1, 4)
+    submit(crashed, 7, 1)
+
+    restarted = make_buffer()
+    assert restarted.pending_value(*GROUP[:3], 1, GROUP[3]) == 4
+    assert restarted.flush() == 2
+    assert database.table == {1: 4, 7: 1}
+    # Flushed rows are compacted out of the journal
+    assert journal_lines(tmp_path) == []
+
+
+def test_torn_journal_line_is_skipped(database, make_buffer, tmp_path):
+    submit(make_buffer(), 1, 3)
+    with open(tmp_path / "journal.jsonl", "a", encoding="utf-8") as journal:
+        journal.write('{"write": ["prompts", "prompt_fe')
+
+    restarted = make_buffer()
+    assert restarted.stats()["pending"] == 1
+    assert restarted.flush() == 1
+
+
+def test_rejected_row_does_not_block_its_group(database, make_buffer):
+    database.rejected_keys = {2}
+    buffer = make_buffer()
+    for key in (1, 2, 3):
+        submit(buffer, key, 4)
+
+    assert buffer.flush() == 2
+    assert database.table == {1: 4, 3: 4}
+    assert buffer.stats()["pending"] == 1
+    assert buffer.stats()["stuck"] == 1
+
+
+def test_row_is_dead_lettered_after_max_attempts(database, make_buffer, tmp_path):
+    database.rejected_keys = {2}
+    buffer = make_buffer(max_attempts=3)
+    submit(buffer, 2, 4)
+
+    for _ in range(2):
+        buffer.flush()
+        assert buffer.stats()["pending"] == 1
+    buffer.flush()
+
+    assert buffer.stats() == {"pending": 0, "flushed": 0, "coalesced": 0, "stuck": 0, "dead_lettered": 1}
+    dead = [json.loads(line) for line in (tmp_path / "dead_letter.jsonl").read_text().splitlines()]
+    assert [(record["write"], record["value"], record["attempts"]) for record in dead] == [
+        (list(GROUP) + [2], 4, 3)]
+    # Not replayed after a restart
+    assert journal_lines(tmp_path) == []
+    assert make_buffer().stats()["pending"] == 0
+
+
+def test_connection_errors_do_not_count_against_rows(database, make_buffer):
+    database.down = True
+    buffer = make_buffer(max_attempts=2)
+    submit(buffer, 1, 4)
+    submit(buffer, 2, 5)
+
+    for _ in range(5):
+        assert buffer.flush() == 0
+    assert buffer.stats()["pending"] == 2
+    assert buffer.stats()["stuck"] == 0
+
+    database.down = False
+    assert buffer.flush() == 2
+    assert database.table == {1: 4, 2: 5}
@@ -0,0 +1,326 @@
+"""PostgreSQL access shared by every page.
+
+Streamlit re-executes a page on every interaction, so opening a connection per
+statement means a TCP + auth handshake for every query of every rerun. Instead
+one bounded pool is created per process (cached with ``st.cache_resource``) and
+every helper below borrows a warm connection from it.
+
+Checked-out connections are tracked per Streamlit session: anything a session
+still holds when it ends is closed by a finalizer, and connections held for
+longer than ``POOL_LEAK_WARNING_AFTER`` are reported as leaks.
+"""
+import atexit
+import functools
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Database connection configuration
+DB_CONNECTION = {
+    "host": "34.93.64.44",
+    "port": "5432",
+    "dbname": "genai",
+    "user": "postgres",
+    "password": "postgres-genai"
+}
+
+# Pool sizing: MIN connections are opened up front; up to MAX are kept open once used
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 10
+# Seconds to wait for a free connection before giving up
+POOL_CHECKOUT_TIMEOUT = 30
+# Connections idle for longer than this are pinged before being handed out
+POOL_HEALTH_CHECK_AFTER = 60
+# Connections checked out for longer than this are logged as probable leaks
+POOL_LEAK_WARNING_AFTER = 120
+
+_SESSION_SENTINEL_KEY = "_db_session_sentinel"
+_THREAD_OWNER_PREFIX = "thread:"
+
+
+def _current_session_id():
+    """The Streamlit session running this code, or ``thread:<name>`` outside a
+    script run (worker threads, CLIs), so leak warnings still name the holder."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        return ctx.session_id
+    return f"{_THREAD_OWNER_PREFIX}{threading.current_thread().name}"
+
+
+@functools.cache
+def traced_cursor_class():
+    """Cursor class whose statements show up as ``db.execute`` spans in the rerun's
+    trace and in the query latency metrics.
+
+    Built on first use, so importing this module does not import psycopg2.
+    """
+    from psycopg2.extensions import cursor
+
+    class TracedCursor(cursor):
+        def execute(self, query, vars=None):
+            return self._run("db.execute", super().execute, query, vars)
+
+        def executemany(self, query, vars_list):
+            return self._run("db.executemany", super().executemany, query, vars_list)
+
+        def _run(self, span_name, method, query, params):
+            name = metrics.query_name(query)
+            # Spans are logged, so they carry the statement template only: bytes come from
+            # execute_values with every row's values already in them and are labelled by name
+            template = name if isinstance(query, bytes) else tracing.label(metrics.statement_text(query))
+            started = time.perf_counter()
+            try:
+                with tracing.span(span_name, query=template):
+                    return method(query, params)
+            except Exception as e:
+                metrics.DB_QUERY_ERRORS.inc(query=name, error=type(e).__name__)
+                raise
+            finally:
+                metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - started, query=name)
+
+    return TracedCursor
+
+
+class ConnectionPool:
+    """Bounded, thread-safe psycopg2 pool.
+
+    Keeps every returned connection open and idle (up to ``maxconn``) rather
+    than closing those beyond ``minconn`` as ``ThreadedConnectionPool`` does,
+    so overlapping checkouts reuse warm connections instead of reconnecting.
+    Callers wait for a free slot when all ``maxconn`` are checked out, and a
+    connection dropped by the server is replaced transparently on checkout.
+    """
+
+    def __init__(self, minconn, maxconn, checkout_timeout=POOL_CHECKOUT_TIMEOUT, **connect_kwargs):
+        self._connect_kwargs = connect_kwargs
+        self._maxconn = maxconn
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._checkout_timeout = checkout_timeout
+        # (conn, last used) for idle connections, most recently used last
+        self._idle = []
+        # id(conn) -> (conn, session_id, checkout time)
+        self._checked_out = {}
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._idle.extend((self._connect(), now) for _ in range(minconn))
+
+    def _connect(self):
+        import psycopg2
+
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def getconn(self, owner=None):
+        """Borrow a healthy connection, blocking while the pool is exhausted."""
+        self._warn_about_leaks()
+        if not self._slots.acquire(timeout=self._checkout_timeout):
+            from psycopg2.pool import PoolError
+
+            raise PoolError(f"Timed out waiting for a free database connection ({self.stats()})")
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    conn = self._connect()
+                elif self._is_healthy(*idle):
+                    conn = idle[0]
+                else:
+                    logger.info("Replacing stale database connection")
+                    self._close(idle[0])
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._checked_out[id(conn)] = (conn, owner, time.monotonic())
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection; broken connections are closed instead of reused."""
+        close = close or bool(conn.closed)
+        with self._lock:
+            if self._checked_out.pop(id(conn), None) is None:
+                # Already returned, e.g. by release_session()
+                return
+            if not close and len(self._idle) < self._maxconn:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+        try:
+            if conn is not None:
+                self._close(conn)
+        finally:
+            self._slots.release()
+
+    def release_session(self, session_id):
+        """Close every connection still held by a session that has ended."""
+        with self._lock:
+            held = [conn for conn, owner, _ in self._checked_out.values() if owner == session_id]
+        for conn in held:
+            logger.warning(f"Closing connection leaked by session {session_id}")
+            self.putconn(conn, close=True)
+
+    def stats(self):
+        """Counts of open handles, for leak detection and logging."""
+        now = time.monotonic()
+        with self._lock:
+            in_use = len(self._checked_out)
+            leaked = sum(1 for _, _, since in self._checked_out.values() if now - since > POOL_LEAK_WARNING_AFTER)
+            idle = len(self._idle)
+        return {"open": in_use + idle, "in_use": in_use, "idle": idle, "leaked": leaked}
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _warn_about_leaks(self):
+        now = time.monotonic()
+        with self._lock:
+            held = [(owner, now - since) for _, owner, since in self._checked_out.values()]
+        for owner, age in held:
+            if age > POOL_LEAK_WARNING_AFTER:
+                logger.warning(f"Connection held for {age:.0f}s by session {owner}; probable leak")
+
+    @staticmethod
+    def _close(conn):
+        import psycopg2
+
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    @staticmethod
+    def _is_healthy(conn, last_used):
+        import psycopg2
+
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < POOL_HEALTH_CHECK_AFTER:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+@st.cache_resource
+def get_pool():
+    """Returns the process-wide connection pool."""
+    logger.info("Creating database connection pool")
+    pool = ConnectionPool(POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, cursor_factory=traced_cursor_class(), **DB_CONNECTION)
+    atexit.register(pool.closeall)
+    metrics.REGISTRY.add_collector(lambda: _pool_metrics(pool))
+    return pool
+
+
+def _pool_metrics(pool):
+    """Pool saturation for the metrics endpoint: connections by state, and the pool limit."""
+    stats = pool.stats()
+    return [
+        ("app_db_pool_connections", "gauge", "Database pool connections by state",
+         [({"state": state}, stats[state]) for state in ("in_use", "idle", "leaked")]),
+        ("app_db_pool_max_connections", "gauge", "Database pool size limit", [({}, POOL_MAX_CONNECTIONS)]),
+    ]
+
+
+class _SessionSentinel:
+    """Stored in session state; its finalizer runs when the session is discarded."""
+
+
+def _track_session(pool):
+    """Ties pool checkouts to the current session so they are released when it ends."""
+    session_id = _current_session_id()
+    if session_id.startswith(_THREAD_OWNER_PREFIX):
+        # No session whose end could release it
+        return session_id
+    try:
+        if _SESSION_SENTINEL_KEY not in st.session_state:
+            sentinel = _SessionSentinel()
+            weakref.finalize(sentinel, pool.release_session, session_id)
+            st.session_state[_SESSION_SENTINEL_KEY] = sentinel
+    except Exception:
+        # Session state is unavailable from worker threads
+        pass
+    return session_id
+
+
+def pool_stats():
+    """Returns open/in-use/idle/leaked connection counts for the shared pool."""
+    return get_pool().stats()
+
+
+def render_stats():
+    stats = pool_stats()
+    st.sidebar.caption(
+        f"DB pool: {stats['in_use']} in use, {stats['idle']} idle (max {POOL_MAX_CONNECTIONS}), "
+        f"{stats['leaked']} held over {POOL_LEAK_WARNING_AFTER}s"
+    )
+
+
+@contextmanager
+def get_connection(pool=None):
+    """Borrow a pooled connection (from the shared pool unless ``pool`` is given);
+    commits on success and rolls back on error."""
+    pool = pool or get_pool()
+    with tracing.span("db.checkout"):
+        conn = pool.getconn(owner=_track_session(pool))
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception as e:
+        import psycopg2
+
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+def fetch_all(query, params=None):
+    """Run a query and return all rows."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+
+def fetch_one(query, params=None):
+    """Run a query and return the first row (or ``None``)."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+
+
+def execute(query, params=None):
+    """Run a write statement in its own transaction and return the affected row count."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.rowcount
+
+
+def read_dataframe(query, params=None):
+    """Run a query and return the result as a DataFrame."""
+    # pandas is only needed here; importing it lazily keeps it off the page start-up path
+    import pandas as pd
+
+    with get_connection() as conn:
+        return pd.read_sql(query, conn, params=params)
@@ -0,0 +1,123 @@
+"""Fragment-scoped reruns for the review pages, with per-interaction timings.
+
+The review pages are split into ``st.fragment`` panels (image, ratings,
+prompts, approve/reject bar). A widget inside a panel reruns only that panel;
+navigation and the image-number input still rerun the whole page.
+
+Every full page run and every panel-only rerun is timed. The sidebar shows
+the median and p95 of both per page, which is the before/after comparison: a
+full rerun is what each interaction used to cost, and a panel rerun is what it
+costs now.
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from functools import wraps
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per (page, panel); enough for stable percentiles
+MAX_SAMPLES = 500
+FULL_RERUN = "full rerun"
+
+
+class InteractionTimings:
+    """``(page, panel) -> recent durations`` in seconds."""
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+
+    def record(self, page, panel, seconds):
+        with self._lock:
+            self._samples[(page, panel)].append(seconds)
+
+    def summary(self, page):
+        """Returns ``[(panel, runs, p50 ms, p95 ms), ...]`` with the full rerun first."""
+        with self._lock:
+            samples = {panel: sorted(values) for (name, panel), values in self._samples.items() if name == page}
+        rows = []
+        for panel in sorted(samples, key=lambda panel: (panel != FULL_RERUN, panel)):
+            values = samples[panel]
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            rows.append((panel, len(values), statistics.median(values) * 1000, p95 * 1000))
+        return rows
+
+
+@st.cache_resource
+def get_interaction_timings():
+    """Returns the process-wide timings shared by every session."""
+    return InteractionTimings()
+
+
+def begin_page(page):
+    """Call first thing on a page; marks the start of a full run and of its trace."""
+    # Replaces whatever a run interrupted before end_page (st.rerun, st.stop, an exception) left behind
+    st.session_state["_page_run"] = (page, time.perf_counter())
+    st.session_state["_page_name"] = page
+    tracing.start_trace(page)
+
+
+def end_page():
+    """Call last thing on a page; records how long the full run took and finishes its trace."""
+    page, started = st.session_state.pop("_page_run", (None, None))
+    if page is None:
+        return
+    tracing.finish_trace()
+    elapsed = time.perf_counter() - started
+    get_interaction_timings().record(page, FULL_RERUN, elapsed)
+    metrics.PAGE_RENDER_SECONDS.observe(elapsed, page=page, scope="full")
+    logger.info(f"{page}: full rerun in {elapsed * 1000:.1f} ms")
+
+
+def panel(name):
+    """``st.fragment`` that also times the reruns it scopes to itself.
+
+    Runs that are part of a full page run are already covered by that run's
+    timing, so only panel-only reruns are recorded under ``name``.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            fragment_rerun = _is_fragment_rerun()
+            page = st.session_state.get("_page_name", "unknown")
+            if fragment_rerun:
+                tracing.start_trace(f"{page}: {name}")
+            started = time.perf_counter()
+            try:
+                with tracing.span(f"panel: {name}"):
+                    return func(*args, **kwargs)
+            finally:
+                if fragment_rerun:
+                    tracing.finish_trace()
+                    elapsed = time.perf_counter() - started
+                    get_interaction_timings().record(page, name, elapsed)
+                    metrics.PAGE_RENDER_SECONDS.observe(elapsed, page=page, scope=name)
+                    logger.info(f"{page}: {name} rerun in {elapsed * 1000:.1f} ms")
+        return st.fragment(wrapper)
+    return decorator
+
+
+def _is_fragment_rerun():
+    """True while Streamlit is rerunning only fragments rather than the whole page script.
+
+    Read from the current run's context, so state left in the session by an
+    interrupted run cannot make a panel rerun look like part of a full run.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return bool(ctx is not None and ctx.fragment_ids_this_run)
+
+
+def render_stats(page):
+    rows = get_interaction_timings().summary(page)
+    if not rows:
+        return
+    st.sidebar.caption("Interaction latency: " + ", ".join(
+        f"{panel} p50 {p50:.0f} ms / p95 {p95:.0f} ms ({runs})" for panel, runs, p50, p95 in rows))
@@ -0,0 +1,271 @@
+"""Two-level (memory + disk) LRU cache for image bytes from object storage.
+
+Entries are keyed by blob name and object generation. A cached image is
+served without any network I/O for ``REVALIDATE_AFTER`` seconds; after that
+it is revalidated with a conditional get (``if_generation_not_match``),
+which costs one round trip and returns no body when the object is unchanged.
+Missing blobs are remembered for the same window so probing for a file that
+is not there does not hit the network on every rerun.
+
+Both levels are bounded by a byte budget and evict least-recently-used
+entries first. Disk files live in ``.cache/images`` and survive restarts.
+The lock only guards the in-memory indexes; disk files are read and written
+outside it (written to a temporary file and renamed into place), so a slow
+disk never stalls lookups of other images.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import streamlit as st
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(".cache") / "images"
+MEMORY_BUDGET_BYTES = 128 * 1024 * 1024
+DISK_BUDGET_BYTES = 1024 * 1024 * 1024
+REVALIDATE_AFTER = 300
+
+
+class _Entry:
+    __slots__ = ("generation", "data", "validated_at")
+
+    def __init__(self, generation, data, validated_at):
+        self.generation = generation
+        self.data = data
+        self.validated_at = validated_at
+
+    @property
+    def size(self):
+        return len(self.data) if self.data is not None else 0
+
+
+class ImageCache:
+    """Thread-safe blob-bytes cache with memory and disk LRU tiers."""
+
+    def __init__(self, directory=CACHE_DIR, memory_budget=MEMORY_BUDGET_BYTES,
+                 disk_budget=DISK_BUDGET_BYTES, revalidate_after=REVALIDATE_AFTER):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._memory_budget = memory_budget
+        self._disk_budget = disk_budget
+        self._revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        # blob name -> _Entry, least recently used first
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # sha1(blob name) -> (generation, path, size), least recently used first
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._load_disk_index()
+
+    def get(self, storage, blob_name):
+        """Returns the blob's bytes, or ``None`` when it does not exist."""
+        now = time.monotonic()
+        on_disk = None
+        with self._lock:
+            entry = self._memory.get(blob_name)
+            if entry is not None:
+                self._memory.move_to_end(blob_name)
+                if now - entry.validated_at < self._revalidate_after:
+                    self.hits += 1
+                    return entry.data
+            else:
+                on_disk = self._touch_disk(blob_name)
+        from_disk = False
+        if on_disk is not None:
+            entry = self._read_disk(blob_name, *on_disk)
+            from_disk = entry is not None
+
+        # Only the paths that go to storage need the client's exceptions
+        from google.api_core.exceptions import NotFound, NotModified
+
+        if entry is not None and entry.generation is not None:
+            # Ask for the body only if the object changed since we cached it
+            try:
+                data, generation = storage.get(blob_name, if_generation_not_match=entry.generation)
+            except NotModified:
+                with self._lock:
+                    if from_disk:
+                        self.disk_hits += 1
+                    else:
+                        self.revalidations += 1
+                    entry.validated_at = time.monotonic()
+                    self._remember(blob_name, entry)
+                return entry.data
+            except NotFound:
+                data, generation = None, None
+        else:
+            try:
+                data, generation = storage.get(blob_name)
+            except NotFound:
+                data, generation = None, None
+
+        with self._lock:
+            self.misses += 1
+            self._remember(blob_name, _Entry(generation, data, time.monotonic()))
+            stale = self._drop_disk(blob_name) if data is None else []
+        _unlink(stale)
+        if data is not None:
+            self._write_disk(blob_name, generation, data)
+        return data
+
+    def invalidate(self, blob_name):
+        """Forget a blob, e.g. right after uploading a new version of it."""
+        with self._lock:
+            entry = self._memory.pop(blob_name, None)
+            if entry is not None:
+                self._memory_bytes -= entry.size
+            stale = self._drop_disk(blob_name)
+        _unlink(stale)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.revalidations + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "hit_ratio": (lookups - self.misses) / lookups if lookups else 0.0,
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    @staticmethod
+    def _disk_key(blob_name):
+        return hashlib.sha1(blob_name.encode("utf-8")).hexdigest()
+
+    def _remember(self, blob_name, entry):
+        """Insert into the memory tier (caller holds ``_lock``)."""
+        previous = self._memory.pop(blob_name, None)
+        if previous is not None:
+            self._memory_bytes -= previous.size
+        if entry.size > self._memory_budget:
+            return
+        self._memory[blob_name] = entry
+        self._memory_bytes += entry.size
+        while self._memory_bytes > self._memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+
+    def _load_disk_index(self):
+        files = []
+        for path in self._directory.iterdir():
+            if path.suffix == ".tmp":
+                # Left by a write that was interrupted before its rename
+                path.unlink(missing_ok=True)
+                continue
+            key, _, generation = path.name.partition(".")
+            if not generation.isdigit():
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, key, int(generation), path, stat.st_size))
+        for _, key, generation, path, size in sorted(files):
+            self._disk[key] = (generation, path, size)
+            self._disk_bytes += size
+
+    def _touch_disk(self, blob_name):
+        """Mark a disk entry recently used; ``(generation, path)`` or ``None`` (caller holds ``_lock``)."""
+        key = self._disk_key(blob_name)
+        entry = self._disk.get(key)
+        if entry is None:
+            return None
+        self._disk.move_to_end(key)
+        return entry[0], entry[1]
+
+    def _read_disk(self, blob_name, generation, path):
+        """Load a disk entry for promotion to memory; it still needs revalidating."""
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            # Evicted or replaced since the index was read
+            key = self._disk_key(blob_name)
+            with self._lock:
+                entry = self._disk.get(key)
+                if entry is not None and entry[1] == path:
+                    del self._disk[key]
+                    self._disk_bytes -= entry[2]
+            return None
+        # Validated "long ago" so the caller revalidates before trusting it
+        return _Entry(generation, data, float("-inf"))
+
+    def _write_disk(self, blob_name, generation, data):
+        """Write the file, then index it and evict least-recently-used files over the budget."""
+        if generation is None or len(data) > self._disk_budget:
+            return
+        key = self._disk_key(blob_name)
+        path = self._directory / f"{key}.{generation}"
+        tmp_name = None
+        try:
+            # A name of its own, so concurrent writers of the same blob cannot interleave
+            fd, tmp_name = tempfile.mkstemp(dir=self._directory, prefix=f"{key}.", suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_name, path)
+        except OSError as e:
+            logger.warning(f"image cache could not write {blob_name}: {e}")
+            if tmp_name is not None:
+                Path(tmp_name).unlink(missing_ok=True)
+            return
+        with self._lock:
+            stale = [stale_path for stale_path in self._drop_disk(blob_name) if stale_path != path]
+            self._disk[key] = (generation, path, len(data))
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self._disk_budget:
+                _, (_, evicted_path, evicted_size) = self._disk.popitem(last=False)
+                self._disk_bytes -= evicted_size
+                stale.append(evicted_path)
+        _unlink(stale)
+
+    def _drop_disk(self, blob_name):
+        """Unindex a disk entry; returns the paths for the caller to delete once ``_lock`` is released."""
+        entry = self._disk.pop(self._disk_key(blob_name), None)
+        if entry is None:
+            return []
+        _, path, size = entry
+        self._disk_bytes -= size
+        return [path]
+
+
+def _unlink(paths):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+@st.cache_resource
+def get_image_cache():
+    """Returns the process-wide image cache."""
+    cache = ImageCache()
+
+    def stats():
+        # Anything served without a full download counts as a hit
+        stats = cache.stats()
+        return {"hits": stats["hits"] + stats["disk_hits"] + stats["revalidations"], "misses": stats["misses"]}
+    metrics.register_cache("image", stats)
+    return cache
+
+
+def get_image_bytes(storage, blob_name):
+    return get_image_cache().get(storage, blob_name)
+
+
+def render_stats():
+    stats = get_image_cache().stats()
+    st.sidebar.caption(
+        f"Image cache: {stats['hits']} hits, {stats['disk_hits']} from disk, "
+        f"{stats['revalidations']} revalidated, {stats['misses']} misses ({stats['hit_ratio']:.0%}), "
+        f"{stats['memory_bytes'] / 1e6:.1f} MB in memory, {stats['disk_bytes'] / 1e6:.1f} MB on disk"
+    )
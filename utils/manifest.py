@@ -0,0 +1,293 @@
+"""In-memory index of the images under a bucket prefix, persisted in Postgres.
+
+Each ``imageN.<ext>`` blob directly under a prefix is recorded as serial
+``N`` with its extension, size and generation (see
+``migrations/0004_image_manifest.sql``). Pages load the manifest once per
+process and then answer max-number, existence and extension lookups from
+memory.
+
+The manifest is kept current two ways: uploads made through the app record
+their blob straight away, and a background refresh re-lists the prefix at
+most every ``REFRESH_INTERVAL`` seconds and writes only the rows that
+changed.
+
+The tables come from migration 0004; apply it with
+``python -m utils.migrations upgrade``. Until then the manifest still works,
+but lives in memory only and every new process lists the bucket once.
+
+Usage (from the project root)::
+
+    python -m utils.manifest refresh                       # both review prefixes
+    python -m utils.manifest refresh --prefix "Upload_images/Moodboard Images/"
+"""
+import argparse
+import logging
+import posixpath
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import streamlit as st
+
+from utils import db, resources
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 600
+MANIFEST_PREFIXES = ("Prompts/Final images moodboard/", "Upload_images/Moodboard Images/")
+# Preferred order when the same serial exists with several extensions
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png")
+IMAGE_NAME = re.compile(r"^image(\d+)\.([A-Za-z0-9]+)$")
+
+LOAD_QUERY = """
+SELECT blob_name, serial, extension, size, generation
+FROM image_manifest WHERE prefix = %s;
+"""
+UPSERT_QUERY = """
+INSERT INTO image_manifest (blob_name, prefix, serial, extension, size, generation)
+VALUES %s
+ON CONFLICT (blob_name) DO UPDATE
+SET size = EXCLUDED.size, generation = EXCLUDED.generation;
+"""
+DELETE_QUERY = "DELETE FROM image_manifest WHERE blob_name = ANY(%s);"
+# SQLSTATE for "relation does not exist": migration 0004 has not been applied
+UNDEFINED_TABLE = "42P01"
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    blob_name: str
+    serial: int
+    extension: str
+    size: int
+    generation: int
+
+
+def parse_blob_name(blob_name):
+    """``(serial, extension)`` for an ``imageN.ext`` file name, else ``None``."""
+    match = IMAGE_NAME.match(posixpath.basename(blob_name))
+    if match is None:
+        return None
+    return int(match.group(1)), match.group(2).lower()
+
+
+class ImageManifest:
+    """Serial -> blob lookups for one prefix, backed by the ``image_manifest`` table."""
+
+    def __init__(self, storage, prefix, refresh_interval=REFRESH_INTERVAL):
+        self._storage = storage
+        self._prefix = prefix
+        self._refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        # serial -> {extension: ManifestEntry}
+        self._entries = {}
+        self._by_name = {}
+        # blob name -> monotonic time record() last added it
+        self._recorded_at = {}
+        self._refreshing = False
+        self._persist = True
+        self.refreshed_at = None
+
+    def load(self):
+        """Read the persisted manifest for this prefix.
+
+        Without the manifest tables the manifest is kept in memory only and
+        nothing is loaded.
+        """
+        try:
+            rows = db.fetch_all(LOAD_QUERY, (self._prefix,))
+            state = db.fetch_one("SELECT refreshed_at FROM image_manifest_refresh WHERE prefix = %s;",
+                                 (self._prefix,))
+        except Exception as e:
+            if getattr(e, "pgcode", None) != UNDEFINED_TABLE:
+                raise
+            logger.warning(f"manifest {self._prefix}: image_manifest table missing, keeping it in memory only; "
+                           f"run `python -m utils.migrations upgrade` to persist it")
+            self._persist = False
+            return 0
+        with self._lock:
+            self._entries.clear()
+            self._by_name.clear()
+            for row in rows:
+                self._add(ManifestEntry(*row))
+            self.refreshed_at = state[0] if state else None
+        return len(rows)
+
+    def max_serial(self, extension=None):
+        """Highest serial present (optionally only with ``extension``); 0 when empty."""
+        with self._lock:
+            return max((serial for serial, by_extension in self._entries.items()
+                        if extension is None or extension in by_extension), default=0)
+
+    def lookup(self, serial, extensions=IMAGE_EXTENSIONS):
+        """The entry for ``serial`` with the first available extension, or ``None``."""
+        with self._lock:
+            by_extension = self._entries.get(serial, {})
+            for extension in extensions:
+                if extension in by_extension:
+                    return by_extension[extension]
+        return None
+
+    def exists(self, serial, extensions=IMAGE_EXTENSIONS):
+        return self.lookup(serial, extensions) is not None
+
+    def record(self, stat):
+        """Add or update one object (an ``ObjectStat``) right after the app wrote it."""
+        entry = self._entry_for(stat.name, stat.size, stat.generation)
+        if entry is None:
+            return
+        if self._persist:
+            self._upsert([entry])
+        with self._lock:
+            self._add(entry)
+            self._recorded_at[entry.blob_name] = time.monotonic()
+
+    def refresh(self):
+        """Re-list the prefix and persist only what changed. Returns ``(upserted, removed)``.
+
+        Objects ``record()`` added after the listing started are left alone:
+        the listing may have missed them or seen an older generation.
+        """
+        listing_started = time.monotonic()
+        listing = {}
+        for stat in self._storage.list(self._prefix, delimiter="/"):
+            entry = self._entry_for(stat.name, stat.size, stat.generation)
+            if entry is not None:
+                listing[entry.blob_name] = entry
+
+        with self._lock:
+            recorded = {name for name, at in self._recorded_at.items() if at >= listing_started}
+            changed = [entry for name, entry in listing.items()
+                       if self._by_name.get(name) != entry and name not in recorded]
+            removed = [name for name in self._by_name if name not in listing and name not in recorded]
+
+        if self._persist:
+            with db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    if changed:
+                        self._upsert(changed, cursor)
+                    if removed:
+                        cursor.execute(DELETE_QUERY, (removed,))
+                    cursor.execute("""
+                    INSERT INTO image_manifest_refresh (prefix, refreshed_at) VALUES (%s, now())
+                    ON CONFLICT (prefix) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at
+                    RETURNING refreshed_at;
+                    """, (self._prefix,))
+                    refreshed_at = cursor.fetchone()[0]
+        else:
+            refreshed_at = datetime.now(timezone.utc)
+
+        with self._lock:
+            # record() may have run again while the rows were being written
+            recorded = {name for name, at in self._recorded_at.items() if at >= listing_started}
+            for name in removed:
+                if name not in recorded:
+                    self._remove(name)
+            for entry in changed:
+                if entry.blob_name not in recorded:
+                    self._add(entry)
+            # Older records are settled by this listing
+            self._recorded_at = {name: at for name, at in self._recorded_at.items() if at >= listing_started}
+            self.refreshed_at = refreshed_at
+        logger.info(f"manifest {self._prefix}: {len(listing)} images, {len(changed)} upserted, {len(removed)} removed")
+        return len(changed), len(removed)
+
+    def refresh_if_stale(self):
+        """Start a background refresh when the last one is older than the interval."""
+        with self._lock:
+            age = None
+            if self.refreshed_at is not None:
+                age = (datetime.now(timezone.utc) - self.refreshed_at).total_seconds()
+            if self._refreshing or (age is not None and age < self._refresh_interval):
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="manifest-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"manifest refresh of {self._prefix} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _entry_for(self, blob_name, size, generation):
+        # Only direct children; derivatives live in sub-folders
+        if posixpath.dirname(blob_name) + "/" != self._prefix:
+            return None
+        parsed = parse_blob_name(blob_name)
+        if parsed is None:
+            return None
+        return ManifestEntry(blob_name, parsed[0], parsed[1], int(size or 0), int(generation or 0))
+
+    def _upsert(self, entries, cursor=None):
+        from psycopg2.extras import execute_values
+
+        rows = [(e.blob_name, self._prefix, e.serial, e.extension, e.size, e.generation) for e in entries]
+        if cursor is not None:
+            execute_values(cursor, UPSERT_QUERY, rows)
+            return
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                execute_values(cursor, UPSERT_QUERY, rows)
+
+    def _add(self, entry):
+        """Caller holds ``_lock``."""
+        self._remove(entry.blob_name)
+        self._entries.setdefault(entry.serial, {})[entry.extension] = entry
+        self._by_name[entry.blob_name] = entry
+
+    def _remove(self, blob_name):
+        """Caller holds ``_lock``."""
+        entry = self._by_name.pop(blob_name, None)
+        if entry is None:
+            return
+        by_extension = self._entries.get(entry.serial, {})
+        by_extension.pop(entry.extension, None)
+        if not by_extension:
+            self._entries.pop(entry.serial, None)
+
+
+@st.cache_resource
+def get_manifest(prefix):
+    """Returns the loaded manifest for ``prefix``; the first run ever lists the bucket synchronously."""
+    started = time.perf_counter()
+    manifest = ImageManifest(resources.get_storage(), prefix)
+    manifest.load()
+    if manifest.refreshed_at is None:
+        manifest.refresh()
+    logger.info(f"manifest {prefix} ready in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return manifest
+
+
+def record_upload(stat):
+    """Record a freshly written object (``Storage.put``'s result) in the manifest of its folder."""
+    try:
+        get_manifest(posixpath.dirname(stat.name) + "/").record(stat)
+    except Exception as e:
+        # The next background refresh picks it up anyway
+        logger.warning(f"could not record {stat.name} in the manifest: {e}")
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Bucket manifest for the review image prefixes")
+    parser.add_argument("command", choices=["refresh"])
+    parser.add_argument("--prefix", action="append", help="Bucket prefix to refresh (repeatable)")
+    args = parser.parse_args(argv)
+
+    storage = resources.get_storage()
+    for prefix in args.prefix or MANIFEST_PREFIXES:
+        manifest = ImageManifest(storage, prefix)
+        manifest.load()
+        upserted, removed = manifest.refresh()
+        print(f"{prefix}: max serial {manifest.max_serial()}, {upserted} upserted, {removed} removed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters and latency histograms live in one process-wide registry and are
+served on ``http://METRICS_HOST:METRICS_PORT/metrics`` (default
+``127.0.0.1:9464``; ``METRICS_PORT=0`` disables the endpoint). Each replica
+serves its own numbers. Prometheus aggregates them, e.g. p95 page latency::
+
+    histogram_quantile(0.95, sum by (le, page) (rate(app_page_render_seconds_bucket[5m])))
+
+What is recorded, and where:
+
+* ``app_page_render_seconds`` - full page runs and panel reruns (``utils.fragments``)
+* ``app_db_query_seconds`` / ``app_db_query_errors_total`` - every statement, named
+  ``verb:table`` (``utils.db``)
+* ``app_storage_seconds`` / ``app_storage_errors_total`` - every storage call
+  (``utils.tracing.TracedStorage``)
+* ``app_cache_hits_total`` / ``app_cache_misses_total`` and the DB pool gauges -
+  read from the caches and the pool when scraped
+* ``app_login_attempts_total`` - ``check_password`` in ``main.py``
+"""
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))
+# Seconds; spans a cache hit (sub-ms) to a slow cold page (10 s)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_QUERY_TABLE = re.compile(r"\b(?:from|into|update)\s+\"?([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+
+def statement_text(query):
+    """SQL text of a ``str``, ``bytes`` or ``psycopg2.sql`` statement.
+
+    ``bytes`` (what ``execute_values`` sends) are decoded as they are. A
+    ``psycopg2.sql`` composition is rendered without a connection and with its
+    literals and placeholders left as ``%s``, so no values end up in the text.
+    """
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    if isinstance(query, str):
+        return query
+    if hasattr(query, "seq"):
+        return "".join(statement_text(part) for part in query.seq)
+    if hasattr(query, "strings"):
+        return ".".join('"' + name.replace('"', '""') + '"' for name in query.strings)
+    if hasattr(query, "string"):
+        return query.string
+    if hasattr(query, "wrapped"):
+        return "%s"
+    if hasattr(query, "name"):
+        return f"%({query.name})s" if query.name else "%s"
+    return str(query)
+
+
+def query_name(query):
+    """``verb:table`` for a SQL statement, e.g. ``update:prompts``; a bounded label for the query metrics.
+
+    Accepts anything ``statement_text`` does.
+    """
+    query_text = statement_text(query)
+    words = query_text.split(None, 1)
+    if not words:
+        return "empty"
+    match = _QUERY_TABLE.search(query_text)
+    verb = words[0].lower()
+    return f"{verb}:{match.group(1)}" if match else verb
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative buckets plus ``_sum`` and ``_count`` per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        # label key -> [per-bucket counts, sum, count]
+        self._values = {}
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + seconds, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """``collector()`` is called on every scrape and returns
+        ``[(name, type, help, [(labels, value), ...]), ...]`` - for values that
+        already live elsewhere, such as cache and pool statistics."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format."""
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}"
+                         for name, labels, value in metric.samples())
+        families = {}
+        for collector in collectors:
+            try:
+                for name, metric_type, help_text, samples in collector():
+                    families.setdefault(name, (metric_type, help_text, []))[2].extend(samples)
+            except Exception as e:
+                logger.warning(f"metrics collector {collector.__name__} failed: {e}")
+        for name, (metric_type, help_text, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+PAGE_RENDER_SECONDS = REGISTRY.register(Histogram(
+    "app_page_render_seconds", "Time to run a page (scope=full) or rerun one of its panels", ("page", "scope")))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "app_db_query_seconds", "Database statement latency by query name", ("query",)))
+DB_QUERY_ERRORS = REGISTRY.register(Counter(
+    "app_db_query_errors_total", "Database statements that raised", ("query", "error")))
+STORAGE_SECONDS = REGISTRY.register(Histogram(
+    "app_storage_seconds", "Object storage call latency by operation", ("operation",)))
+STORAGE_ERRORS = REGISTRY.register(Counter(
+    "app_storage_errors_total", "Object storage calls that raised", ("operation", "error")))
+LOGIN_ATTEMPTS = REGISTRY.register(Counter(
+    "app_login_attempts_total", "Login form submissions by outcome", ("result",)))
+
+
+def register_cache(cache_name, get_stats):
+    """Export a cache's ``hits`` / ``misses`` from its ``stats()`` at scrape time."""
+    def collect():
+        stats = get_stats()
+        labels = {"cache": cache_name}
+        return [
+            ("app_cache_hits_total", "counter", "Cache hits by cache", [(labels, stats["hits"])]),
+            ("app_cache_misses_total", "counter", "Cache misses by cache", [(labels, stats["misses"])]),
+        ]
+    collect.__name__ = f"cache:{cache_name}"
+    REGISTRY.add_collector(collect)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the app log
+        pass
+
+
+@st.cache_resource
+def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve ``/metrics`` on a daemon thread, once per process. Returns the server, or ``None``."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        # e.g. another replica on this host already has the port; the app runs without the endpoint
+        logger.warning(f"metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
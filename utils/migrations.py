@@ -0,0 +1,174 @@
+"""Versioned schema migrations and a query-plan check.
+
+Migrations are the ``NNNN_name.sql`` files in ``migrations/`` at the project
+root, applied in order and recorded in ``schema_migrations``. Every file is
+written to be idempotent and runs in its own transaction under an advisory
+lock, so several replicas can run ``upgrade`` at start-up safely.
+
+Usage (from the project root)::
+
+    python -m utils.migrations upgrade   # apply pending migrations
+    python -m utils.migrations status    # list applied / pending versions
+    python -m utils.migrations check     # EXPLAIN the hot queries, fail on seq scans
+"""
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+from utils import db
+from utils.manifest import DELETE_QUERY as MANIFEST_DELETE_QUERY
+from utils.manifest import LOAD_QUERY as MANIFEST_LOAD_QUERY
+from utils.manifest import UPSERT_QUERY as MANIFEST_UPSERT_QUERY
+from utils.moderation import BULK_STATUS_QUERY
+from utils.page_loader import PAGE_QUERY
+from utils.prompts import DUPLICATE_PROMPT_QUERY, IMAGE_PROMPTS_QUERY
+from utils.uploads import SERIAL_EXISTS_QUERY
+from utils.write_behind import RATING_UPDATE_QUERY
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+# Arbitrary constant shared by every replica for pg_advisory_xact_lock
+MIGRATION_LOCK_ID = 724_311_009
+# Sequential scans on tables with more (estimated) rows than this fail the check
+LARGE_TABLE_ROWS = 10000
+
+# (images table, prompts table) of each review page
+REVIEW_TABLES = (("images", "prompts"), ("upload_images", "upload_prompts"))
+# (table, column, key column, cache column, sample key) of each write-behind rating
+RATING_COLUMNS = (
+    ("images", "image_feedback", "image", "image", "image1.jpg"),
+    ("prompts", "prompt_feedback", "serial_nos", "sno", 1),
+    ("prompts", "correlation_feedback", "serial_nos", "sno", 1),
+    ("upload_images", "image_feedback", "image", "image", "image1.jpg"),
+    ("upload_prompts", "prompt_feedback", "serial_nos", "sno", 1),
+)
+
+# Queries the pages run on every rerun or every write, with sample parameters for
+# EXPLAIN. These are the modules' own statements, so the check follows any change
+# to them; register new hot queries here the same way.
+HOT_QUERIES = {
+    **{f"page_query:{images}": (PAGE_QUERY.format(images=images, prompts=prompts),
+                                {"image_name": "image1.jpg", "image_number": 1})
+       for images, prompts in REVIEW_TABLES},
+    **{f"bulk_set_status:{images}": (
+        BULK_STATUS_QUERY.format(images=images, prompts=prompts),
+        {"images": ["image1.jpg", "image2.jpg"], "min_feedback": 8, "current_status": None, "status": "APPROVED"})
+       for images, prompts in REVIEW_TABLES},
+    # execute_values fills VALUES %s with the rows; one sample row adapts to the same shape
+    **{f"rating_update:{table}.{column}": (
+        RATING_UPDATE_QUERY.format(table=table, column=column, key_column=key_column, cache_column=cache_column),
+        ((sample_key, 8),))
+       for table, column, key_column, cache_column, sample_key in RATING_COLUMNS},
+    "manifest_load": (MANIFEST_LOAD_QUERY, ("Upload_images/Moodboard Images/",)),
+    "manifest_upsert": (MANIFEST_UPSERT_QUERY,
+                        (("Upload_images/Moodboard Images/image1.jpg", "Upload_images/Moodboard Images/",
+                          1, "jpg", 1024, 1),)),
+    "manifest_delete": (MANIFEST_DELETE_QUERY, (["Upload_images/Moodboard Images/image1.jpg"],)),
+    "check_duplicate_prompt": (DUPLICATE_PROMPT_QUERY, (1, "sample prompt")),
+    "image_prompts:upload_prompts": (IMAGE_PROMPTS_QUERY, (1,)),
+    "check_serial_exists": (SERIAL_EXISTS_QUERY, (1,)),
+}
+
+
+def discover_migrations():
+    """Returns ``[(version, name, path), ...]`` sorted by version."""
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version, _, name = path.stem.partition("_")
+        migrations.append((version, name, path))
+    return migrations
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version text PRIMARY KEY,
+        name text NOT NULL,
+        applied_at timestamptz NOT NULL DEFAULT now()
+    );
+    """)
+
+
+def applied_versions():
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            _ensure_migrations_table(cursor)
+            cursor.execute("SELECT version FROM schema_migrations;")
+            return {row[0] for row in cursor.fetchall()}
+
+
+def upgrade():
+    """Apply every pending migration in order. Returns the versions applied."""
+    applied = []
+    for version, name, path in discover_migrations():
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+                _ensure_migrations_table(cursor)
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s;", (version,))
+                if cursor.fetchone():
+                    continue
+                logger.info(f"Applying migration {version}_{name}")
+                cursor.execute(path.read_text())
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+        applied.append(version)
+    return applied
+
+
+def _seq_scans(plan):
+    """Yield relation names of every Seq Scan node in an EXPLAIN JSON plan."""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from _seq_scans(child)
+
+
+def check_query_plans(queries=None, large_table_rows=LARGE_TABLE_ROWS):
+    """EXPLAIN each hot query; returns ``[(query name, table, estimated rows), ...]`` for offending seq scans."""
+    queries = HOT_QUERIES if queries is None else queries
+    problems = []
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            for name, (query, params) in queries.items():
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                for table in set(_seq_scans(plan[0]["Plan"])):
+                    cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass;", (table,))
+                    rows = cursor.fetchone()[0]
+                    if rows > large_table_rows:
+                        problems.append((name, table, rows))
+        # EXPLAIN of an UPDATE does not execute it, but never commit from here
+        conn.rollback()
+    return problems
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Schema migrations for the GenAI review app")
+    parser.add_argument("command", choices=["upgrade", "status", "check"])
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        applied = upgrade()
+        print(f"Applied {len(applied)} migration(s): {', '.join(applied) or 'none'}")
+    elif args.command == "status":
+        done = applied_versions()
+        for version, name, _ in discover_migrations():
+            print(f"{version}  {'applied' if version in done else 'pending'}  {name}")
+    else:
+        problems = check_query_plans()
+        for name, table, rows in problems:
+            print(f"FAIL {name}: sequential scan on {table} (~{rows:,} rows)")
+        if problems:
+            return 1
+        print(f"OK: none of the {len(HOT_QUERIES)} hot queries seq-scan a table over {LARGE_TABLE_ROWS:,} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
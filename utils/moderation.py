@@ -0,0 +1,140 @@
+"""Bulk approve/reject for the review pages.
+
+A range of serials plus optional filters (minimum image feedback, current
+status) is resolved and updated in a single statement: one data-modifying
+CTE sets the status on the matching image rows and on every prompt of those
+images, so the whole batch commits or rolls back together.
+"""
+import time
+
+import streamlit as st
+
+from utils import db, query_cache, write_behind
+
+STATUSES = ("PENDING", "APPROVED", "REJECTED")
+
+BULK_STATUS_QUERY = """
+WITH targets AS (
+    SELECT image, substring(image FROM '^image([0-9]+)\\.')::int AS sno
+    FROM {images}
+    WHERE image = ANY(%(images)s)
+      AND (%(min_feedback)s IS NULL OR COALESCE(image_feedback, 10) >= %(min_feedback)s)
+      AND (%(current_status)s IS NULL OR COALESCE(status, 'PENDING') = %(current_status)s)
+),
+updated_images AS (
+    UPDATE {images} AS i
+    SET status = %(status)s
+    FROM targets AS t
+    WHERE i.image = t.image
+    RETURNING i.image
+),
+updated_prompts AS (
+    UPDATE {prompts} AS p
+    SET status = %(status)s
+    FROM targets AS t
+    WHERE p.sno = t.sno
+    RETURNING p.sno
+)
+SELECT
+    (SELECT COALESCE(array_agg(image), '{{}}') FROM updated_images),
+    (SELECT COALESCE(array_agg(DISTINCT sno), '{{}}') FROM updated_prompts),
+    (SELECT count(*) FROM updated_prompts);
+"""
+
+
+def bulk_set_status(status, first, last, images_table, prompts_table,
+                    min_feedback=None, current_status=None, dry_run=False):
+    """Set ``status`` on images ``first..last`` (and their prompts) that pass the filters.
+
+    With ``dry_run`` the statement runs and is rolled back, so the counts are
+    exact without changing anything. Returns a dict with ``images``,
+    ``prompts`` and ``seconds``.
+    """
+    if status not in STATUSES:
+        raise ValueError(f"Unknown status: {status}")
+    from psycopg2 import sql
+
+    # Ratings still in the write-behind buffer must be visible to the filter
+    write_behind.get_rating_buffer().flush()
+
+    params = {
+        # Image names rather than a parsed number keep the lookup on the image index
+        "images": [f"image{number}.jpg" for number in range(first, last + 1)],
+        "min_feedback": min_feedback,
+        "current_status": current_status,
+        "status": status,
+    }
+    query = sql.SQL(BULK_STATUS_QUERY).format(images=sql.Identifier(images_table),
+                                              prompts=sql.Identifier(prompts_table))
+    start = time.perf_counter()
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            images, prompt_snos, prompt_count = cursor.fetchone()
+        if dry_run:
+            conn.rollback()
+    seconds = time.perf_counter() - start
+
+    if not dry_run:
+        for image in images:
+            query_cache.invalidate(images_table, image)
+        for sno in prompt_snos:
+            query_cache.invalidate(prompts_table, sno)
+    return {"images": len(images), "prompts": prompt_count, "seconds": seconds}
+
+
+def set_image_status(status, image_number, image_name, images_table, prompts_table):
+    """Set ``status`` on one image and all of its prompts in one transaction.
+
+    Drops the cached lookups of both rows, so the page's next read of this
+    image (``page_loader.fetch_review_data``) sees the new status.
+    """
+    if status not in STATUSES:
+        raise ValueError(f"Unknown status: {status}")
+    from psycopg2 import sql
+
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("UPDATE {} SET status = %s WHERE image = %s;").format(
+                sql.Identifier(images_table)), (status, image_name))
+            cursor.execute(sql.SQL("UPDATE {} SET status = %s WHERE sno = %s;").format(
+                sql.Identifier(prompts_table)), (status, image_number))
+    query_cache.invalidate(images_table, image_name)
+    query_cache.invalidate(prompts_table, image_number)
+
+
+def render_bulk_moderation(images_table, prompts_table, max_image_number):
+    """Expander with the bulk approve/reject form."""
+    with st.expander("Bulk moderation"):
+        with st.form(key=f"bulk_moderation_{images_table}"):
+            col1, col2 = st.columns(2)
+            with col1:
+                first = st.number_input("From image", min_value=1, max_value=max(max_image_number, 1), value=1)
+            with col2:
+                last = st.number_input("To image", min_value=1, max_value=max(max_image_number, 1),
+                                       value=max(max_image_number, 1))
+            min_feedback = st.slider("Minimum image feedback (0 = any)", 0, 10, value=0)
+            current_status = st.selectbox("Only images currently", ("Any",) + STATUSES)
+            action = st.radio("Set status to", ("APPROVED", "REJECTED"), horizontal=True)
+            dry_run = st.checkbox("Preview only (roll back)", value=True)
+            submitted = st.form_submit_button("Apply")
+
+        if submitted:
+            if first > last:
+                st.error("'From image' must not be greater than 'To image'.")
+                return
+            try:
+                result = bulk_set_status(
+                    action, int(first), int(last), images_table, prompts_table,
+                    min_feedback=min_feedback or None,
+                    current_status=None if current_status == "Any" else current_status,
+                    dry_run=dry_run,
+                )
+            except Exception as e:
+                st.error(f"Bulk update failed: {e}")
+                return
+            verb = "Would set" if dry_run else "Set"
+            st.success(
+                f"{verb} {action} on {result['images']} image(s) and {result['prompts']} prompt(s) "
+                f"in {result['seconds'] * 1000:.0f} ms."
+            )
@@ -0,0 +1,137 @@
+"""Everything needed to render one image on a review page, in one round trip.
+
+The image row, its prompts and the prompt feedback lookup are fetched with a
+single SQL statement (JSON aggregates), while the image bytes are read through
+the local image cache (``utils.image_cache``) concurrently on a shared thread
+pool. The downscaled thumbnail is used unless the full-resolution original is
+asked for. When the image can be served from a signed URL (``utils.signed_urls``)
+its bytes are not downloaded at all.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import streamlit as st
+
+from utils import db, image_cache, query_cache, tracing
+from utils.signed_urls import review_image_url
+from utils.thumbnails import thumbnail_path
+
+PAGE_LOADER_WORKERS = 8
+
+PAGE_QUERY = """
+SELECT
+    (SELECT json_build_object(
+                'image_feedback', COALESCE(image_feedback, 10),
+                'status', COALESCE(status, 'PENDING'))
+     FROM {images} WHERE image = %(image_name)s LIMIT 1) AS image_row,
+    (SELECT json_build_object(
+                'prompt_feedback', COALESCE(prompt_feedback, 10),
+                'status', COALESCE(status, 'PENDING'))
+     FROM {prompts} WHERE image_prompts = %(image_name)s LIMIT 1) AS prompt_feedback_row,
+    COALESCE(
+        (SELECT json_agg(json_build_object(
+                    'serial_nos', serial_nos,
+                    'sno', sno,
+                    'image_prompts', image_prompts,
+                    'prompt_feedback', COALESCE(prompt_feedback, 10),
+                    'status', COALESCE(status, 'PENDING')) ORDER BY serial_nos)
+         FROM {prompts} WHERE sno = %(image_number)s),
+        '[]'::json) AS prompts;
+"""
+
+
+@dataclass(frozen=True)
+class PromptRow:
+    serial_nos: int
+    sno: int
+    image_prompts: str
+    prompt_feedback: int
+    status: str
+
+
+@dataclass(frozen=True)
+class ReviewData:
+    """The database half of a page: image row, prompt feedback and prompts."""
+    image_feedback: int = 10
+    image_status: str = "PENDING"
+    prompt_feedback: int = 10
+    prompt_status: str = "PENDING"
+    prompts: tuple = ()
+
+
+@dataclass(frozen=True)
+class ReviewPage:
+    image_number: int
+    image_name: str
+    image_path: str
+    data: ReviewData = field(default_factory=ReviewData)
+    image_bytes: bytes = None
+    image_error: str = None
+    # True when the image is the downscaled derivative rather than the original
+    is_thumbnail: bool = False
+    # Signed URL the browser loads the image from; image_bytes is only filled without one
+    image_url: str = None
+
+
+@st.cache_resource
+def get_executor():
+    """Returns the shared thread pool used for concurrent page loads."""
+    return ThreadPoolExecutor(max_workers=PAGE_LOADER_WORKERS, thread_name_prefix="page-loader")
+
+
+def fetch_review_data(image_number, image_name, images_table, prompts_table):
+    """Run the single page query; cached until a write to the image or its prompts."""
+    def load():
+        from psycopg2 import sql
+
+        query = sql.SQL(PAGE_QUERY).format(images=sql.Identifier(images_table),
+                                           prompts=sql.Identifier(prompts_table))
+        image_row, prompt_feedback_row, prompts = db.fetch_one(
+            query, {"image_name": image_name, "image_number": image_number})
+        image_row = image_row or {}
+        prompt_feedback_row = prompt_feedback_row or {}
+        return ReviewData(
+            image_feedback=image_row.get("image_feedback", 10),
+            image_status=image_row.get("status", "PENDING"),
+            prompt_feedback=prompt_feedback_row.get("prompt_feedback", 10),
+            prompt_status=prompt_feedback_row.get("status", "PENDING"),
+            prompts=tuple(PromptRow(**row) for row in prompts),
+        )
+    return query_cache.read_through(prompts_table, image_number, "review_data", load,
+                                    depends_on=[(images_table, image_name)])
+
+
+def fetch_image_bytes(storage, image_path):
+    """Image bytes through the local image cache; ``None`` when it does not exist."""
+    return image_cache.get_image_bytes(storage, image_path)
+
+
+def fetch_display_bytes(storage, image_path, full_resolution=False):
+    """Returns ``(bytes, is_thumbnail)``, preferring the thumbnail unless ``full_resolution``."""
+    if not full_resolution:
+        image_bytes = fetch_image_bytes(storage, thumbnail_path(image_path))
+        if image_bytes is not None:
+            return image_bytes, True
+    # No derivative yet (or the original was asked for)
+    return fetch_image_bytes(storage, image_path), False
+
+
+def load_review_page(storage, image_number, image_prefix, images_table, prompts_table, full_resolution=False):
+    """Load the review data and a signed image URL, or the image bytes concurrently when no URL is available."""
+    image_name = f"image{image_number}.jpg"
+    image_path = f"{image_prefix}{image_name}"
+    image_url, is_thumbnail = review_image_url(image_prefix, image_number, full_resolution)
+    image_future = None
+    if image_url is None:
+        # Propagated so the download's spans land in this rerun's trace
+        image_future = get_executor().submit(tracing.propagate(fetch_display_bytes), storage, image_path, full_resolution)
+
+    data = fetch_review_data(image_number, image_name, images_table, prompts_table)
+
+    image_bytes, image_error = None, None
+    if image_future is not None:
+        try:
+            image_bytes, is_thumbnail = image_future.result()
+        except Exception as e:
+            image_error = str(e)
+    return ReviewPage(image_number, image_name, image_path, data, image_bytes, image_error, is_thumbnail, image_url)
@@ -0,0 +1,72 @@
+"""Background prefetch of the images next to the one being reviewed.
+
+After a review page renders, the image bytes and review data for the next
+and previous ``PREFETCH_RADIUS`` images are loaded on a dedicated thread
+pool, so "Next" / "Back" find both already in the image and query caches.
+Work for images that are no longer near the current one - e.g. after a jump
+through the image number box - is cancelled if it has not started yet.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from utils.page_loader import fetch_display_bytes, fetch_review_data
+from utils.signed_urls import review_image_url
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_RADIUS = 2
+PREFETCH_WORKERS = 4
+
+
+@st.cache_resource
+def get_prefetch_executor():
+    """Returns the prefetch thread pool, kept apart from the foreground page loader."""
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+def _warm(storage, image_number, image_prefix, images_table, prompts_table):
+    image_name = f"image{image_number}.jpg"
+    try:
+        # With a signed URL the browser fetches the image itself; only warm the bytes without one
+        image_url, _ = review_image_url(image_prefix, image_number)
+        if image_url is None:
+            fetch_display_bytes(storage, f"{image_prefix}{image_name}")
+        fetch_review_data(image_number, image_name, images_table, prompts_table)
+    except Exception as e:
+        # Only a missed warm-up; the page will load it normally
+        logger.warning(f"prefetch of image {image_number} failed: {e}")
+
+
+def _neighbours(center, radius, max_number):
+    """``center+1, center-1, center+2, ...`` within ``1..max_number``, nearest first."""
+    numbers = []
+    for distance in range(1, radius + 1):
+        for number in (center + distance, center - distance):
+            if 1 <= number <= max_number:
+                numbers.append(number)
+    return numbers
+
+
+def prefetch_neighbours(storage, center, image_prefix, images_table, prompts_table, max_number,
+                        radius=PREFETCH_RADIUS):
+    """Queue warm-ups around ``center`` and cancel queued ones that fell out of range."""
+    # Per session and per page, so one reviewer's jumps never cancel another's prefetch
+    state_key = f"_prefetch_{prompts_table}"
+    pending = st.session_state.setdefault(state_key, {})
+    wanted = _neighbours(center, radius, max_number)
+
+    cancelled = 0
+    for number, future in list(pending.items()):
+        if future.done() or number not in wanted:
+            if future.cancel():
+                cancelled += 1
+            del pending[number]
+    if cancelled:
+        logger.info(f"prefetch cancelled {cancelled} stale image(s) around {center}")
+
+    executor = get_prefetch_executor()
+    for number in wanted:
+        if number not in pending:
+            pending[number] = executor.submit(_warm, storage, number, image_prefix, images_table, prompts_table)
@@ -0,0 +1,174 @@
+"""Bulk write paths for the ``upload_prompts`` table.
+
+Duplicates are detected through ``upload_prompts.prompt_fingerprint`` (see
+``migrations/0002_prompt_fingerprint.sql``): a unique ``(sno, fingerprint)``
+index lets the database skip them with ``ON CONFLICT DO NOTHING``.
+"""
+import csv
+import io
+import json
+import time
+
+from utils import db
+
+# Index probe on the normalised fingerprint, so case/whitespace variants count as duplicates
+DUPLICATE_PROMPT_QUERY = (
+    "SELECT 1 FROM upload_prompts WHERE sno = %s AND prompt_fingerprint = prompt_fingerprint(%s) LIMIT 1;")
+IMAGE_PROMPTS_QUERY = "SELECT image_prompts FROM upload_prompts WHERE sno = %s;"
+
+
+def _clean_prompts(prompts):
+    """Strip blank lines and exact repeats, keeping the first occurrence's order.
+
+    Case and whitespace variants are left to the database: the SQL
+    ``prompt_fingerprint()`` is the only definition of "the same prompt", so a
+    second copy of its rules here could only disagree with it (Postgres and
+    Python differ on what counts as whitespace and how to lower-case).
+    """
+    return list(dict.fromkeys(prompt.strip() for prompt in prompts if prompt.strip()))
+
+
+def insert_prompts_bulk(sno, prompts, prompt_feedback=0, prompt_status="Pending"):
+    """Insert many prompts for one Serial No. in a single statement and transaction.
+
+    Prompts that already exist for ``sno`` (ignoring case and whitespace),
+    including earlier prompts in the same batch, are skipped by the unique
+    fingerprint index rather than checked one by one. Returns ``(inserted,
+    skipped)`` lists of prompt text, in input order.
+    """
+    cleaned = _clean_prompts(prompts)
+    if not cleaned:
+        return [], []
+    from psycopg2.extras import execute_values
+
+    rows = [(sno, prompt_feedback, prompt, prompt_status) for prompt in cleaned]
+    query = """
+    INSERT INTO upload_prompts (sno, prompt_feedback, image_prompts, status)
+    VALUES %s
+    ON CONFLICT (sno, prompt_fingerprint) DO NOTHING
+    RETURNING image_prompts;
+    """
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            returned = execute_values(cursor, query, rows, page_size=len(rows), fetch=True)
+
+    inserted_set = {row[0] for row in returned}
+    inserted = [prompt for prompt in cleaned if prompt in inserted_set]
+    skipped = [prompt for prompt in cleaned if prompt not in inserted_set]
+    return inserted, skipped
+
+
+# Column names accepted by the CSV/JSONL importer
+SERIAL_COLUMNS = ("serial_no", "sno")
+PROMPT_COLUMNS = ("image_prompt", "image_prompts")
+IMPORT_BATCH_SIZE = 10000
+
+
+def _pick(record, names):
+    for name in names:
+        if name in record:
+            return record[name]
+    return None
+
+
+def _jsonl_records(text_stream):
+    """One dict per non-blank JSONL line; ``None`` for a line that is not a JSON object."""
+    for line in text_stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield record if isinstance(record, dict) else None
+
+
+def iter_prompt_file(uploaded_file):
+    """Stream ``(sno, prompt)`` pairs from an uploaded CSV or JSONL file.
+
+    Rows with a missing prompt or a non-numeric serial number, and JSONL
+    lines that are malformed or not an object, yield ``None`` so the caller
+    can count them as rejected.
+    """
+    text_stream = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", newline="")
+    if uploaded_file.name.lower().endswith(".jsonl"):
+        records = _jsonl_records(text_stream)
+    else:
+        records = csv.DictReader(text_stream)
+    try:
+        for record in records:
+            if record is None:
+                yield None
+                continue
+            serial_no = str(_pick(record, SERIAL_COLUMNS) or "").strip()
+            prompt = str(_pick(record, PROMPT_COLUMNS) or "").strip()
+            if serial_no.isdigit() and prompt:
+                yield int(serial_no), prompt
+            else:
+                yield None
+    finally:
+        text_stream.detach()
+
+
+def _copy_batch(cursor, batch):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    cursor.copy_expert("COPY upload_prompts_staging (sno, image_prompts) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def import_prompts(rows, on_progress=None, batch_size=IMPORT_BATCH_SIZE):
+    """Load ``(sno, prompt)`` rows into ``upload_prompts`` through a COPY staging table.
+
+    Rows are streamed with ``COPY FROM STDIN`` into a temporary table in
+    batches, then merged in one ``INSERT ... SELECT ... ON CONFLICT DO NOTHING``
+    so duplicates (within the file and against existing rows) are dropped by
+    the fingerprint index. Everything runs in a
+    single transaction. ``on_progress(rows_loaded)`` is called after every
+    batch. Returns a summary dict with counts and rows per second.
+    """
+    started = time.perf_counter()
+    loaded = rejected = 0
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+            CREATE TEMP TABLE upload_prompts_staging (sno integer, image_prompts text)
+            ON COMMIT DROP;
+            """)
+            batch = []
+            for row in rows:
+                if row is None:
+                    rejected += 1
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    _copy_batch(cursor, batch)
+                    loaded += len(batch)
+                    batch = []
+                    if on_progress:
+                        on_progress(loaded)
+            if batch:
+                _copy_batch(cursor, batch)
+                loaded += len(batch)
+                if on_progress:
+                    on_progress(loaded)
+
+            cursor.execute("""
+            INSERT INTO upload_prompts (sno, image_prompts)
+            SELECT staging.sno, staging.image_prompts
+            FROM upload_prompts_staging staging
+            ON CONFLICT (sno, prompt_fingerprint) DO NOTHING;
+            """)
+            inserted = cursor.rowcount
+
+    elapsed = time.perf_counter() - started
+    return {
+        "loaded": loaded,
+        "inserted": inserted,
+        "duplicates": loaded - inserted,
+        "rejected": rejected,
+        "seconds": elapsed,
+        "rows_per_second": loaded / elapsed if elapsed else 0.0,
+    }
+
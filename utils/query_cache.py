@@ -0,0 +1,105 @@
+"""Read-through cache for per-image lookups on the review pages.
+
+Entries are grouped by ``(table, key)`` - e.g. ``("prompts", 42)`` or
+``("images", "image42.jpg")`` - so a write can drop exactly the lookups it
+affects. The cache is shared by every session in the process; entries also
+expire after ``QUERY_CACHE_TTL`` seconds to bound staleness from writes made
+by other replicas.
+"""
+import logging
+import threading
+import time
+
+import streamlit as st
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_TTL = 300
+
+
+class QueryCache:
+    """Thread-safe ``(table, key) -> {name: value}`` cache with hit/miss counters."""
+
+    def __init__(self, ttl=QUERY_CACHE_TTL):
+        self._ttl = ttl
+        self._entries = {}
+        # (table, key) -> other groups that must be dropped along with it
+        self._dependents = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def read_through(self, table, key, name, loader, depends_on=()):
+        """Return the cached value for ``name`` under ``(table, key)``, calling ``loader`` on a miss.
+
+        ``depends_on`` lists further ``(table, key)`` pairs the value was read
+        from; invalidating any of them drops this entry too.
+        """
+        now = time.monotonic()
+        with self._lock:
+            group = self._entries.get((table, key), {})
+            entry = group.get(name)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries.setdefault((table, key), {})[name] = (now + self._ttl, value)
+            for dependency in depends_on:
+                self._dependents.setdefault(dependency, set()).add((table, key))
+        return value
+
+    def invalidate(self, table, key):
+        """Drop every cached lookup for ``(table, key)`` and anything that depends on it."""
+        with self._lock:
+            groups = {(table, key)} | self._dependents.pop((table, key), set())
+            for group in groups:
+                if self._entries.pop(group, None) is not None:
+                    self.invalidations += 1
+        logger.info(f"query cache invalidated => {table}:{key}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": sum(len(group) for group in self._entries.values()),
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@st.cache_resource
+def get_query_cache():
+    """Returns the process-wide query cache."""
+    cache = QueryCache()
+    metrics.register_cache("query", cache.stats)
+    return cache
+
+
+def read_through(table, key, name, loader, depends_on=()):
+    return get_query_cache().read_through(table, key, name, loader, depends_on)
+
+
+def invalidate(table, key):
+    get_query_cache().invalidate(table, key)
+
+
+def invalidate_rows(table, rows):
+    """Invalidate the key in the first column of each row, e.g. from ``UPDATE ... RETURNING sno``."""
+    for key in {row[0] for row in rows}:
+        invalidate(table, key)
+
+
+def render_stats():
+    """Show hit/miss counters in the sidebar so it is visible when reruns stop touching the DB."""
+    stats = get_query_cache().stats()
+    st.sidebar.caption(
+        f"Query cache: {stats['hits']} hits / {stats['misses']} misses "
+        f"({stats['hit_ratio']:.0%}), {stats['invalidations']} invalidations, {stats['entries']} entries"
+    )
@@ -0,0 +1,112 @@
+"""Process-wide clients shared by every page.
+
+The SQLAlchemy engine, the Cloud Storage client, the bucket handle and the
+storage backend are each built once per process with ``st.cache_resource``
+rather than on every rerun. How long each took to initialise is logged,
+available from ``init_timings()`` and shown in the sidebar by ``render_stats()``.
+
+The client libraries are imported inside the factories, so importing this
+module (and every page that does) costs nothing until a client is needed.
+"""
+import json
+import logging
+import os
+import time
+from functools import wraps
+
+import streamlit as st
+
+from utils import tracing
+from utils.storage import GCSStorage, LatencyStorage, LocalStorage
+
+logger = logging.getLogger(__name__)
+
+BUCKET_NAME = 'open-to-public-rw-sairam'
+
+_init_timings = {}
+
+
+def _timed(name):
+    """Record how long a resource factory took the first time it ran."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+            _init_timings[name] = elapsed
+            logger.info(f"Initialised {name} in {elapsed * 1000:.1f} ms")
+            return result
+        return wrapper
+    return decorator
+
+
+def init_timings():
+    """Returns ``{resource name: seconds}`` for every resource built so far."""
+    return dict(_init_timings)
+
+
+def render_stats():
+    timings = init_timings()
+    if not timings:
+        return
+    st.sidebar.caption("Resource start-up: " + ", ".join(
+        f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+
+
+@st.cache_resource
+@_timed("sqlalchemy_engine")
+def get_engine():
+    """Returns the shared SQLAlchemy engine."""
+    from sqlalchemy import create_engine
+
+    connection_string = st.secrets["database"]["connection_string"]
+    return tracing.instrument_engine(create_engine(connection_string, pool_pre_ping=True))
+
+
+@st.cache_resource
+@_timed("gcs_credentials")
+def get_gcs_credentials():
+    """Returns service-account credentials built straight from the secrets dict."""
+    from google.oauth2 import service_account
+
+    info = json.loads(st.secrets["database"]["credentials"])
+    return service_account.Credentials.from_service_account_info(info)
+
+
+@st.cache_resource
+@_timed("gcs_client")
+def get_storage_client():
+    """Returns the shared Cloud Storage client."""
+    from google.cloud import storage
+
+    credentials = get_gcs_credentials()
+    return storage.Client(project=credentials.project_id, credentials=credentials)
+
+
+@st.cache_resource
+@_timed("gcs_bucket")
+def get_bucket(bucket_name=BUCKET_NAME):
+    """Returns a bucket handle; ``client.bucket`` does not fetch metadata, so no round trip."""
+    return get_storage_client().bucket(bucket_name)
+
+
+@st.cache_resource
+@_timed("storage")
+def get_storage():
+    """Returns the storage backend the pages read and write images through.
+
+    Cloud Storage by default. ``STORAGE_BACKEND=local`` uses the directory in
+    ``STORAGE_ROOT`` instead, and ``STORAGE_LATENCY_MS`` adds simulated
+    round-trip latency to either backend.
+    """
+    if os.environ.get("STORAGE_BACKEND", "gcs") == "local":
+        storage = LocalStorage(os.environ.get("STORAGE_ROOT", ".cache/storage"))
+    else:
+        storage = GCSStorage(get_bucket(), get_gcs_credentials())
+    latency_ms = float(os.environ.get("STORAGE_LATENCY_MS", 0))
+    if latency_ms:
+        storage = LatencyStorage(storage, latency=latency_ms / 1000, jitter=latency_ms / 4000)
+    logger.info(f"Storage backend: {storage.__class__.__name__}")
+    # Outermost, so storage spans include any simulated latency
+    return tracing.TracedStorage(storage)
@@ -0,0 +1,94 @@
+"""Short-lived V4 signed URLs for the review images.
+
+The review pages hand the browser a signed URL instead of downloading the
+image into the app and re-sending it through ``st.image``, so image bytes
+flow from Cloud Storage straight to the browser. URLs are signed locally
+with the service-account key (no network call) and reused until
+``REFRESH_MARGIN`` seconds before they expire; a stable URL also lets the
+browser cache the image across reruns.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import streamlit as st
+
+from utils import metrics, resources
+from utils.manifest import get_manifest
+from utils.thumbnails import EXTENSIONS, THUMBNAIL_DIR, THUMBNAIL_FORMAT
+
+logger = logging.getLogger(__name__)
+
+SIGNED_URL_TTL = 15 * 60
+# Stop handing out a URL this long before it expires so a page never renders a dead link
+REFRESH_MARGIN = 2 * 60
+MAX_CACHED_URLS = 10000
+
+
+class SignedUrlCache:
+    """``blob name -> (url, reuse until)`` with hit/miss counters."""
+
+    def __init__(self, storage, ttl=SIGNED_URL_TTL, refresh_margin=REFRESH_MARGIN):
+        self._storage = storage
+        self._ttl = ttl
+        self._refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._urls = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, blob_name):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._urls.get(blob_name)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+        url = self._storage.signed_url(blob_name, timedelta(seconds=self._ttl))
+        with self._lock:
+            if len(self._urls) >= MAX_CACHED_URLS:
+                self._urls = {name: entry for name, entry in self._urls.items() if entry[1] > now}
+            self._urls[blob_name] = (url, now + self._ttl - self._refresh_margin)
+        return url
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._urls),
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+
+@st.cache_resource
+def get_signed_url_cache():
+    """Returns the process-wide signed URL cache."""
+    cache = SignedUrlCache(resources.get_storage())
+    metrics.register_cache("signed_url", cache.stats)
+    return cache
+
+
+def signed_url(blob_name):
+    return get_signed_url_cache().get(blob_name)
+
+
+def review_image_url(image_prefix, image_number, full_resolution=False):
+    """Returns ``(signed url, is_thumbnail)`` for a review image, or ``(None, False)``.
+
+    Existence is answered by the bucket manifests, so this makes no network
+    call. ``None`` (image not in the manifest yet, or a backend that cannot sign)
+    means the caller should fall back to serving the bytes itself.
+    """
+    try:
+        if not full_resolution:
+            thumbnails = get_manifest(f"{image_prefix}{THUMBNAIL_DIR}/")
+            thumbnails.refresh_if_stale()
+            entry = thumbnails.lookup(image_number, (EXTENSIONS[THUMBNAIL_FORMAT],))
+            if entry is not None:
+                return signed_url(entry.blob_name), True
+        entry = get_manifest(image_prefix).lookup(image_number, ("jpg",))
+        if entry is not None:
+            return signed_url(entry.blob_name), False
+    except Exception as e:
+        logger.warning(f"could not sign a URL for image {image_number}: {e}")
+    return None, False
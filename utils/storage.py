@@ -0,0 +1,346 @@
+"""Object storage behind a small interface: exists / get / put / list / stat.
+
+``GCSStorage`` is the production backend. ``LocalStorage`` keeps objects in a
+directory and mimics Cloud Storage generations (every write gets a new,
+strictly increasing generation), and ``LatencyStorage`` wraps any backend to
+add a fixed round-trip delay plus jitter and an optional bandwidth limit.
+Together they let the hot paths be load-tested and benchmarked without the
+real bucket. Errors use the same ``NotFound`` / ``NotModified`` exceptions as
+the Cloud Storage client, so callers handle every backend alike; they are
+imported where they are raised, which keeps this module cheap to import.
+
+The pages get their backend from ``resources.get_storage()``; set
+``STORAGE_BACKEND=local`` (and optionally ``STORAGE_ROOT`` and
+``STORAGE_LATENCY_MS``) to run the app against a local directory.
+
+Usage (from the project root)::
+
+    python -m utils.storage bench --latency-ms 40 --images 200   # offline hot-path benchmark
+"""
+import argparse
+import io
+import mimetypes
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+# Below this a single multipart request is cheapest; above it, upload in resumable chunks
+RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+# Must be a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class ObjectStat:
+    name: str
+    size: int
+    generation: int
+    content_type: str = None
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over any buffer (bytes, bytearray, ``getbuffer()``) without copying it.
+
+    ``readinto`` copies straight into the caller's buffer; ``read(n)`` only
+    materialises the ``n`` bytes asked for, i.e. one chunk at a time.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, target):
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, min(offset, len(self._view)))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+class Storage:
+    """Interface every backend implements."""
+
+    def exists(self, name):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.stat(name)
+            return True
+        except NotFound:
+            return False
+
+    def get(self, name, if_generation_not_match=None):
+        """Returns ``(bytes, generation)``; raises ``NotModified`` when the generation matches."""
+        raise NotImplementedError
+
+    def put(self, name, data, content_type=None, cache_control=None):
+        """Write a bytes-like object and return its ``ObjectStat``."""
+        raise NotImplementedError
+
+    def list(self, prefix, delimiter=None):
+        """Yields an ``ObjectStat`` per object under ``prefix`` (only direct children with ``delimiter="/"``)."""
+        raise NotImplementedError
+
+    def stat(self, name):
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def signed_url(self, name, expiration):
+        """A URL the browser can fetch ``name`` from; ``NotImplementedError`` where there is none."""
+        raise NotImplementedError
+
+
+class GCSStorage(Storage):
+    def __init__(self, bucket, credentials=None):
+        self._bucket = bucket
+        self._credentials = credentials
+
+    def get(self, name, if_generation_not_match=None):
+        blob = self._bucket.blob(name)
+        conditions = {}
+        if if_generation_not_match is not None:
+            conditions["if_generation_not_match"] = if_generation_not_match
+        data = blob.download_as_bytes(**conditions)
+        # The download response headers carry the generation, so no extra metadata request
+        return data, blob.generation
+
+    def put(self, name, data, content_type=None, cache_control=None):
+        with memoryview(data) as view, BufferReader(view) as reader:
+            chunk_size = UPLOAD_CHUNK_SIZE if view.nbytes > RESUMABLE_THRESHOLD else None
+            blob = self._bucket.blob(name, chunk_size=chunk_size)
+            if cache_control:
+                blob.cache_control = cache_control
+            blob.upload_from_file(reader, size=view.nbytes, content_type=content_type, rewind=True)
+        return self._stat(blob)
+
+    def list(self, prefix, delimiter=None):
+        blobs = self._bucket.list_blobs(prefix=prefix, delimiter=delimiter,
+                                        fields="items(name,size,generation,contentType),nextPageToken")
+        for blob in blobs:
+            yield self._stat(blob)
+
+    def stat(self, name):
+        from google.api_core.exceptions import NotFound
+
+        blob = self._bucket.get_blob(name)
+        if blob is None:
+            raise NotFound(f"{name} not found")
+        return self._stat(blob)
+
+    def delete(self, name):
+        self._bucket.blob(name).delete()
+
+    def signed_url(self, name, expiration):
+        return self._bucket.blob(name).generate_signed_url(
+            version="v4", expiration=expiration, method="GET", credentials=self._credentials)
+
+    @staticmethod
+    def _stat(blob):
+        return ObjectStat(blob.name, int(blob.size or 0), int(blob.generation or 0), blob.content_type)
+
+
+class LocalStorage(Storage):
+    """Objects as files under ``root``; the file's mtime in nanoseconds is its generation."""
+
+    def __init__(self, root):
+        self._root = Path(root).resolve()
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._last_generation = 0
+
+    def get(self, name, if_generation_not_match=None):
+        from google.api_core.exceptions import NotFound, NotModified
+
+        path = self._path(name)
+        try:
+            generation = path.stat().st_mtime_ns
+            if if_generation_not_match is not None and generation == if_generation_not_match:
+                raise NotModified(f"{name} unchanged")
+            return path.read_bytes(), generation
+        except FileNotFoundError:
+            raise NotFound(f"{name} not found")
+
+    def put(self, name, data, content_type=None, cache_control=None):
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with memoryview(data) as view:
+            tmp_path.write_bytes(view)
+        with self._lock:
+            # Strictly increasing, like Cloud Storage generations
+            generation = self._last_generation = max(time.time_ns(), self._last_generation + 1)
+        os.utime(tmp_path, ns=(generation, generation))
+        os.replace(tmp_path, path)
+        return self.stat(name)
+
+    def list(self, prefix, delimiter=None):
+        directory = self._root / prefix if prefix.endswith("/") else (self._root / prefix).parent
+        if not directory.is_dir():
+            return
+        paths = directory.iterdir() if delimiter == "/" else directory.rglob("*")
+        for path in sorted(paths):
+            name = path.relative_to(self._root).as_posix()
+            if path.is_file() and not path.name.startswith(".") and name.startswith(prefix):
+                yield self.stat(name)
+
+    def stat(self, name):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            stat = self._path(name).stat()
+        except FileNotFoundError:
+            raise NotFound(f"{name} not found")
+        return ObjectStat(name, stat.st_size, stat.st_mtime_ns, mimetypes.guess_type(name)[0])
+
+    def delete(self, name):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self._path(name).unlink()
+        except FileNotFoundError:
+            raise NotFound(f"{name} not found")
+
+    def _path(self, name):
+        path = (self._root / name).resolve()
+        if self._root not in path.parents:
+            raise ValueError(f"object name escapes the storage root: {name}")
+        return path
+
+
+class LatencyStorage(Storage):
+    """Adds remote-like latency to another backend: round trip + jitter, plus transfer time at ``bandwidth`` bytes/s."""
+
+    def __init__(self, inner, latency=0.04, jitter=0.01, bandwidth=None):
+        self._inner = inner
+        self._latency = latency
+        self._jitter = jitter
+        self._bandwidth = bandwidth
+
+    def _delay(self, size=0):
+        delay = self._latency + random.uniform(0, self._jitter)
+        if self._bandwidth and size:
+            delay += size / self._bandwidth
+        time.sleep(delay)
+
+    def get(self, name, if_generation_not_match=None):
+        from google.api_core.exceptions import NotFound, NotModified
+
+        try:
+            data, generation = self._inner.get(name, if_generation_not_match)
+        except (NotFound, NotModified):
+            self._delay()
+            raise
+        self._delay(len(data))
+        return data, generation
+
+    def put(self, name, data, content_type=None, cache_control=None):
+        stat = self._inner.put(name, data, content_type, cache_control)
+        self._delay(stat.size)
+        return stat
+
+    def list(self, prefix, delimiter=None):
+        # One round trip per 1000-object page, as with the real listing API
+        stats = list(self._inner.list(prefix, delimiter))
+        for _ in range(max(1, -(-len(stats) // 1000))):
+            self._delay()
+        return iter(stats)
+
+    def stat(self, name):
+        self._delay()
+        return self._inner.stat(name)
+
+    def delete(self, name):
+        self._delay()
+        self._inner.delete(name)
+
+    def signed_url(self, name, expiration):
+        # Signing is local; no round trip to add
+        return self._inner.signed_url(name, expiration)
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples) * 1000,
+            samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000)
+
+
+def benchmark(latency_ms=40, images=200, image_kb=300):
+    """Time the image hot paths against a latency-injected local backend.
+
+    Returns ``[(path name, p50 ms, p95 ms), ...]``.
+    """
+    # Imported here so ``utils.storage`` stays free of the modules built on it
+    from utils.image_cache import ImageCache
+
+    with tempfile.TemporaryDirectory() as root:
+        storage = LatencyStorage(LocalStorage(Path(root) / "bucket"), latency=latency_ms / 1000,
+                                 jitter=latency_ms / 4000, bandwidth=50 * 1024 * 1024)
+        prefix = "bench/"
+        names = [f"{prefix}image{number}.jpg" for number in range(1, images + 1)]
+        payload = os.urandom(image_kb * 1024)
+        results = []
+
+        def timed(label, func, items):
+            samples = []
+            for item in items:
+                start = time.perf_counter()
+                func(item)
+                samples.append(time.perf_counter() - start)
+            results.append((label, *_percentiles(samples)))
+
+        timed("put (upload)", lambda name: storage.put(name, payload, "image/jpeg"), names)
+        timed("list prefix", lambda _: list(storage.list(prefix, delimiter="/")), range(5))
+
+        cache = ImageCache(directory=Path(root) / "cache", revalidate_after=3600)
+        timed("image cache: cold get", lambda name: cache.get(storage, name), names)
+        timed("image cache: warm get", lambda name: cache.get(storage, name), names)
+        stale = ImageCache(directory=Path(root) / "cache", revalidate_after=0)
+        timed("image cache: disk + revalidate", lambda name: stale.get(storage, name), names)
+        timed("image cache: missing blob", lambda name: cache.get(storage, name + ".missing"), names[:20])
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storage backends")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    print(f"LocalStorage + {args.latency_ms:g} ms injected latency, {args.images} x {args.image_kb} KB images")
+    for label, p50, p95 in benchmark(args.latency_ms, args.images, args.image_kb):
+        print(f"{label:32} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Server-side paginated table browser.
+
+Only the visible page is fetched. Pages are walked with keyset pagination on
+``(sort column, key column)`` so deep pages cost the same as the first one,
+and column filters and sorting are pushed down into SQL. The total row count
+is an estimate cached for a short time.
+"""
+import streamlit as st
+
+from utils import db
+
+NUMERIC_TYPES = {"smallint", "integer", "bigint", "numeric", "real", "double precision"}
+# Filtered counts stop here and are shown as "N+"
+COUNT_CAP = 10000
+
+
+@st.cache_data(ttl=600)
+def get_columns(table_name):
+    """Returns ``[(column name, data type), ...]`` for a table."""
+    query = """
+    SELECT column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = %s
+    ORDER BY ordinal_position;
+    """
+    return db.fetch_all(query, (table_name,))
+
+
+def _where_clause(filters, column_types):
+    """Build a WHERE fragment and params from ``{column: text}`` filters."""
+    from psycopg2 import sql
+
+    conditions = []
+    params = []
+    for column, value in filters.items():
+        value = value.strip()
+        if not value:
+            continue
+        if column_types[column] in NUMERIC_TYPES:
+            try:
+                params.append(int(value) if value.lstrip("-").isdigit() else float(value))
+            except ValueError:
+                continue
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+        else:
+            conditions.append(sql.SQL("{}::text ILIKE %s").format(sql.Identifier(column)))
+            params.append(f"%{value}%")
+    return conditions, params
+
+
+@st.cache_data(ttl=60)
+def estimate_count(table_name, filters=()):
+    """Approximate row count: planner statistics when unfiltered, a capped count otherwise.
+
+    Returns ``(count, is_capped)``.
+    """
+    from psycopg2 import sql
+
+    filters = dict(filters)
+    column_types = dict(get_columns(table_name))
+    conditions, params = _where_clause(filters, column_types)
+    if not conditions:
+        row = db.fetch_one("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass;", (table_name,))
+        # reltuples is -1 (or 0) until the table has been analyzed
+        if row and row[0] > 0:
+            return row[0], False
+
+    query = sql.SQL("SELECT count(*) FROM (SELECT 1 FROM {} {} LIMIT {}) capped;").format(
+        sql.Identifier(table_name),
+        sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL(""),
+        sql.Literal(COUNT_CAP + 1),
+    )
+    count = db.fetch_one(query, params)[0]
+    return min(count, COUNT_CAP), count > COUNT_CAP
+
+
+def fetch_page(table_name, key_column, sort_column, descending, filters, cursor, page_size):
+    """Fetch one page after ``cursor`` (the ``(sort value, key value)`` of the previous page's last row).
+
+    Returns ``(DataFrame, has_more)``.
+    """
+    from psycopg2 import sql
+
+    column_types = dict(get_columns(table_name))
+    conditions, params = _where_clause(filters, column_types)
+
+    sort_id = sql.Identifier(sort_column)
+    key_id = sql.Identifier(key_column)
+    op = sql.SQL("<" if descending else ">")
+    if cursor is not None and sort_column == key_column:
+        conditions.append(sql.SQL("{} {} %s").format(key_id, op))
+        params.append(cursor[1])
+    elif cursor is not None and cursor[0] is None:
+        # NULLs sort last; once inside them only the key column advances
+        conditions.append(sql.SQL("({} IS NULL AND {} {} %s)").format(sort_id, key_id, op))
+        params.append(cursor[1])
+    elif cursor is not None:
+        conditions.append(sql.SQL("({s} {op} %s OR ({s} = %s AND {k} {op} %s) OR {s} IS NULL)").format(
+            s=sort_id, k=key_id, op=op))
+        params.extend([cursor[0], cursor[0], cursor[1]])
+
+    direction = sql.SQL("DESC" if descending else "ASC")
+    order_by = [sql.SQL("{} {} NULLS LAST").format(sort_id, direction)]
+    if sort_column != key_column:
+        order_by.append(sql.SQL("{} {}").format(key_id, direction))
+
+    query = sql.SQL("SELECT {columns} FROM {table} {where} ORDER BY {order_by} LIMIT {limit};").format(
+        columns=sql.SQL(", ").join(sql.Identifier(name) for name in column_types),
+        table=sql.Identifier(table_name),
+        where=sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL(""),
+        order_by=sql.SQL(", ").join(order_by),
+        limit=sql.Literal(page_size + 1),
+    )
+    rows = db.fetch_all(query, params)
+    has_more = len(rows) > page_size
+    import pandas as pd
+
+    return pd.DataFrame(rows[:page_size], columns=list(column_types)), has_more
+
+
+def paginated_table(table_name, key_column, page_size=50):
+    """Render a filterable, sortable table that only ever loads the visible page."""
+    state_key = f"table_browser_{table_name}"
+    columns = [name for name, _ in get_columns(table_name)]
+    if not columns:
+        st.write("No data available.")
+        return
+
+    controls = st.columns([2, 1, 1])
+    with controls[0]:
+        sort_column = st.selectbox("Sort by", columns, index=columns.index(key_column), key=f"{state_key}_sort")
+    with controls[1]:
+        descending = st.toggle("Descending", key=f"{state_key}_desc")
+    with controls[2]:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=[25, 50, 100, 250].index(page_size),
+                                 key=f"{state_key}_page_size")
+
+    filters = {}
+    with st.expander("Filters"):
+        filter_columns = st.columns(min(len(columns), 4))
+        for idx, column in enumerate(columns):
+            with filter_columns[idx % len(filter_columns)]:
+                filters[column] = st.text_input(column, key=f"{state_key}_filter_{column}")
+    active_filters = tuple(sorted((column, value) for column, value in filters.items() if value.strip()))
+
+    # Start again from the first page whenever the query shape changes
+    signature = (sort_column, descending, page_size, active_filters)
+    if st.session_state.get(f"{state_key}_signature") != signature:
+        st.session_state[f"{state_key}_signature"] = signature
+        st.session_state[f"{state_key}_cursors"] = [None]
+    cursors = st.session_state[f"{state_key}_cursors"]
+
+    try:
+        page_df, has_more = fetch_page(table_name, key_column, sort_column, descending,
+                                       dict(active_filters), cursors[-1], page_size)
+        total, capped = estimate_count(table_name, active_filters)
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        return
+
+    if page_df.empty:
+        st.write("No data available.")
+    else:
+        st.dataframe(page_df, hide_index=True)
+
+    nav = st.columns([1, 2, 1])
+    with nav[0]:
+        if st.button("← Previous", key=f"{state_key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with nav[1]:
+        approx = f"{total:,}+" if capped else f"~{total:,}"
+        st.caption(f"Page {len(cursors)} · {approx} rows")
+    with nav[2]:
+        if st.button("Next →", key=f"{state_key}_next", disabled=not has_more):
+            last = page_df.iloc[-1]
+            cursors.append((_to_python(last[sort_column]), _to_python(last[key_column])))
+            st.rerun()
+
+
+def _to_python(value):
+    """Convert a pandas/numpy scalar back to a plain value psycopg2 can adapt."""
+    import pandas as pd
+
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if hasattr(value, "item") else value
@@ -0,0 +1,156 @@
+"""Downscaled display copies ("thumbnails") of the review images.
+
+The review pages show images about 280 px wide, so they read a small WebP
+derivative instead of the full-resolution original. A derivative lives next
+to its original under a ``thumbnails/`` folder::
+
+    Prompts/Final images moodboard/image12.jpg
+    Prompts/Final images moodboard/thumbnails/image12.webp
+
+Derivatives are written when an image is uploaded; existing images are
+covered by the backfill command (from the project root)::
+
+    python -m utils.thumbnails backfill                    # both review prefixes
+    python -m utils.thumbnails backfill --prefix "Upload_images/Moodboard Images/" --workers 32
+"""
+import argparse
+import logging
+import posixpath
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+from utils import image_cache, resources
+from utils.manifest import IMAGE_EXTENSIONS, parse_blob_name, record_upload
+from utils.storage import BufferReader
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = "thumbnails"
+# Twice the on-page width so the image stays sharp on high-DPI screens
+THUMBNAIL_WIDTH = 560
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_QUALITY = 80
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+BACKFILL_PREFIXES = ("Prompts/Final images moodboard/", "Upload_images/Moodboard Images/")
+BACKFILL_WORKERS = 16
+
+
+def thumbnail_path(blob_name, fmt=THUMBNAIL_FORMAT):
+    """``a/b/image1.jpg`` -> ``a/b/thumbnails/image1.webp``."""
+    directory, filename = posixpath.split(blob_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, THUMBNAIL_DIR, f"{stem}.{EXTENSIONS[fmt]}")
+
+
+def make_thumbnail(data, width=THUMBNAIL_WIDTH, fmt=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY):
+    """Returns ``data`` (any bytes-like image PIL reads) resized to at most ``width`` pixels wide."""
+    # Imported here: the pages import this module for thumbnail_path and rarely encode
+    from PIL import Image, ImageOps
+
+    # BufferReader lets PIL read a memoryview / upload buffer without copying it first
+    with BufferReader(data) as reader, Image.open(reader) as image:
+        # Apply the camera orientation before EXIF is dropped by the re-encode
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = BytesIO()
+        image.save(output, format=fmt, quality=quality)
+        return output.getvalue()
+
+
+def create_thumbnail(storage, blob_name, data):
+    """Write the derivative for an original whose bytes are ``data``.
+
+    Best effort: returns the derivative's blob name, or ``None`` (after
+    logging) if it could not be made; pages fall back to the original.
+    """
+    path = thumbnail_path(blob_name)
+    try:
+        stat = storage.put(path, make_thumbnail(data), content_type=CONTENT_TYPES[THUMBNAIL_FORMAT],
+                           cache_control="public, max-age=86400")
+    except Exception as e:
+        logger.warning(f"could not create thumbnail for {blob_name}: {e}")
+        return None
+    # The pages look derivatives up in the manifest of the thumbnails folder
+    record_upload(stat)
+    image_cache.get_image_cache().invalidate(path)
+    return path
+
+
+def _is_original(blob_name):
+    parsed = parse_blob_name(blob_name)
+    return parsed is not None and parsed[1] in IMAGE_EXTENSIONS
+
+
+def _list_names(storage, prefix):
+    """Object names directly under ``prefix`` (not in sub-folders)."""
+    return {stat.name for stat in storage.list(prefix, delimiter="/") if not stat.name.endswith("/")}
+
+
+def backfill(storage, prefix, workers=BACKFILL_WORKERS, overwrite=False):
+    """Create missing derivatives for every original under ``prefix`` in parallel.
+
+    Only ``imageN.<jpg|jpeg|png>`` objects are originals; anything else in
+    the folder is counted as ``ignored``. Returns a dict with ``originals``,
+    ``created``, ``skipped``, ``failed``, ``ignored`` and ``seconds``.
+    """
+    start = time.perf_counter()
+    names = _list_names(storage, prefix)
+    originals = sorted(name for name in names if _is_original(name))
+    existing = set() if overwrite else _list_names(storage, posixpath.join(prefix, THUMBNAIL_DIR, ""))
+    todo = [name for name in originals if thumbnail_path(name) not in existing]
+
+    def process(blob_name):
+        return create_thumbnail(storage, blob_name, storage.get(blob_name)[0])
+
+    created = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process, name) for name in todo]
+        for future in as_completed(futures):
+            try:
+                ok = future.result() is not None
+            except Exception as e:
+                logger.warning(f"backfill download failed: {e}")
+                ok = False
+            if ok:
+                created += 1
+            else:
+                failed += 1
+    return {
+        "originals": len(originals),
+        "created": created,
+        "skipped": len(originals) - len(todo),
+        "failed": failed,
+        "ignored": len(names) - len(originals),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Thumbnail derivatives for the review images")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--prefix", action="append", help="Bucket prefix to process (repeatable)")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate existing derivatives too")
+    args = parser.parse_args(argv)
+
+    storage = resources.get_storage()
+    failed = 0
+    for prefix in args.prefix or BACKFILL_PREFIXES:
+        result = backfill(storage, prefix, workers=args.workers, overwrite=args.overwrite)
+        failed += result["failed"]
+        print(f"{prefix}: {result['created']} created, {result['skipped']} already present, "
+              f"{result['failed']} failed of {result['originals']} in {result['seconds']:.1f}s "
+              f"({result['ignored']} non-image objects ignored)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Per-rerun tracing: timed spans for database, storage and render phases.
+
+Each full page run (and each fragment-only rerun) is one trace. Code marks
+the work inside it with ``span()``::
+
+    with tracing.span("image.decode", bytes=len(data)):
+        image = Image.open(BytesIO(data))
+
+Database statements are traced by the cursor class the pool hands out
+(``db.traced_cursor_class()``) and by ``instrument_engine`` on the SQLAlchemy engine,
+storage calls by wrapping the backend in ``TracedStorage`` and the page
+panels by ``fragments.panel``, so most spans need no code at the call site.
+Outside a trace ``span()`` does nothing.
+
+A finished trace is written as one JSON log line and kept in the session. Add
+``?trace=1`` to the page URL to show the last few as waterfalls in the sidebar.
+"""
+import contextvars
+import html
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+
+import streamlit as st
+
+from utils import metrics
+from utils.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+TRACE_QUERY_PARAM = "trace"
+# Finished traces kept per session for the debug panel
+MAX_SESSION_TRACES = 5
+MAX_LABEL_LENGTH = 120
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: str
+    start_ms: float
+    duration_ms: float
+    thread: str
+    attrs: dict = field(default_factory=dict)
+    error: str = None
+
+
+class Trace:
+    """Spans of one rerun; spans may be added from worker threads."""
+
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.duration_ms = None
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def offset_ms(self, perf_counter_value):
+        return (perf_counter_value - self._started) * 1000
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.duration_ms = self.offset_ms(time.perf_counter())
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_ms)
+        return {
+            "event": "trace",
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "spans": [{**asdict(span), "start_ms": round(span.start_ms, 3),
+                       "duration_ms": round(span.duration_ms, 3)} for span in spans],
+        }
+
+
+def start_trace(name):
+    """Begin a trace for the current rerun; replaces one left behind by an interrupted run."""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace():
+    """End the current trace, log it as JSON and keep it for the debug panel."""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    _current_span.set(None)
+    trace.finish()
+    payload = trace.to_dict()
+    logger.info(json.dumps(payload, default=str))
+    st.session_state.setdefault("_traces", deque(maxlen=MAX_SESSION_TRACES)).append(payload)
+    return trace
+
+
+def label(text):
+    """A single-line, length-capped version of ``text`` for span attributes (e.g. SQL)."""
+    text = " ".join(str(text).split())
+    return text if len(text) <= MAX_LABEL_LENGTH else text[:MAX_LABEL_LENGTH - 1] + "…"
+
+
+def record(name, started, ended, /, error=None, **attrs):
+    """Add an already-timed span (``perf_counter`` values) to the current trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace.add(Span(name, uuid.uuid4().hex[:8], _current_span.get(), trace.offset_ms(started),
+                   (ended - started) * 1000, threading.current_thread().name, attrs, error))
+
+
+@contextmanager
+def span(name, /, **attrs):
+    """Time the enclosed block as a child of the current span."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = uuid.uuid4().hex[:8]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.add(Span(name, span_id, parent_id, trace.offset_ms(started),
+                       (time.perf_counter() - started) * 1000, threading.current_thread().name, attrs, error))
+
+
+def instrument_engine(engine):
+    """Trace every statement a SQLAlchemy engine runs as a ``db.sqlalchemy`` span
+    and count it in the query metrics."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._trace_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        ended = time.perf_counter()
+        record("db.sqlalchemy", context._trace_started, ended, query=label(statement))
+        metrics.DB_QUERY_SECONDS.observe(ended - context._trace_started, query=metrics.query_name(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        statement = exception_context.statement or ""
+        metrics.DB_QUERY_ERRORS.inc(query=metrics.query_name(statement),
+                                    error=type(exception_context.original_exception).__name__)
+
+    return engine
+
+
+def traced(name):
+    """Decorator form of ``span``."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """Bind ``func`` to the current trace so spans it opens on a worker thread are kept."""
+    context = contextvars.copy_context()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return wrapper
+
+
+class TracedStorage(Storage):
+    """Wraps a storage backend so every call is a ``storage.*`` span and is
+    counted in the storage latency and error metrics."""
+
+    # Expected outcomes (a conditional or speculative read, a backend that cannot sign), not failures
+    EXPECTED_ERRORS = ("NotFound", "NotModified", "NotImplementedError")
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    def _call(self, operation, func, *args, **attrs):
+        started = time.perf_counter()
+        try:
+            with span(f"storage.{operation}", **attrs):
+                return func(*args)
+        except Exception as e:
+            if type(e).__name__ not in self.EXPECTED_ERRORS:
+                metrics.STORAGE_ERRORS.inc(operation=operation, error=type(e).__name__)
+            raise
+        finally:
+            metrics.STORAGE_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    def exists(self, name):
+        return self._call("exists", self._inner.exists, name, name=name)
+
+    def get(self, name, if_generation_not_match=None):
+        return self._call("get", self._inner.get, name, if_generation_not_match,
+                          name=name, conditional=if_generation_not_match is not None)
+
+    def put(self, name, data, content_type=None, cache_control=None):
+        return self._call("put", self._inner.put, name, data, content_type, cache_control, name=name)
+
+    def list(self, prefix, delimiter=None):
+        return iter(self._call("list", lambda: list(self._inner.list(prefix, delimiter)), prefix=prefix))
+
+    def stat(self, name):
+        return self._call("stat", self._inner.stat, name, name=name)
+
+    def delete(self, name):
+        self._call("delete", self._inner.delete, name, name=name)
+
+    def signed_url(self, name, expiration):
+        return self._call("signed_url", self._inner.signed_url, name, expiration, name=name)
+
+
+def enabled():
+    """True when the page was opened with ``?trace=1``."""
+    return st.query_params.get(TRACE_QUERY_PARAM, "0") not in ("", "0", "false")
+
+
+def _depths(spans):
+    parents = {span["span_id"]: span["parent_id"] for span in spans}
+    depths = {}
+    for span_id in parents:
+        depth, parent = 0, parents[span_id]
+        while parent in parents:
+            depth, parent = depth + 1, parents[parent]
+        depths[span_id] = depth
+    return depths
+
+
+def _waterfall_html(trace):
+    total = max(trace["duration_ms"], 0.001)
+    depths = _depths(trace["spans"])
+    rows = []
+    for item in trace["spans"]:
+        left = 100 * item["start_ms"] / total
+        width = max(0.5, 100 * item["duration_ms"] / total)
+        colour = "#d9534f" if item["error"] else "#4CAF50" if item["name"].startswith("db.") else \
+            "#1f77b4" if item["name"].startswith("storage.") else "#999"
+        details = ", ".join(f"{key}={value}" for key, value in item["attrs"].items())
+        tooltip = html.escape(f"{item['name']} {item['duration_ms']:.1f} ms {details} {item['error'] or ''}", quote=True)
+        rows.append(
+            f"<div title=\"{tooltip}\" style='font-size:11px;line-height:14px;margin:1px 0'>"
+            f"<div style='padding-left:{depths[item['span_id']] * 8}px;white-space:nowrap;overflow:hidden'>"
+            f"{html.escape(item['name'])} <span style='color:#888'>{item['duration_ms']:.1f} ms</span></div>"
+            f"<div style='position:relative;height:5px;background:#eee'>"
+            f"<div style='position:absolute;left:{left:.2f}%;width:{width:.2f}%;height:5px;background:{colour}'></div>"
+            f"</div></div>"
+        )
+    return "".join(rows)
+
+
+def render_panel():
+    """Sidebar waterfall of this session's recent reruns; only with ``?trace=1``."""
+    if not enabled():
+        return
+    traces = list(st.session_state.get("_traces", ()))
+    st.sidebar.subheader("Traces")
+    for index, trace in enumerate(reversed(traces)):
+        title = f"{trace['name']} - {trace['duration_ms']:.0f} ms, {len(trace['spans'])} spans"
+        with st.sidebar.expander(title, expanded=index == 0):
+            st.markdown(_waterfall_html(trace), unsafe_allow_html=True)
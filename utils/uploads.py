@@ -0,0 +1,294 @@
+"""Image upload helpers shared by the upload pages.
+
+Serial numbers come from the ``upload_images_sno_seq`` sequence (see
+``migrations/0003_upload_images_sno_sequence.sql``), so concurrent uploads can
+never be handed the same ``sno`` or overwrite each other's blob. The upload
+itself runs between two short transactions - one draws the serial, the other
+inserts the metadata row - so no connection is held while bytes are in flight.
+
+Image bytes are streamed to storage straight from the upload buffer with
+``Storage.put`` (a memoryview reader, resumable chunked uploads for large
+files on Cloud Storage) - there is no staging copy on local disk.
+
+Usage (from the project root)::
+
+    python -m utils.uploads stress --workers 32   # N parallel create_image calls -> N distinct serials and blobs
+                                                  # (scratch schema and storage; also tests/test_uploads.py)
+    python -m utils.uploads bench --size-mb 64    # staged-file vs streaming upload: wall time, peak RSS
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from utils import db, image_cache, resources
+from utils.storage import GCSStorage, LocalStorage
+
+UPLOAD_PREFIX = "Upload_images/Moodboard Images/"
+SERIAL_SEQUENCE = "upload_images_sno_seq"
+BENCH_PREFIX = "benchmarks/uploads/"
+# Longest a single benchmark upload process may run before it is killed
+BENCH_TIMEOUT = 600
+# Concurrent GCS transfers for multi-file uploads
+UPLOAD_WORKERS = 8
+SERIAL_EXISTS_QUERY = "SELECT COUNT(*) FROM upload_images WHERE sno = %s;"
+
+
+@dataclass(frozen=True)
+class UploadResult:
+    index: int
+    sno: int
+    filename: str
+    blob_name: str
+    error: str
+    seconds: float
+
+
+def image_filename(sno):
+    return f"image{sno}.jpg"
+
+
+def gcs_url(blob_name, bucket_name=resources.BUCKET_NAME):
+    return f"https://storage.cloud.google.com/{bucket_name}/{blob_name}"
+
+
+def allocate_serials(cursor, count=1):
+    """Draw ``count`` serial numbers from the sequence using the caller's transaction."""
+    cursor.execute(f"SELECT nextval('{SERIAL_SEQUENCE}') FROM generate_series(1, %s);", (count,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def create_image(upload, status="UPLOADED", pool=None):
+    """Allocate a serial, upload the file, then insert the image row.
+
+    ``upload(filename, blob_name)`` runs with no database connection checked
+    out, so it may use the pool itself (``record_upload`` does) and a slow
+    upload does not hold a connection. If it raises, no row is written and
+    the serial is simply skipped. ``pool`` defaults to the shared pool.
+    Returns ``(sno, upload's return value)``.
+    """
+    with db.get_connection(pool) as conn:
+        with conn.cursor() as cursor:
+            sno = allocate_serials(cursor)[0]
+    filename = image_filename(sno)
+    blob_name = f"{UPLOAD_PREFIX}{filename}"
+    result = upload(filename, blob_name)
+    with db.get_connection(pool) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+            INSERT INTO upload_images (sno, image, image_path, status)
+            VALUES (%s, %s, %s, %s);
+            """, (sno, filename, gcs_url(blob_name), status))
+    # The page may have cached "not found" for this name before it existed
+    image_cache.get_image_cache().invalidate(blob_name)
+    return sno, result
+
+
+def create_images(items, upload, workers=UPLOAD_WORKERS, status="UPLOADED", on_progress=None):
+    """Upload many images in parallel and insert their rows with one statement.
+
+    Serials for all ``items`` are drawn from the sequence in one query, then
+    ``upload(item, filename, blob_name)`` runs on a pool of ``workers``
+    threads. Rows are inserted in a single batched ``INSERT`` for the uploads
+    that succeeded; failed ones just leave a gap in the serials.
+
+    ``on_progress(done, total, result)`` is called from the calling thread as
+    each upload finishes, so it may update Streamlit elements. Returns a
+    list of ``UploadResult`` in input order.
+    """
+    items = list(items)
+    if not items:
+        return []
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            serials = allocate_serials(cursor, len(items))
+
+    def run(index):
+        sno = serials[index]
+        filename = image_filename(sno)
+        blob_name = f"{UPLOAD_PREFIX}{filename}"
+        start = time.perf_counter()
+        try:
+            upload(items[index], filename, blob_name)
+            error = None
+        except Exception as e:
+            error = str(e)
+        return UploadResult(index, sno, filename, blob_name, error, time.perf_counter() - start)
+
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload") as executor:
+        futures = [executor.submit(run, index) for index in range(len(items))]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results[result.index] = result
+            if on_progress is not None:
+                on_progress(done, len(items), result)
+
+    uploaded = [result for result in results if result.error is None]
+    if uploaded:
+        from psycopg2.extras import execute_values
+
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                execute_values(cursor, """
+                INSERT INTO upload_images (sno, image, image_path, status)
+                VALUES %s;
+                """, [(r.sno, r.filename, gcs_url(r.blob_name), status) for r in uploaded], page_size=1000)
+        for result in uploaded:
+            image_cache.get_image_cache().invalidate(result.blob_name)
+    return results
+
+
+@contextmanager
+def scratch_pool(workers):
+    """A pool whose connections see a scratch copy of ``upload_images`` and its sequence.
+
+    The copy lives in a schema of its own that is dropped on exit, whatever
+    happened inside, so nothing touches the real table or sequence.
+    """
+    from psycopg2 import sql
+
+    schema = sql.Identifier(f"upload_stress_{os.getpid()}_{time.time_ns()}")
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("""
+            CREATE SCHEMA {schema};
+            CREATE TABLE {schema}.upload_images (LIKE public.upload_images INCLUDING ALL);
+            CREATE SEQUENCE {schema}.{sequence};
+            """).format(schema=schema, sequence=sql.Identifier(SERIAL_SEQUENCE)))
+    pool = None
+    try:
+        pool = db.ConnectionPool(1, workers, cursor_factory=db.traced_cursor_class(),
+                                 options=f"-c search_path={schema.strings[0]}", **db.DB_CONNECTION)
+        yield pool
+    finally:
+        if pool is not None:
+            pool.closeall()
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("DROP SCHEMA {} CASCADE;").format(schema))
+
+
+def stress_test_allocation(workers=32):
+    """Run ``create_image`` from ``workers`` threads at once against scratch storage and tables.
+
+    All workers are released together by a barrier to maximise contention.
+    Each one uploads a small file to a throwaway ``LocalStorage`` and inserts
+    its row into the ``scratch_pool`` copy of ``upload_images``. Returns
+    ``[(sno, blob name, bytes read back), ...]``, one per worker.
+    """
+    barrier = threading.Barrier(workers, timeout=60)
+
+    with tempfile.TemporaryDirectory(prefix="upload-stress-") as root, scratch_pool(workers) as pool:
+        storage = LocalStorage(root)
+
+        def upload_one(worker):
+            payload = f"worker {worker}".encode()
+
+            def upload(filename, blob_name):
+                storage.put(blob_name, payload, "image/jpeg")
+
+            barrier.wait()
+            sno, _ = create_image(upload, status="STRESS_TEST", pool=pool)
+            blob_name = f"{UPLOAD_PREFIX}{image_filename(sno)}"
+            return sno, blob_name, storage.get(blob_name)[0]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload_one, worker) for worker in range(workers)]
+            return [future.result() for future in futures]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _bench_upload(method, size, blob_name, results):
+    """Runs in a fresh process so ``ru_maxrss`` reflects this one upload path only."""
+    bucket = resources.get_bucket()
+    # Stand-in for the file_uploader buffer, which holds the whole file in memory
+    uploaded = io.BytesIO(os.urandom(size))
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        if method == "staged":
+            # The previous path: copy the buffer to local disk, then upload the file
+            with tempfile.NamedTemporaryFile(suffix=".jpg") as staged:
+                staged.write(uploaded.getbuffer())
+                staged.flush()
+                bucket.blob(blob_name).upload_from_filename(staged.name)
+        else:
+            GCSStorage(bucket).put(blob_name, uploaded.getbuffer())
+        seconds = time.perf_counter() - start
+        results.put((method, seconds, _peak_rss_mb(), _peak_rss_mb() - baseline))
+    finally:
+        from google.api_core.exceptions import NotFound
+
+        # Never leave a benchmark blob behind; a failed upload may not have created one
+        try:
+            bucket.blob(blob_name).delete()
+        except NotFound:
+            pass
+
+
+def benchmark_uploads(size_mb=64, rounds=3, timeout=BENCH_TIMEOUT):
+    """Upload ``size_mb`` of random bytes through each path; returns ``[(method, seconds, peak MB, growth MB), ...]``.
+
+    Raises ``RuntimeError`` if an upload process fails or runs past ``timeout`` seconds.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    measurements = []
+    for round_number in range(rounds):
+        for method in ("staged", "streaming"):
+            blob_name = f"{BENCH_PREFIX}{method}-{os.getpid()}-{round_number}.bin"
+            process = context.Process(target=_bench_upload,
+                                      args=(method, size_mb * 1024 * 1024, blob_name, results))
+            process.start()
+            # The result is one small tuple, so the child can exit before it is read
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+                raise RuntimeError(f"{method} upload did not finish within {timeout}s")
+            if process.exitcode != 0:
+                raise RuntimeError(f"{method} upload process failed with exit code {process.exitcode}")
+            measurements.append(results.get(timeout=timeout))
+    return measurements
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Image upload tools")
+    parser.add_argument("command", choices=["stress", "bench"])
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--size-mb", type=int, default=64, help="bench: upload size")
+    parser.add_argument("--rounds", type=int, default=3, help="bench: repetitions per path")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        for method, seconds, peak, growth in benchmark_uploads(args.size_mb, args.rounds):
+            print(f"{method:9}  {seconds:6.2f}s  {args.size_mb / seconds:7.1f} MB/s  "
+                  f"peak RSS {peak:7.1f} MB (+{growth:.1f} MB during upload)")
+        return 0
+
+    results = stress_test_allocation(args.workers)
+    serials = [sno for sno, _, _ in results]
+    blob_names = {blob_name for _, blob_name, _ in results}
+    # Every worker wrote a different payload, so a shared blob shows up as a repeated body
+    payloads = {data for _, _, data in results}
+    print(f"{args.workers} parallel uploads -> {len(set(serials))} distinct serials "
+          f"({min(serials)}..{max(serials)}), {len(blob_names)} distinct blobs, {len(payloads)} distinct payloads")
+    return 0 if len(set(serials)) == len(blob_names) == len(payloads) == args.workers else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Post-login warm-up and a per-page cold-start benchmark.
+
+The pages import their heavy dependencies (client libraries, PIL, pandas)
+lazily and build shared clients on first use, so the login form and the
+About page start fast. The price is paid by the first review page a
+reviewer opens. ``start()`` moves that work to a background thread right
+after login, while the reviewer is still on the About page: it imports the
+heavy modules and builds the shared resources once per process. Set
+``APP_WARMUP=0`` to turn it off.
+
+The benchmark measures each page's cold start: every page is run in a fresh
+interpreter by Streamlit's script runner (``streamlit.testing``) and its
+first run is timed end to end, imports, shared clients and queries
+included. The rerun after it and the slowest imports (from
+``python -X importtime``) are reported alongside. Run it from the project
+root, with ``STORAGE_BACKEND=local`` to leave the bucket out of it::
+
+    python -m utils.warmup bench
+    python -m utils.warmup bench --runs 5 --output .cache/page_start_times.json
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Heaviest first, so the modules every review page needs are ready soonest
+WARMUP_MODULES = (
+    "google.cloud.storage",
+    "sqlalchemy",
+    "psycopg2.extras",
+    "PIL.Image",
+    "pandas",
+    "utils.page_loader",
+    "utils.prefetch",
+    "utils.moderation",
+)
+REVIEW_PREFIXES = ("Prompts/Final images moodboard/", "Upload_images/Moodboard Images/")
+PAGES_DIR = Path(__file__).resolve().parent.parent / "views"
+
+
+def _warm_resources():
+    """``(name, factory)`` for every shared resource a review page builds on its first run."""
+    from utils import db, resources, write_behind
+    from utils.manifest import get_manifest
+
+    steps = [
+        ("sqlalchemy_engine", resources.get_engine),
+        ("db_pool", db.get_pool),
+        ("storage", resources.get_storage),
+        ("rating_buffer", write_behind.get_rating_buffer),
+    ]
+    steps += [(f"manifest:{prefix}", lambda prefix=prefix: get_manifest(prefix)) for prefix in REVIEW_PREFIXES]
+    return steps
+
+
+class Warmup:
+    """Runs the warm-up once on a daemon thread and keeps the timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+        self.done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+        return self
+
+    def _step(self, name, func):
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            # Only a missed warm-up; the page builds the resource itself
+            logger.warning(f"warm-up of {name} failed: {e}")
+            return
+        with self._lock:
+            self._timings[name] = time.perf_counter() - started
+
+    def _run(self):
+        started = time.perf_counter()
+        for module in WARMUP_MODULES:
+            self._step(f"import {module}", lambda module=module: importlib.import_module(module))
+        for name, factory in _warm_resources():
+            self._step(name, factory)
+        self.done.set()
+        logger.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def timings(self):
+        """Returns ``{step: seconds}`` for every step finished so far."""
+        with self._lock:
+            return dict(self._timings)
+
+
+@st.cache_resource
+def _get_warmup():
+    return Warmup().start()
+
+
+def start():
+    """Start the warm-up unless ``APP_WARMUP=0``; only the first call in a process does any work."""
+    if os.environ.get("APP_WARMUP", "1") == "0":
+        return None
+    return _get_warmup()
+
+
+# Runs one page twice in a fresh interpreter under Streamlit's script runner and prints the
+# timings as JSON; argv: page path, timeout in seconds
+_PAGE_RUN_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[2]))
+started = time.perf_counter()
+app.run()
+first = time.perf_counter()
+app.run()
+second = time.perf_counter()
+print(json.dumps({"first": first - started, "rerun": second - first,
+                  "errors": [str(exception.message) for exception in app.exception]}))
+"""
+
+
+def _run_page(page_path, timeout, importtime=False):
+    """Run a page twice in a fresh interpreter; returns ``(timings, stderr)``.
+
+    ``timings`` has the first (cold) run and the rerun in seconds, and the
+    messages of any exceptions the page raised. Raises ``RuntimeError`` with
+    the interpreter's last error line when the page cannot be run at all.
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + \
+        ["-c", _PAGE_RUN_SCRIPT, str(Path(page_path).resolve()), str(timeout)]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=PAGES_DIR.parent)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "page run failed")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def _baseline_modules():
+    """Modules the interpreter and Streamlit's script runner load before any page runs."""
+    command = [sys.executable, "-X", "importtime", "-c", "from streamlit.testing.v1 import AppTest"]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=PAGES_DIR.parent)
+    return {name for name, _ in _slowest_modules(result.stderr, top=None)}
+
+
+def _slowest_modules(importtime_output, top=5, exclude=()):
+    """``[(module, cumulative ms), ...]`` for the top-level imports in ``-X importtime`` output."""
+    modules = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented; the top-level ones are what the page itself imported
+        name = name[1:]
+        if cumulative.strip().isdigit() and not name.startswith(" ") and name.strip() not in exclude:
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda module: -module[1])[:top]
+
+
+def benchmark(runs=3, pages_dir=PAGES_DIR, timeout=60):
+    """Cold start of every page, as a reviewer sees it.
+
+    Each page is run in a fresh interpreter by Streamlit's script runner, so
+    the first run pays for everything the page does on a new process - its
+    imports, the shared clients it builds, the manifest load and its queries -
+    and the rerun right after it shows the warm cost for comparison.
+
+    Returns ``[(page, first run p50 ms, first run max ms, rerun p50 ms, slowest modules, error), ...]``;
+    a page that cannot be run has ``None`` timings, and ``error`` also carries
+    the first exception a page raised while it ran.
+    """
+    baseline_modules = _baseline_modules()
+    results = []
+    for page in sorted(Path(pages_dir).glob("*.py")):
+        try:
+            samples = [_run_page(page, timeout)[0] for _ in range(runs)]
+            slowest = _slowest_modules(_run_page(page, timeout, importtime=True)[1], exclude=baseline_modules)
+        except RuntimeError as e:
+            results.append((page.stem, None, None, None, [], str(e)))
+            continue
+        first = [sample["first"] for sample in samples]
+        errors = [error for sample in samples for error in sample["errors"]]
+        results.append((page.stem, statistics.median(first) * 1000, max(first) * 1000,
+                        statistics.median(sample["rerun"] for sample in samples) * 1000, slowest,
+                        errors[0] if errors else None))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start time of every page")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds allowed per page run")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.runs, timeout=args.timeout)
+    for page, first, worst, rerun, slowest, error in results:
+        if first is None:
+            print(f"{page:16} failed: {error}")
+            continue
+        modules = ", ".join(f"{name} {ms:.0f} ms" for name, ms in slowest) or "-"
+        print(f"{page:16} first run p50 {first:7.0f} ms   max {worst:7.0f} ms   rerun p50 {rerun:6.0f} ms   "
+              f"slowest imports: {modules}")
+        if error:
+            print(f"{'':16} raised: {error}")
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps({
+            "pages": [{"page": page, "first_run_p50_ms": first, "first_run_max_ms": worst, "rerun_p50_ms": rerun,
+                       "slowest_modules": slowest, "error": error}
+                      for page, first, worst, rerun, slowest, error in results],
+        }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
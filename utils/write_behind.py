@@ -0,0 +1,266 @@
+"""Write-behind buffer for rating updates.
+
+Rating buttons used to run a synchronous ``UPDATE`` + commit before the page
+could render. They now hand the write to this buffer and return at once:
+
+* repeated ratings for the same row are coalesced (last value wins);
+* a background thread flushes pending writes in batches, one
+  ``UPDATE ... FROM (VALUES ...)`` per table/column, every
+  ``FLUSH_INTERVAL`` seconds or as soon as ``FLUSH_THRESHOLD`` rows are
+  pending;
+* every accepted write is first appended to a local journal and fsync'd, and
+  the journal is replayed on start-up, so a crash between accepting and
+  flushing a rating does not lose it;
+* a batch the database rejects is retried row by row, so one bad row cannot
+  hold back its group; a row rejected ``MAX_ATTEMPTS`` times is moved to a
+  dead-letter file and dropped from the journal. Connection errors are not
+  counted against the rows.
+
+After a flush the affected query-cache entries are invalidated.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import streamlit as st
+
+from utils import db, query_cache
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = Path(".cache") / "rating_journal.jsonl"
+DEAD_LETTER_PATH = Path(".cache") / "rating_dead_letter.jsonl"
+MAX_ATTEMPTS = 5
+FLUSH_INTERVAL = 2.0
+FLUSH_THRESHOLD = 50
+# One UPDATE per (table, column) group; execute_values fills in the VALUES list
+RATING_UPDATE_QUERY = """
+UPDATE {table} AS t
+SET {column} = v.value
+FROM (VALUES %s) AS v(key, value)
+WHERE t.{key_column} = v.key
+RETURNING t.{cache_column};
+"""
+
+
+class WriteBehindBuffer:
+    """Coalescing, journaled buffer of single-column ``UPDATE``s."""
+
+    def __init__(self, journal_path=JOURNAL_PATH, flush_interval=FLUSH_INTERVAL, flush_threshold=FLUSH_THRESHOLD,
+                 dead_letter_path=DEAD_LETTER_PATH, max_attempts=MAX_ATTEMPTS):
+        self._journal_path = Path(journal_path)
+        self._dead_letter_path = Path(dead_letter_path)
+        self._max_attempts = max_attempts
+        self._flush_interval = flush_interval
+        self._flush_threshold = flush_threshold
+        # (table, column, key_column, cache_column, key) -> value
+        self._pending = {}
+        # write key -> flushes the database has rejected its current value in
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self.flushed_rows = 0
+        self.coalesced = 0
+        self.dead_lettered = 0
+
+        self._journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self._replay_journal()
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="rating-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, table, column, key_column, key, value, cache_column):
+        """Queue ``UPDATE table SET column = value WHERE key_column = key``.
+
+        ``cache_column`` names the column whose value keys the query cache for
+        ``table`` (e.g. ``sno``); it is read back with ``RETURNING`` on flush.
+        """
+        write_key = (table, column, key_column, cache_column, key)
+        record = json.dumps({"write": list(write_key), "value": value})
+        with self._lock:
+            self._journal.write(record + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            if write_key in self._pending:
+                self.coalesced += 1
+            self._pending[write_key] = value
+            pending = len(self._pending)
+        if pending >= self._flush_threshold:
+            self._wake.set()
+
+    def pending_value(self, table, column, key_column, key, cache_column):
+        """The not-yet-flushed value for a row, or ``None``."""
+        with self._lock:
+            return self._pending.get((table, column, key_column, cache_column, key))
+
+    def flush(self):
+        """Write every pending update to the database.
+
+        Rows that fail stay pending, until they have been rejected ``max_attempts`` times.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(self._pending)
+            if not batch:
+                return 0
+
+            groups = {}
+            for (table, column, key_column, cache_column, key), value in batch.items():
+                groups.setdefault((table, column, key_column, cache_column), []).append((key, value))
+
+            written = {}
+            rejected = {}
+            for group, rows in groups.items():
+                self._flush_group(group, rows, written, rejected)
+
+            dead = []
+            with self._lock:
+                for write_key, value in written.items():
+                    self._attempts.pop(write_key, None)
+                    # Keep anything re-rated while the flush was in flight
+                    if self._pending.get(write_key) == value:
+                        del self._pending[write_key]
+                for write_key, (value, error) in rejected.items():
+                    if self._pending.get(write_key) != value:
+                        continue
+                    attempts = self._attempts.get(write_key, 0) + 1
+                    if attempts < self._max_attempts:
+                        self._attempts[write_key] = attempts
+                        continue
+                    del self._pending[write_key]
+                    del self._attempts[write_key]
+                    dead.append({"write": list(write_key), "value": value, "error": error, "attempts": attempts})
+                if dead:
+                    # Dead letters are on disk before they leave the journal
+                    self._write_dead_letters(dead)
+                self._rewrite_journal()
+            self.flushed_rows += len(written)
+            logger.info(f"write-behind flushed {len(written)} rating(s), {len(self._pending)} pending")
+            return len(written)
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._pending), "flushed": self.flushed_rows, "coalesced": self.coalesced,
+                    "stuck": len(self._attempts), "dead_lettered": self.dead_lettered}
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self.flush()
+
+    def _flush_group(self, group, rows, written, rejected):
+        """Write one group, falling back to one row at a time if the database rejects the batch.
+
+        Adds ``write key -> value`` to ``written`` and ``write key -> (value, error)`` to ``rejected``.
+        """
+        table, column = group[0], group[1]
+        try:
+            returned = self._write_group(*group, rows)
+        except Exception as e:
+            if _is_connection_error(e):
+                # Says nothing about the rows; retry them all on the next flush
+                logger.error(f"write-behind flush failed for {table}.{column}: {e}")
+                return
+            if len(rows) == 1:
+                key, value = rows[0]
+                logger.error(f"write-behind rejected {table}.{column} for {key!r}: {e}")
+                rejected[group + (key,)] = (value, str(e))
+                return
+            logger.warning(f"write-behind batch for {table}.{column} failed, retrying {len(rows)} row(s) singly: {e}")
+            for row in rows:
+                self._flush_group(group, [row], written, rejected)
+            return
+        for key, value in rows:
+            written[group + (key,)] = value
+        query_cache.invalidate_rows(table, returned)
+
+    def _write_group(self, table, column, key_column, cache_column, rows):
+        from psycopg2 import sql
+        from psycopg2.extras import execute_values
+
+        query = sql.SQL(RATING_UPDATE_QUERY).format(
+            table=sql.Identifier(table), column=sql.Identifier(column),
+            key_column=sql.Identifier(key_column), cache_column=sql.Identifier(cache_column))
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                return execute_values(cursor, query.as_string(conn), rows, page_size=len(rows), fetch=True)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"write-behind flush error: {e}")
+
+    def _replay_journal(self):
+        if not self._journal_path.exists():
+            return
+        with open(self._journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    continue
+                self._pending[tuple(record["write"])] = record["value"]
+        if self._pending:
+            logger.info(f"write-behind replaying {len(self._pending)} journaled rating(s)")
+
+    def _write_dead_letters(self, records):
+        """Append rows given up on to the dead-letter file (caller holds ``_lock``)."""
+        self._dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._dead_letter_path, "a", encoding="utf-8") as dead_letters:
+            for record in records:
+                dead_letters.write(json.dumps(record) + "\n")
+                logger.error(f"write-behind gave up on {record['write']} after {record['attempts']} attempt(s): "
+                             f"{record['error']} (saved to {self._dead_letter_path})")
+            dead_letters.flush()
+            os.fsync(dead_letters.fileno())
+        self.dead_lettered += len(records)
+
+    def _rewrite_journal(self):
+        """Compact the journal down to what is still pending (caller holds ``_lock``)."""
+        tmp_path = self._journal_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for write_key, value in self._pending.items():
+                tmp.write(json.dumps({"write": list(write_key), "value": value}) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._journal.close()
+        os.replace(tmp_path, self._journal_path)
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+
+def _is_connection_error(error):
+    """Lost connection, pool exhaustion or a cancelled statement, as opposed to a row the database rejects."""
+    import psycopg2
+    from psycopg2.pool import PoolError
+
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError))
+
+
+@st.cache_resource
+def get_rating_buffer():
+    """Returns the process-wide rating buffer, replaying any journal left by a crash."""
+    buffer = WriteBehindBuffer()
+    atexit.register(buffer.close)
+    return buffer
+
+
+def render_stats():
+    stats = get_rating_buffer().stats()
+    st.sidebar.caption(
+        f"Rating writes: {stats['pending']} pending, {stats['flushed']} flushed, {stats['coalesced']} coalesced"
+    )
+    if stats["stuck"] or stats["dead_lettered"]:
+        st.sidebar.warning(
+            f"Rating writes: {stats['stuck']} retrying after a database error, "
+            f"{stats['dead_lettered']} given up on (see {DEAD_LETTER_PATH})"
+        )
@@ -1,113 +1,55 @@
-import os
-import json
-import tempfile
 import streamlit as st
-from PIL import Image
-from io import BytesIO
-from google.cloud import storage
-from sqlalchemy import create_engine, text
-import psycopg2
-import pandas as pd
-from pathlib import Path
+from utils import db, image_cache, resources
+from utils.thumbnails import create_thumbnail
+from utils.page_loader import fetch_display_bytes
+from utils.signed_urls import review_image_url
+from utils.manifest import get_manifest, record_upload
+from utils.uploads import SERIAL_EXISTS_QUERY, UPLOAD_PREFIX, create_image
+from utils.prompts import IMAGE_PROMPTS_QUERY, insert_prompts_bulk
 
 # Streamlit app title
 st.title("Fine-tuning GenAI Project")
 
-# Database connection configuration
-db_connection = {
-    "host": "34.93.64.44",
-    "port": "5432",
-    "dbname": "genai",
-    "user": "postgres",
-    "password": "postgres-genai"
-}
-
 # Set up session state
 if "image_number" not in st.session_state:
     st.session_state.image_number = 1
 if "navigation_clicked" not in st.session_state:
     st.session_state.navigation_clicked = False
 
-# Load Google Cloud Storage credentials
-gcs_credentials = json.loads(st.secrets["database"]["credentials"])
-with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.json') as temp_file:
-    json.dump(gcs_credentials, temp_file)
-    temp_file_path = temp_file.name
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file_path
-
-# Initialize Google Cloud Storage client and bucket
-client = storage.Client()
-bucket_name = 'open-to-public-rw-sairam'
-bucket = client.get_bucket(bucket_name)
-
-# Connect to PostgreSQL database using SQLAlchemy
-connection_string = st.secrets["database"]["connection_string"]
-engine = create_engine(connection_string)
-
-# Function to upload an image to Google Cloud Storage
-def upload_image_to_gcs(file_path, destination_blob_name):
-    try:
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(file_path)
-        st.success(f"File '{file_path}' uploaded to Google Cloud Storage as '{destination_blob_name}'.")
-    except Exception as e:
-        st.error(f"Error uploading image to GCS: {e}")
+# The shared storage backend and SQLAlchemy engine are built on first use
+# (resources.get_storage() / resources.get_engine()), not when the page loads
+bucket_name = resources.BUCKET_NAME
 
-# Function to check if an image exists in the bucket
-def image_exists_in_bucket(bucket, image_path):
-    blob = bucket.blob(image_path)
-    try:
-        blob.reload()
-        return True
-    except Exception:
-        return False
+# Function to upload an image to Google Cloud Storage, streamed from the upload buffer.
+# Raises on failure so the caller skips the thumbnail and metadata update.
+def upload_image_to_gcs(uploaded_file, destination_blob_name):
+    stat = resources.get_storage().put(destination_blob_name, uploaded_file.getbuffer(), uploaded_file.type)
+    record_upload(stat)
+    # Drop the cached copy of the image being replaced
+    image_cache.get_image_cache().invalidate(destination_blob_name)
+    st.success(f"File '{uploaded_file.name}' uploaded to Google Cloud Storage as '{destination_blob_name}'.")
+    return stat
 
-# Function to insert image metadata into PostgreSQL database
-def insert_image_metadata(sno, image_filename, status=None, image_feedback=None, gcs_url=None):
-    try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
-        query = """
-        INSERT INTO upload_images (sno, image, image_path, status, image_feedback)
-        VALUES (%s, %s, %s, %s, %s);
-        """
-        cursor.execute(query, (sno, image_filename, gcs_url, status, image_feedback))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        st.success("Image metadata inserted successfully.")
-    except Exception as e:
-        st.error(f"Error inserting metadata: {e}")
-       
 # Function to update image metadata in PostgreSQL database
 def update_image_metadata(sno, image_filename, status=None, image_feedback=None, gcs_url=None):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
         query = """
         UPDATE upload_images
         SET image = %s, image_path = %s, status = %s, image_feedback = %s
         WHERE sno = %s;
         """
-        cursor.execute(query, (image_filename, gcs_url, status, image_feedback, sno))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        db.execute(query, (image_filename, gcs_url, status, image_feedback, sno))
         st.success(f"Image metadata for Serial No. {sno} updated successfully.")
     except Exception as e:
         st.error(f"Error updating metadata: {e}")
 
 def insert_prompt(sno, image_prompt, prompt_feedback=0, prompt_status="Pending"):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
         query = """
         INSERT INTO upload_prompts (sno, prompt_feedback, image_prompts, status)
         VALUES (%s, %s, %s, %s);
         """
-        cursor.execute(query, (sno, prompt_feedback, image_prompt, prompt_status))
-        conn.commit()
-        conn.close()
+        db.execute(query, (sno, prompt_feedback, image_prompt, prompt_status))
         st.success(f"Prompt added successfully for Serial No. {sno}!")
     except Exception as e:
         st.error(f"Error inserting prompt: {e}")
@@ -115,24 +57,12 @@ def insert_prompt(sno, image_prompt, prompt_feedback=0, prompt_status="Pending")
 # Function to get prompts for a given Serial No.
 def get_prompts(sno):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
-        query = "SELECT image_prompts FROM upload_prompts WHERE sno = %s;"
-        cursor.execute(query, (sno,))
-        prompts = cursor.fetchall()
-        conn.close()
+        prompts = db.fetch_all(IMAGE_PROMPTS_QUERY, (sno,))
         return [prompt[0] for prompt in prompts]  # Returns a list of prompts
     except Exception as e:
         st.error(f"Error retrieving prompts: {e}")
         return []
 
-# Function to get the next available Serial Number
-def get_next_serial_number():
-    query = text("SELECT COALESCE(MAX(sno), 0) + 1 AS next_sno FROM upload_images")
-    with engine.connect() as conn:
-        result = conn.execute(query).scalar()
-    return result
-
 # Create two columns for upload and update
 col1, col2 = st.columns(2)
 
@@ -146,43 +76,24 @@ with col1:
         if new_submit_button:
             if new_uploaded_file:
                 try:
-                    # Get the next auto-incremental serial number from the database
-                    next_sno = get_next_serial_number()
-                    unique_filename = f"image{next_sno}.jpg"
-                   
-                    # Prepare local and GCS paths
-                    local_image_path = os.path.join("uploaded_images", unique_filename)
-                    gcs_image_path = f"Upload_images/Moodboard Images/{unique_filename}"
-                   
-                    # Ensure local directory exists
-                    Path("uploaded_images").mkdir(parents=True, exist_ok=True)
-                   
-                    # Save the image locally
-                    with open(local_image_path, "wb") as f:
-                        f.write(new_uploaded_file.getbuffer())
-
-                    try:
-                        # Upload image to Google Cloud Storage
-                        upload_image_to_gcs(local_image_path, gcs_image_path)
+                    def stream_upload(unique_filename, gcs_image_path):
+                        # Stream the in-memory upload buffer straight to Google Cloud Storage
+                        stat = resources.get_storage().put(gcs_image_path, new_uploaded_file.getbuffer(), new_uploaded_file.type)
+                        record_upload(stat)
+                        # Small display copy for the review pages (best effort)
+                        create_thumbnail(resources.get_storage(), gcs_image_path, new_uploaded_file.getbuffer())
 
-                        # Construct the GCS URL for the image
-                        gcs_url = f"https://storage.cloud.google.com/{bucket_name}/{gcs_image_path}"
+                    # Allocate the serial number from the database sequence, upload, then insert
+                    # the metadata; a failed upload writes no row
+                    next_sno, _ = create_image(stream_upload)
 
-                        # Insert metadata into the database, including the GCS URL
-                        insert_image_metadata(next_sno, unique_filename, status="UPLOADED", gcs_url=gcs_url)
-                       
-                        st.success(f"New image uploaded successfully with Serial No. {next_sno}")
-   
-                        # Display the uploaded image
-                        st.image(local_image_path, caption=f"Uploaded Image (Serial No. {next_sno})", use_container_width=True)
+                    st.success(f"New image uploaded successfully with Serial No. {next_sno}")
 
-                    except Exception as e:
-                        st.error(f"Error uploading image: {e}")
-                        # Remove local file if upload fails
-                        os.remove(local_image_path)
+                    # Display the uploaded image
+                    st.image(new_uploaded_file, caption=f"Uploaded Image (Serial No. {next_sno})", use_container_width=True)
 
                 except Exception as e:
-                    st.error(f"Error processing image: {e}")
+                    st.error(f"Error uploading image: {e}")
             else:
                 st.warning("Please select an image file to upload.")
 
@@ -202,8 +113,10 @@ with col2:
                     try:
                         # Check if the serial number exists in the database
                         def check_sno_exists(sno):
+                            from sqlalchemy import text
+
                             query = text("SELECT 1 FROM upload_images WHERE sno = :sno")
-                            with engine.connect() as conn:
+                            with resources.get_engine().connect() as conn:
                                 return conn.execute(query, {"sno": sno}).fetchone() is not None
 
                         if not check_sno_exists(sno_int):
@@ -211,18 +124,14 @@ with col2:
                         else:
                             # Generate the unique filename based on `sno`
                             unique_filename = f"image{sno_int}.jpg"
-                            image_path = os.path.join("uploaded_images", unique_filename)
-                            Path("uploaded_images").mkdir(parents=True, exist_ok=True)
-
-                            # Save the new image locally
-                            with open(image_path, "wb") as f:
-                                f.write(update_uploaded_file.getbuffer())
 
                             # Prepare the GCS image path for the updated image
                             gcs_image_path = f"Upload_images/Moodboard Images/{unique_filename}"
 
-                            # Upload image to Google Cloud Storage
-                            upload_image_to_gcs(image_path, gcs_image_path)
+                            # Upload image to Google Cloud Storage; a failed upload raises
+                            # before the thumbnail or the database row is touched
+                            upload_image_to_gcs(update_uploaded_file, gcs_image_path)
+                            create_thumbnail(resources.get_storage(), gcs_image_path, update_uploaded_file.getbuffer())
 
                             # Generate the new GCS URL
                             gcs_url = f"https://storage.cloud.google.com/{bucket_name}/{gcs_image_path}"
@@ -233,7 +142,7 @@ with col2:
                             st.success(f"Image with Serial No. {sno_int} updated successfully.")
 
                             # Display the uploaded image
-                            st.image(image_path, caption="Updated Image", use_container_width=True)
+                            st.image(update_uploaded_file, caption="Updated Image", use_container_width=True)
 
                     except Exception as e:
                         st.error(f"Error updating image: {e}")
@@ -245,11 +154,8 @@ with col2:
 # Display data from the 'upload_images' table
 def fetch_data_from_db():
     try:
-        conn = psycopg2.connect(**db_connection)
         query = "SELECT * FROM upload_images;"
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
+        return db.read_dataframe(query)
     except Exception as e:
         st.error(f"Error fetching data: {e}")
         return None
@@ -293,28 +199,31 @@ def update_image_number():
 supported_formats = ["jpg", "jpeg", "png"]
 image_found = False  # Flag to track if the image is found
 
-for ext in supported_formats:
-    image_name = f"image{st.session_state.image_number}.{ext}"
-    image_path = os.path.join("Upload_images/Moodboard Images/", image_name)
+# The manifest knows which extension (if any) this image was uploaded with
+manifest = get_manifest(UPLOAD_PREFIX)
+manifest.refresh_if_stale()
+manifest_entry = manifest.lookup(st.session_state.image_number, supported_formats)
 
+if manifest_entry is not None:
     try:
-        if image_exists_in_bucket(bucket, image_path):  # Check if the image exists in the bucket
-            blob = bucket.blob(image_path)
-            image_data = blob.download_as_bytes()  # Download the image data
-            image = Image.open(BytesIO(image_data))  # Open the image
-            # st.image(image, caption=f"Image {st.session_state.image_number}.{ext}", use_container_width=True)
-
-        col1, col2, col3 = st.columns([1, 2, 3])
-        with col2:
-            st.image(
-            image,
-            caption=f"Image {st.session_state.image_number}",
-            width=250  # Adjust this value to set the image width
-        )
+        # Shown at 250px, so serve the thumbnail derivative: a signed URL when the
+        # original is a .jpg, else its bytes from the local image cache (falling
+        # back to the original when no thumbnail exists). None if it was deleted
+        # since the manifest refresh.
+        image, _ = review_image_url(UPLOAD_PREFIX, st.session_state.image_number)
+        if image is None:
+            image, _ = fetch_display_bytes(resources.get_storage(), manifest_entry.blob_name)
+        if image is not None:
+            col1, col2, col3 = st.columns([1, 2, 3])
+            with col2:
+                st.image(
+                image,
+                caption=f"Image {st.session_state.image_number}",
+                width=250  # Adjust this value to set the image width
+            )
             image_found = True  # Mark the image as found
-            break  # Exit the loop as we found the image
     except Exception as e:
-        st.error(f"Error loading image: {e}")  # Log error and continue checking other formats
+        st.error(f"Error loading image: {e}")
 
 # If no image is found after trying all formats, display an error
 if not image_found:
@@ -332,12 +241,7 @@ prompt_sno = st.session_state.image_number
 #Function to check if Serial No. exists in the database
 def check_serial_exists(sno):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
-        query = "SELECT COUNT(*) FROM upload_images WHERE sno = %s;"
-        cursor.execute(query, (sno,))
-        count = cursor.fetchone()[0]
-        conn.close()
+        count = db.fetch_one(SERIAL_EXISTS_QUERY, (sno,))[0]
         return count > 0  # Return True if Serial No. exists
     except Exception as e:
         st.error(f"Error checking serial number: {e}")
@@ -345,17 +249,12 @@ def check_serial_exists(sno):
 # New function to update an existing prompt
 def update_prompt(sno, old_prompt, new_prompt):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
         query = """
         UPDATE upload_prompts
         SET image_prompts = %s
         WHERE sno = %s AND image_prompts = %s;
         """
-        cursor.execute(query, (new_prompt, sno, old_prompt))
-        conn.commit()
-        rows_affected = cursor.rowcount
-        conn.close()
+        rows_affected = db.execute(query, (new_prompt, sno, old_prompt))
         
         if rows_affected > 0:
             st.success(f"Prompt updated successfully!")
@@ -370,16 +269,11 @@ def update_prompt(sno, old_prompt, new_prompt):
 # New function to delete a specific prompt
 def delete_prompt(sno, prompt):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
         query = """
         DELETE FROM upload_prompts
         WHERE sno = %s AND image_prompts = %s;
         """
-        cursor.execute(query, (sno, prompt))
-        conn.commit()
-        rows_affected = cursor.rowcount
-        conn.close()
+        rows_affected = db.execute(query, (sno, prompt))
         
         if rows_affected > 0:
             st.success(f"Prompt deleted successfully!")
@@ -396,12 +290,7 @@ def delete_prompt(sno, prompt):
 #Function to check if Serial No. exists in the database
 def check_serial_exists(sno):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
-        query = "SELECT COUNT(*) FROM upload_images WHERE sno = %s;"
-        cursor.execute(query, (sno,))
-        count = cursor.fetchone()[0]
-        conn.close()
+        count = db.fetch_one(SERIAL_EXISTS_QUERY, (sno,))[0]
         return count > 0  # Return True if Serial No. exists
     except Exception as e:
         st.error(f"Error checking serial number: {e}")
@@ -427,24 +316,14 @@ else:
     
             if submit_prompts:
                 if prompts:
-                    # Add each prompt into the database
-                    new_prompts_added = False
-                    duplicate_prompts = []  # Keep track of duplicate prompts
-                    new_valid_prompts = []  # Track successfully added prompts
-    
-                    for prompt in prompts.splitlines():
-                        prompt = prompt.strip()
-                        if prompt:  # Ensure non-empty prompts are processed
-                            # Check if the prompt already exists
-                            if prompt in existing_prompts:
-                                duplicate_prompts.append(prompt)
-                            else:
-                                insert_prompt(sno=prompt_sno, image_prompt=prompt)
-                                new_prompts_added = True
-                                new_valid_prompts.append(prompt)
-                    
+                    # Add all prompts in one round trip; duplicates are skipped by the database
+                    try:
+                        new_valid_prompts, duplicate_prompts = insert_prompts_bulk(prompt_sno, prompts.splitlines())
+                    except Exception as e:
+                        st.error(f"Error inserting prompts: {e}")
+                        new_valid_prompts, duplicate_prompts = [], []
     
-                    if new_prompts_added:
+                    if new_valid_prompts:
                         st.success(f"Successfully added {len(new_valid_prompts)} new prompt(s)!")
                         # Create a visual display of newly added prompts
                         st.markdown("### Newly Added Prompts:")
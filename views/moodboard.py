@@ -1,31 +1,21 @@
 import logging
 import streamlit as st
 import os
-from PIL import Image
-import pandas as pd
-from sqlalchemy import create_engine, text
-from google.cloud import storage
 from io import BytesIO
-import json
-import tempfile
-import psycopg2
-
-db_connection = {
-    "host": "34.93.64.44",
-    "port": "5432",
-    "dbname": "genai",
-    "user": "postgres",
-    "password": "postgres-genai"
-}
+from utils import db, fragments, image_cache, query_cache, resources, tracing, write_behind
+from utils.manifest import get_manifest
+from utils.moderation import render_bulk_moderation, set_image_status
+from utils.page_loader import fetch_review_data, load_review_page
+from utils.prefetch import prefetch_neighbours
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
 logger = logging.getLogger()
 logger.info("logger")
-conn = psycopg2.connect(**db_connection)
-cursor = conn.cursor()
-logger.info("db_connection")
 
 
+# Time this run; widgets inside the panels below rerun only their own panel
+fragments.begin_page("moodboard")
+
 # Title of the page
 st.title("Fine-tuning GenAI Project")
 
@@ -36,48 +26,18 @@ if "image_number" not in st.session_state:
 if "navigation_clicked" not in st.session_state:
     st.session_state.navigation_clicked = False
 
-# Load Google Cloud Storage credentials
-gcs_credentials = json.loads(st.secrets["database"]["credentials"])
-with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.json') as temp_file:
-    json.dump(gcs_credentials, temp_file)
-    temp_file_path = temp_file.name
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file_path
-client = storage.Client()
-
-# Specify your bucket name
-bucket_name = 'open-to-public-rw-sairam'
-bucket = client.get_bucket(bucket_name)
-
-# Find the maximum image number in the bucket
-def find_max_image_number(bucket, prefix):
-    max_image_number = 0
-    blobs = bucket.list_blobs(prefix=prefix)
-    for blob in blobs:
-        try:
-            filename = os.path.basename(blob.name)
-            if filename.startswith('image') and filename.endswith('.jpg'):
-                num = int(filename[5:-4])
-                max_image_number = max(max_image_number, num)
-        except ValueError:
-            continue
-    return max_image_number
+# The shared storage backend and SQLAlchemy engine are built on first use
+# (resources.get_storage() / resources.get_engine()), not when the page loads
+bucket_name = resources.BUCKET_NAME
 
 # Image prefix for storage
 image_prefix = "Prompts/Final images moodboard/"
-MAX_IMAGE_NUMBER = find_max_image_number(bucket, image_prefix)
-
-# Connect to the PostgreSQL database
-connection_string = st.secrets["database"]["connection_string"]
-engine = create_engine(connection_string)
 
-# Function to check if image exists in bucket
-def image_exists_in_bucket(bucket, image_path):
-    blob = bucket.blob(image_path)
-    try:
-        blob.reload()
-        return True
-    except Exception:
-        return False
+# Find the maximum image number from the bucket manifest (in memory, no bucket listing)
+def find_max_image_number():
+    manifest = get_manifest(image_prefix)
+    manifest.refresh_if_stale()
+    return manifest.max_serial(extension="jpg")
 
 # Navigation callback functions
 def go_back():
@@ -86,47 +46,10 @@ def go_back():
         st.session_state.navigation_clicked = True
 
 def go_next():
-    if not st.session_state.navigation_clicked and st.session_state.image_number < MAX_IMAGE_NUMBER:
+    if not st.session_state.navigation_clicked and st.session_state.image_number < find_max_image_number():
         st.session_state.image_number += 1
         st.session_state.navigation_clicked = True
 
-# Function to fetch prompts from PostgreSQL based on image number
-def get_prompts(image_number):
-    query = f"""
-    SELECT serial_nos, sno, image_prompts,
-           COALESCE(prompt_feedback, 10) AS prompt_feedback,
-           COALESCE(status, 'PENDING') AS status
-    FROM prompts
-    WHERE sno = {image_number}
-    ORDER BY serial_nos;
-    """
-    prompts_df = pd.read_sql(query, engine)
-    return prompts_df
-
-# Function to fetch image feedback and status
-def get_prompt_feedback(image_name):
-    query = text("""
-    SELECT COALESCE(prompt_feedback, 10) AS prompt_feedback,
-           COALESCE(status, 'PENDING') AS status
-    FROM prompts
-    WHERE image_prompts = :image_name
-    """)
-    with engine.connect() as conn:
-        result = conn.execute(query, {"image_name": image_name}).fetchone()
-    return result[0] if result else 10, result[1] if result else 'PENDING'
-
-# Function to fetch image feedback and status
-def get_image_feedback(image_name):
-    query = text("""
-    SELECT COALESCE(image_feedback, 10) AS image_feedback,
-           COALESCE(status, 'PENDING') AS status
-    FROM images
-    WHERE image = :image_name
-    """)
-    with engine.connect() as conn:
-        result = conn.execute(query, {"image_name": image_name}).fetchone()
-    return result[0] if result else 10, result[1] if result else 'PENDING'
-
 def update_prompt(serial_nos, new_prompt):
     try:
         serial_nos = int(serial_nos)
@@ -137,24 +60,26 @@ def update_prompt(serial_nos, new_prompt):
         UPDATE prompts
         SET image_prompts = %s
         WHERE serial_nos = %s
+        RETURNING sno
         """
         logger.info(f"update_query => {update_query}")
 
        
-        cursor.execute(update_query, (
+        updated = db.fetch_all(update_query, (
              
             # prompt_feedback,
             # image_prompts
             new_prompt,
             serial_nos
         ))
-        conn.commit()
+        rows_updated = len(updated)
+        query_cache.invalidate_rows("prompts", updated)
         logger.info("updated")
 
         # Check if any rows were affected
-        if cursor.rowcount > 0:
+        if rows_updated > 0:
             st.success("Prompt updated successfully!")
-            logger.info(f"Rows updated: {cursor.rowcount}")
+            logger.info(f"Rows updated: {rows_updated}")
         else:
             st.warning("No rows were updated. Check if the serial_nos exists in the database.")
             logger.warning(f"Query executed, but no rows matched serial_nos: {serial_nos}")
@@ -166,16 +91,10 @@ def update_prompt(serial_nos, new_prompt):
        
 # Function to update image review
 def update_image_review(image_name, review):
-    logger.info(image_name, review)
+    logger.info(f"{image_name} => {review}")
     try:
-        update_query = """
-        UPDATE images
-        SET image_feedback = %s
-        WHERE image = %s
-        """
-        # with engine.connect() as conn:
-        cursor.execute(update_query, (review, image_name))
-        conn.commit()
+        # Queued and coalesced; flushed to the database in the background
+        write_behind.get_rating_buffer().submit("images", "image_feedback", "image", image_name, review, cache_column="image")
         st.success("Image review updated successfully!")
     except Exception as e:
         st.error(f"Failed to update image review: {e}")
@@ -184,15 +103,7 @@ def update_image_review(image_name, review):
 def update_prompt_review(serial_nos, review):
     logger.info("entering")
     try:
-        update_query = """
-        UPDATE prompts
-        SET prompt_feedback = %s
-        WHERE serial_nos = %s
-        """
-       
-        # with engine.connect() as conn:
-        cursor.execute(update_query, (review, int(serial_nos)))
-        conn.commit()
+        write_behind.get_rating_buffer().submit("prompts", "prompt_feedback", "serial_nos", int(serial_nos), review, cache_column="sno")
         st.success("prompt review updated successfully!")
     except Exception as e:
         st.error(f"Failed to update prompt review: {e}")
@@ -200,15 +111,7 @@ def update_prompt_review(serial_nos, review):
 def update_corelation_review(serial_nos, corelation_review):
     logger.info("entering")
     try:
-        update_query = """
-        UPDATE prompts
-        SET correlation_feedback = %s
-        WHERE serial_nos = %s
-        """
-       
-        # with engine.connect() as conn:
-        cursor.execute(update_query, (corelation_review, int(serial_nos)))
-        conn.commit()
+        write_behind.get_rating_buffer().submit("prompts", "correlation_feedback", "serial_nos", int(serial_nos), corelation_review, cache_column="sno")
         st.success("correlation review updated successfully!")
     except Exception as e:
         st.error(f"Failed to update correlation review: {e}")
@@ -220,17 +123,18 @@ def add_comments(serial_nos, comments):
         UPDATE prompts
         SET comments = %s
         WHERE serial_nos = %s
+        RETURNING sno
         """
-        with conn.cursor() as cursor:
-            cursor.execute(update_query, (comments, int(serial_nos)))
-            conn.commit()
-
-            # Check if rows were updated
-            if cursor.rowcount > 0:
-                st.success("Comments added successfully!")
-                logger.info(f"Comments added to serial_nos {serial_nos}.")
-            else:
-                st.warning("No rows updated. Check if the serial number exists.")
+        updated = db.fetch_all(update_query, (comments, int(serial_nos)))
+        rows_updated = len(updated)
+        query_cache.invalidate_rows("prompts", updated)
+
+        # Check if rows were updated
+        if rows_updated > 0:
+            st.success("Comments added successfully!")
+            logger.info(f"Comments added to serial_nos {serial_nos}.")
+        else:
+            st.warning("No rows updated. Check if the serial number exists.")
     except Exception as e:
         st.error(f"Failed to add comments: {e}")
         logger.error(f"Error adding comments: {e}")
@@ -240,17 +144,20 @@ def add_comments(serial_nos, comments):
 
 # Function to add new prompt
 def add_new_prompt(image_number, prompt_text):
+    from sqlalchemy import text
+
     try:
         insert_query = text("""
         INSERT INTO prompts (sno, image_prompts, prompt_feedback, status)
         VALUES (:sno, :prompt_text, 10, 'PENDING')
         """)
-        with engine.connect() as conn:
+        with resources.get_engine().connect() as conn:
             conn.execute(insert_query, {
                 "sno": image_number,
                 "prompt_text": prompt_text
             })
             conn.commit()
+        query_cache.invalidate("prompts", image_number)
         st.success("New prompt added successfully!")
     except Exception as e:
         st.error(f"Failed to add new prompt: {e}")
@@ -264,8 +171,8 @@ def update_image_number():
     try:
         # Use the input from the text input to update image number
         input_number = int(st.session_state.image_number_input)
-        if input_number < 1 or input_number > MAX_IMAGE_NUMBER:
-            st.error(f"Please enter a number between 1 and {MAX_IMAGE_NUMBER}.")
+        if input_number < 1 or input_number > find_max_image_number():
+            st.error(f"Please enter a number between 1 and {find_max_image_number()}.")
         else:
             st.session_state.image_number = input_number
     except ValueError:
@@ -317,7 +224,7 @@ with col3:
     image_number_input = st.text_input(
         "", 
         value=str(st.session_state.image_number),
-        placeholder=f"Enter Moodboard (1-{MAX_IMAGE_NUMBER})",
+        placeholder=f"Enter Moodboard (1-{find_max_image_number()})",
         key="image_number_input",
         on_change=update_image_number
     )
@@ -370,7 +277,7 @@ with col3:
 #     image_number_input = st.text_input(
 #         "", 
 #         value=str(st.session_state.image_number),
-#         placeholder=f"Enter moodboard number (1-{MAX_IMAGE_NUMBER})",
+#         placeholder=f"Enter moodboard number (1-{find_max_image_number()})",
 #         key="image_number_input",
 #         on_change=update_image_number
 #     )
@@ -384,33 +291,56 @@ image_name = f"image{st.session_state.image_number}.jpg"
 image_path = os.path.join(image_prefix, image_name)
 
 
-col1, col2, col3 = st.columns([1, 2, 3])  # Three columns for layout
-with col2: 
+# Each panel is a fragment: its widgets rerun only that panel, not the whole page
+@fragments.panel("image panel")
+def image_panel(image_number):
+    # Fetch the image URL (or bytes) and all review data for this image in one go
+    # The small thumbnail is shown unless the reviewer asks for the original
+    page = load_review_page(resources.get_storage(), image_number, image_prefix,
+                            images_table="images", prompts_table="prompts",
+                            full_resolution=st.session_state.get("full_resolution", False))
     try:
-        if image_exists_in_bucket(bucket, image_path):
-            blob = bucket.blob(image_path)
-            image_data = blob.download_as_bytes()
-            image = Image.open(BytesIO(image_data))
+        if page.image_error:
+            st.error(f"Error loading image: {page.image_error}")
+        elif page.image_url is not None or page.image_bytes is not None:
+            # A signed URL lets the browser fetch the image straight from storage
+            if page.image_url is not None:
+                image = page.image_url
+            else:
+                # PIL is only needed for the bytes fallback, so it is imported on demand
+                from PIL import Image
+                with tracing.span("image.decode", bytes=len(page.image_bytes)):
+                    image = Image.open(BytesIO(page.image_bytes))
+                    image.load()
 
             # Display the image with a medium size
-            st.image(
-                image, 
-                caption=f"Image {st.session_state.image_number}", 
-                width=280  # Adjust this value to set the image width
-            )
+            with tracing.span("render.image"):
+                st.image(
+                    image, 
+                    caption=f"Image {image_number}", 
+                    width=280  # Adjust this value to set the image width
+                )
+            st.checkbox("Full resolution", key="full_resolution",
+                        help="Load the original image instead of the thumbnail")
         else:
-            st.error(f"Image {st.session_state.image_number} not found.")
+            st.error(f"Image {image_number} not found.")
     except Exception as e:
         st.error(f"Error loading image: {e}")
-    
-col1, col2 = st.columns([1, 2])
 
-with col1:
-    
+
+@fragments.panel("rating panel")
+def rating_panel(image_number, image_name):
+    # Loaded together with the image, so this is a query cache hit
+    data = fetch_review_data(image_number, image_name, "images", "prompts")
+
     # Get existing review and status from the database
-    image_review_score, image_status = get_image_feedback(image_name)
+    image_review_score, image_status = data.image_feedback, data.image_status
+    # A rating still waiting in the write-behind buffer wins over the database value
+    pending_review = write_behind.get_rating_buffer().pending_value("images", "image_feedback", "image", image_name, "image")
+    if pending_review is not None:
+        image_review_score = pending_review
     # Image rating slider
-    image_review = st.slider(f"Rate Image {st.session_state.image_number}:", 1, 10, value=image_review_score, format="%d")
+    image_review = st.slider(f"Rate Image {image_number}:", 1, 10, value=image_review_score, format="%d")
     if st.button(f"Submit rating"):
         update_image_review(image_name, image_review)
         
@@ -422,24 +352,25 @@ with col1:
     if st.button("Submit Comments"):
         if comments.strip():
             # Use the current image number as the serial_nos
-            add_comments(st.session_state.image_number, comments)
+            add_comments(image_number, comments)
         else:
             st.error("Please add a comment before submitting!")
-        
-        
 
-with col2:
-    prompts_df = get_prompts(st.session_state.image_number)
-    if not prompts_df.empty:
-        prompt_options = prompts_df['image_prompts'].tolist()
+
+@fragments.panel("prompt panel")
+def prompt_panel(image_number, image_name):
+    data = fetch_review_data(image_number, image_name, "images", "prompts")
+    prompt_rows = data.prompts
+    if prompt_rows:
+        prompt_options = [row.image_prompts for row in prompt_rows]
         
         selected_prompt_index = st.selectbox(
-            f"Select prompt for image {st.session_state.image_number}",
+            f"Select prompt for image {image_number}",
             range(len(prompt_options)),
             format_func=lambda x: f"Prompt {x + 1}"
         )
         selected_prompt = prompt_options[selected_prompt_index]
-        serial_nos = prompts_df.iloc[selected_prompt_index]['serial_nos']
+        serial_nos = prompt_rows[selected_prompt_index].serial_nos
 
 
         st.markdown("""
@@ -472,7 +403,7 @@ with col2:
        
        
     # Get existing review and status from the database
-        prompt_review_score, image_status = get_prompt_feedback(image_name)
+        prompt_review_score, image_status = data.prompt_feedback, data.prompt_status
 
     # Image rating slider
         st.write(f"Prompt:- {selected_prompt}")
@@ -490,7 +421,7 @@ with col2:
 
 
     else:
-        st.warning(f"No prompts found for image {st.session_state.image_number}.")
+        st.warning(f"No prompts found for image {image_number}.")
 
     # Add new prompt section
     st.write(f"Add a new prompt ")
@@ -503,18 +434,31 @@ with col2:
     # Only show the text area if the session state variable is True
     if "show_new_prompt_text_area" in st.session_state and st.session_state.show_new_prompt_text_area:
         # Display the text area to add a new prompt
-        new_prompt_input = st.text_area(f"New Prompt for Image {st.session_state.image_number}",
-                                        key=f"new_prompts_{st.session_state.image_number}")
+        new_prompt_input = st.text_area(f"New Prompt for Image {image_number}",
+                                        key=f"new_prompts_{image_number}")
 
         # Submit button to add the new prompt
         if st.button(f"Submit New Prompt"):
             # Call the function to add the new prompt to the database
-            add_new_prompt(st.session_state.image_number, new_prompt_input)
+            add_new_prompt(image_number, new_prompt_input)
 
             # Reset the state to hide the text area and button after submission
             st.session_state.show_new_prompt_text_area = False
 
 
+col1, col2, col3 = st.columns([1, 2, 3])  # Three columns for layout
+with col2: 
+    image_panel(st.session_state.image_number)
+    
+col1, col2 = st.columns([1, 2])
+
+with col1:
+    rating_panel(st.session_state.image_number, image_name)
+
+with col2:
+    prompt_panel(st.session_state.image_number, image_name)
+
+
 # Approve/Reject buttons styling
 button_styles = """
     <style>
@@ -547,60 +491,36 @@ button_styles = """
 st.markdown(button_styles, unsafe_allow_html=True)
 
 # Approve/Reject buttons
-col1, col2 = st.columns(2)
+@fragments.panel("approve/reject bar")
+def approve_reject_bar(image_number, image_name):
+    col1, col2 = st.columns(2)
 
-with col1:
-    if st.button("✓ Approve", key="approve_button", type="primary"):
-        st.success(f"Image {st.session_state.image_number} Approved.")
-        try:
-            # Update image status
-            image_update_query = text("""
-            UPDATE images
-            SET status = 'APPROVED'
-            WHERE image = :image_name
-            """)
-           
-            # Update all prompts status for this image
-            prompts_update_query = text("""
-            UPDATE prompts
-            SET status = 'APPROVED'
-            WHERE sno = :image_number
-            """)
-           
-            with engine.connect() as conn:
-                conn.execute(image_update_query, {"image_name": image_name})
-                conn.execute(prompts_update_query, {"image_number": st.session_state.image_number})
-                conn.commit()
-            st.success("Image and associated prompts status updated to Approved in the database.")
-        except Exception as e:
-            st.error(f"Failed to update status to Approved: {e}")
+    with col1:
+        if st.button("✓ Approve", key="approve_button", type="primary"):
+            st.success(f"Image {image_number} Approved.")
+            try:
+                # Update the image and all prompts status for this image
+                set_image_status("APPROVED", image_number, image_name, "images", "prompts")
+                st.success("Image and associated prompts status updated to Approved in the database.")
+            except Exception as e:
+                st.error(f"Failed to update status to Approved: {e}")
+
+    with col2:
+        if st.button("✕ Reject", key="reject_button", type="secondary"):
+            st.warning(f"Image {image_number} Rejected.")
+            try:
+                # Update the image and all prompts status for this image
+                set_image_status("REJECTED", image_number, image_name, "images", "prompts")
+                st.warning("Image and associated prompts status updated to Rejected in the database.")
+            except Exception as e:
+                st.error(f"Failed to update status to Rejected: {e}")
+
+
+approve_reject_bar(st.session_state.image_number, image_name)
 
-with col2:
-    if st.button("✕ Reject", key="reject_button", type="secondary"):
-        st.warning(f"Image {st.session_state.image_number} Rejected.")
-        try:
-            # Update image status
-            image_update_query = text("""
-            UPDATE images
-            SET status = 'REJECTED'
-            WHERE image = :image_name
-            """)
-           
-            # Update all prompts status for this image
-            prompts_update_query = text("""
-            UPDATE prompts
-            SET status = 'REJECTED'
-            WHERE sno = :image_number
-            """)
-           
-            with engine.connect() as conn:
-                conn.execute(image_update_query, {"image_name": image_name})
-                conn.execute(prompts_update_query, {"image_number": st.session_state.image_number})
-                conn.commit()
-            st.warning("Image and associated prompts status updated to Rejected in the database.")
-        except Exception as e:
-            st.error(f"Failed to update status to Rejected: {e}")
 
+# Approve/Reject a whole range or filtered set of images in one transaction
+render_bulk_moderation("images", "prompts", find_max_image_number())
 
 # Navigation buttons
 col1, col2, col3 = st.columns([1, 1, 1])
@@ -617,6 +537,19 @@ with col3:
 if st.session_state.navigation_clicked:
     st.session_state.navigation_clicked = False
 
+# Show query cache hit/miss counters
+query_cache.render_stats()
+write_behind.render_stats()
+image_cache.render_stats()
+db.render_stats()
+resources.render_stats()
+fragments.render_stats("moodboard")
 
+# Warm the neighbouring images in the background so Next/Back render from cache
+prefetch_neighbours(resources.get_storage(), st.session_state.image_number, image_prefix,
+                    images_table="images", prompts_table="prompts", max_number=find_max_image_number())
 
+fragments.end_page()
 
+# This rerun's spans as a sidebar waterfall when the URL has ?trace=1
+tracing.render_panel()
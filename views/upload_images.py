@@ -1,113 +1,55 @@
-import os
-import json
-import tempfile
+import time
 import streamlit as st
-from PIL import Image
-from io import BytesIO
-from google.cloud import storage
-from sqlalchemy import create_engine, text
-import psycopg2
-import pandas as pd
-from pathlib import Path
+from utils import db, image_cache, resources
+from utils.thumbnails import create_thumbnail
+from utils.manifest import record_upload
+from utils.uploads import create_images
+from utils.prompts import IMAGE_PROMPTS_QUERY
+from utils.table_browser import paginated_table
 
 # Streamlit app title
 st.title("Fine-tuning GenAI Project")
 
-# Database connection configuration
-db_connection = {
-    "host": "34.93.64.44",
-    "port": "5432",
-    "dbname": "genai",
-    "user": "postgres",
-    "password": "postgres-genai"
-}
-
 # Set up session state
 if "image_number" not in st.session_state:
     st.session_state.image_number = 1
 if "navigation_clicked" not in st.session_state:
     st.session_state.navigation_clicked = False
 
-# Load Google Cloud Storage credentials
-gcs_credentials = json.loads(st.secrets["database"]["credentials"])
-with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.json') as temp_file:
-    json.dump(gcs_credentials, temp_file)
-    temp_file_path = temp_file.name
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file_path
-
-# Initialize Google Cloud Storage client and bucket
-client = storage.Client()
-bucket_name = 'open-to-public-rw-sairam'
-bucket = client.get_bucket(bucket_name)
-
-# Connect to PostgreSQL database using SQLAlchemy
-connection_string = st.secrets["database"]["connection_string"]
-engine = create_engine(connection_string)
-
-# Function to upload an image to Google Cloud Storage
-def upload_image_to_gcs(file_path, destination_blob_name):
-    try:
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(file_path)
-        st.success(f"File '{file_path}' uploaded to Google Cloud Storage as '{destination_blob_name}'.")
-    except Exception as e:
-        st.error(f"Error uploading image to GCS: {e}")
+# The shared storage backend and SQLAlchemy engine are built on first use
+# (resources.get_storage() / resources.get_engine()), not when the page loads
+bucket_name = resources.BUCKET_NAME
 
-# Function to check if an image exists in the bucket
-def image_exists_in_bucket(bucket, image_path):
-    blob = bucket.blob(image_path)
-    try:
-        blob.reload()
-        return True
-    except Exception:
-        return False
+# Function to upload an image to Google Cloud Storage, streamed from the upload buffer.
+# Raises on failure so the caller skips the thumbnail and metadata update.
+def upload_image_to_gcs(uploaded_file, destination_blob_name):
+    stat = resources.get_storage().put(destination_blob_name, uploaded_file.getbuffer(), uploaded_file.type)
+    record_upload(stat)
+    # Drop the cached copy of the image being replaced
+    image_cache.get_image_cache().invalidate(destination_blob_name)
+    st.success(f"File '{uploaded_file.name}' uploaded to Google Cloud Storage as '{destination_blob_name}'.")
+    return stat
 
-# Function to insert image metadata into PostgreSQL database
-def insert_image_metadata(sno, image_filename, status=None, image_feedback=None, gcs_url=None):
-    try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
-        query = """
-        INSERT INTO upload_images (sno, image, image_path, status, image_feedback)
-        VALUES (%s, %s, %s, %s, %s);
-        """
-        cursor.execute(query, (sno, image_filename, gcs_url, status, image_feedback))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        st.success("Image metadata inserted successfully.")
-    except Exception as e:
-        st.error(f"Error inserting metadata: {e}")
-       
 # Function to update image metadata in PostgreSQL database
 def update_image_metadata(sno, image_filename, status=None, image_feedback=None, gcs_url=None):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
         query = """
         UPDATE upload_images
         SET image = %s, image_path = %s, status = %s, image_feedback = %s
         WHERE sno = %s;
         """
-        cursor.execute(query, (image_filename, gcs_url, status, image_feedback, sno))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        db.execute(query, (image_filename, gcs_url, status, image_feedback, sno))
         st.success(f"Image metadata for Serial No. {sno} updated successfully.")
     except Exception as e:
         st.error(f"Error updating metadata: {e}")
 
 def insert_prompt(sno, image_prompt, prompt_feedback=0, prompt_status="Pending"):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
         query = """
         INSERT INTO upload_prompts (sno, prompt_feedback, image_prompts, status)
         VALUES (%s, %s, %s, %s);
         """
-        cursor.execute(query, (sno, prompt_feedback, image_prompt, prompt_status))
-        conn.commit()
-        conn.close()
+        db.execute(query, (sno, prompt_feedback, image_prompt, prompt_status))
         st.success(f"Prompt added successfully for Serial No. {sno}!")
     except Exception as e:
         st.error(f"Error inserting prompt: {e}")
@@ -115,76 +57,76 @@ def insert_prompt(sno, image_prompt, prompt_feedback=0, prompt_status="Pending")
 # Function to get prompts for a given Serial No.
 def get_prompts(sno):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
-        query = "SELECT image_prompts FROM upload_prompts WHERE sno = %s;"
-        cursor.execute(query, (sno,))
-        prompts = cursor.fetchall()
-        conn.close()
+        prompts = db.fetch_all(IMAGE_PROMPTS_QUERY, (sno,))
         return [prompt[0] for prompt in prompts]  # Returns a list of prompts
     except Exception as e:
         st.error(f"Error retrieving prompts: {e}")
         return []
 
-# Function to get the next available Serial Number
-def get_next_serial_number():
-    query = text("SELECT COALESCE(MAX(sno), 0) + 1 AS next_sno FROM upload_images")
-    with engine.connect() as conn:
-        result = conn.execute(query).scalar()
-    return result
-
 # Create two columns for upload and update
 col1, col2 = st.columns(2)
 
 with col1:
     # Upload New Image Section
-    st.subheader("Upload New Image")
+    st.subheader("Upload New Images")
     with st.form(key="new_image_form"):
-        new_uploaded_file = st.file_uploader("Choose an image file", type=["jpg", "jpeg", "png"], key="new_uploaded_file")
-        new_submit_button = st.form_submit_button("Upload New Image")
+        new_uploaded_files = st.file_uploader("Choose image files", type=["jpg", "jpeg", "png"],
+                                              accept_multiple_files=True, key="new_uploaded_file")
+        new_submit_button = st.form_submit_button("Upload New Images")
 
         if new_submit_button:
-            if new_uploaded_file:
+            if new_uploaded_files:
                 try:
-                    # Get the next auto-incremental serial number from the database
-                    next_sno = get_next_serial_number()
-                    unique_filename = f"image{next_sno}.jpg"
-                   
-                    # Prepare local and GCS paths
-                    local_image_path = os.path.join("uploaded_images", unique_filename)
-                    gcs_image_path = f"Upload_images/Moodboard Images/{unique_filename}"
-                   
-                    # Ensure local directory exists
-                    Path("uploaded_images").mkdir(parents=True, exist_ok=True)
-                   
-                    # Save the image locally
-                    with open(local_image_path, "wb") as f:
-                        f.write(new_uploaded_file.getbuffer())
-
-                    try:
-                        # Upload image to Google Cloud Storage
-                        upload_image_to_gcs(local_image_path, gcs_image_path)
-
-                        # Construct the GCS URL for the image
-                        gcs_url = f"https://storage.cloud.google.com/{bucket_name}/{gcs_image_path}"
-
-                        # Insert metadata into the database, including the GCS URL
-                        insert_image_metadata(next_sno, unique_filename, status="UPLOADED", gcs_url=gcs_url)
-                       
-                        st.success(f"New image uploaded successfully with Serial No. {next_sno}")
-   
-                        # Display the uploaded image
-                        st.image(local_image_path, caption=f"Uploaded Image (Serial No. {next_sno})", use_container_width=True)
-
-                    except Exception as e:
-                        st.error(f"Error uploading image: {e}")
-                        # Remove local file if upload fails
-                        os.remove(local_image_path)
+                    def stream_upload(uploaded_file, unique_filename, gcs_image_path):
+                        # Stream the in-memory upload buffer straight to Google Cloud Storage
+                        stat = resources.get_storage().put(gcs_image_path, uploaded_file.getbuffer(), uploaded_file.type)
+                        record_upload(stat)
+                        # Small display copy for the review pages (best effort)
+                        create_thumbnail(resources.get_storage(), gcs_image_path, uploaded_file.getbuffer())
+
+                    total_bytes = sum(f.size for f in new_uploaded_files)
+                    progress_bar = st.progress(0.0)
+                    progress_text = st.empty()
+                    started = time.perf_counter()
+                    uploaded = {"bytes": 0}
+
+                    def show_progress(done, total, result):
+                        if result.error is None:
+                            uploaded["bytes"] += new_uploaded_files[result.index].size
+                        elapsed = max(time.perf_counter() - started, 1e-6)
+                        progress_bar.progress(done / total)
+                        progress_text.text(
+                            f"{done}/{total} files - {new_uploaded_files[result.index].name} "
+                            f"{'failed' if result.error else 'uploaded'} - "
+                            f"{done / elapsed:.1f} files/s, {uploaded['bytes'] / elapsed / 1e6:.1f} MB/s"
+                        )
+
+                    # Serial numbers are allocated as one block, files are uploaded on a bounded
+                    # thread pool and the metadata rows go in with one batched INSERT
+                    results = create_images(new_uploaded_files, stream_upload, on_progress=show_progress)
+
+                    failed = [r for r in results if r.error]
+                    st.success(
+                        f"Uploaded {len(results) - len(failed)} of {len(results)} image(s) "
+                        f"({total_bytes / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s"
+                    )
+                    import pandas as pd
+
+                    st.dataframe(pd.DataFrame(
+                        [{"File": new_uploaded_files[r.index].name,
+                          "Serial No.": None if r.error else r.sno,
+                          "Seconds": round(r.seconds, 2),
+                          "Status": r.error or "Uploaded"} for r in results]
+                    ), use_container_width=True)
+
+                    # Display the uploaded image when there is just one
+                    if len(results) == 1 and not failed:
+                        st.image(new_uploaded_files[0], caption=f"Uploaded Image (Serial No. {results[0].sno})", use_container_width=True)
 
                 except Exception as e:
-                    st.error(f"Error processing image: {e}")
+                    st.error(f"Error uploading images: {e}")
             else:
-                st.warning("Please select an image file to upload.")
+                st.warning("Please select at least one image file to upload.")
 
 with col2:
     # Update Existing Image Section
@@ -202,8 +144,10 @@ with col2:
                     try:
                         # Check if the serial number exists in the database
                         def check_sno_exists(sno):
+                            from sqlalchemy import text
+
                             query = text("SELECT 1 FROM upload_images WHERE sno = :sno")
-                            with engine.connect() as conn:
+                            with resources.get_engine().connect() as conn:
                                 return conn.execute(query, {"sno": sno}).fetchone() is not None
 
                         if not check_sno_exists(sno_int):
@@ -211,18 +155,14 @@ with col2:
                         else:
                             # Generate the unique filename based on `sno`
                             unique_filename = f"image{sno_int}.jpg"
-                            image_path = os.path.join("uploaded_images", unique_filename)
-                            Path("uploaded_images").mkdir(parents=True, exist_ok=True)
-
-                            # Save the new image locally
-                            with open(image_path, "wb") as f:
-                                f.write(update_uploaded_file.getbuffer())
 
                             # Prepare the GCS image path for the updated image
                             gcs_image_path = f"Upload_images/Moodboard Images/{unique_filename}"
 
-                            # Upload image to Google Cloud Storage
-                            upload_image_to_gcs(image_path, gcs_image_path)
+                            # Upload image to Google Cloud Storage; a failed upload raises
+                            # before the thumbnail or the database row is touched
+                            upload_image_to_gcs(update_uploaded_file, gcs_image_path)
+                            create_thumbnail(resources.get_storage(), gcs_image_path, update_uploaded_file.getbuffer())
 
                             # Generate the new GCS URL
                             gcs_url = f"https://storage.cloud.google.com/{bucket_name}/{gcs_image_path}"
@@ -233,7 +173,7 @@ with col2:
                             st.success(f"Image with Serial No. {sno_int} updated successfully.")
 
                             # Display the uploaded image
-                            st.image(image_path, caption="Updated Image", use_container_width=True)
+                            st.image(update_uploaded_file, caption="Updated Image", use_container_width=True)
 
                     except Exception as e:
                         st.error(f"Error updating image: {e}")
@@ -242,23 +182,8 @@ with col2:
             else:
                 st.warning("Please fill in all required fields for image update.")
 
-# Display data from the 'upload_images' table
-def fetch_data_from_db():
-    try:
-        conn = psycopg2.connect(**db_connection)
-        query = "SELECT * FROM upload_images;"
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
-    except Exception as e:
-        st.error(f"Error fetching data: {e}")
-        return None
-
+# Display data from the 'upload_images' table, one page at a time
 st.subheader("Existing Data")
-df = fetch_data_from_db()
-if df is not None:
-    st.write("Data from the 'upload_images' table:")
-    st.dataframe(df, hide_index=True)
-else:
-    st.write("No data available.")
+st.write("Data from the 'upload_images' table:")
+paginated_table("upload_images", key_column="sno")
 
@@ -1,40 +1,12 @@
 import streamlit as st
-import psycopg2
-import pandas as pd
-
-# Database connection configuration
-db_connection = {
-    "host": "34.93.64.44",
-    "port": "5432",
-    "dbname": "genai",
-    "user": "postgres",
-    "password": "postgres-genai"
-}
-
-# Function to fetch data from the PostgreSQL database
-def fetch_data_from_db():
-    try:
-        conn = psycopg2.connect(**db_connection)
-        query = "SELECT * FROM upload_prompts;"  # SQL query to fetch all data from 'upload_prompts' table
-        df = pd.read_sql(query, conn)  # Using pandas to fetch data into a dataframe
-        conn.close()  # Close the connection
-        return df
-    except psycopg2.OperationalError as e:
-        st.error(f"OperationalError: Unable to connect to the database: {e}")
-        return None
-    except Exception as e:
-        st.error(f"Error: {e}")
-        return None
+from utils import db
+from utils.prompts import DUPLICATE_PROMPT_QUERY, import_prompts, iter_prompt_file
+from utils.table_browser import paginated_table
 
 # Function to check for duplicate prompts in the database
-def check_duplicate_prompt(image_prompt):
+def check_duplicate_prompt(serial_no, image_prompt):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
-        query = "SELECT 1 FROM upload_prompts WHERE image_prompts = %s LIMIT 1;"  # Check if prompt exists
-        cursor.execute(query, (image_prompt,))
-        result = cursor.fetchone()
-        conn.close()  # Close the connection
+        result = db.fetch_one(DUPLICATE_PROMPT_QUERY, (serial_no, image_prompt))
         return result is not None  # If prompt exists, return True
     except Exception as e:
         st.error(f"Error checking for duplicate prompt: {e}")
@@ -43,15 +15,11 @@ def check_duplicate_prompt(image_prompt):
 # Function to insert a new prompt into the PostgreSQL database
 def insert_new_prompt(serial_no, image_prompt):
     try:
-        conn = psycopg2.connect(**db_connection)
-        cursor = conn.cursor()
         query = """
         INSERT INTO upload_prompts (sno, image_prompts)
         VALUES (%s, %s);
         """
-        cursor.execute(query, (serial_no, image_prompt))
-        conn.commit()  # Commit the transaction
-        conn.close()  # Close the connection
+        db.execute(query, (serial_no, image_prompt))  # Commits the transaction
         st.success("New prompt added successfully!")
     except Exception as e:
         st.error(f"Error inserting new prompt: {e}")
@@ -72,19 +40,44 @@ with st.form(key="new_prompt_form"):
     if submit_button:
         if serial_no.isdigit():  # Check if serial_no is a valid integer
             # Check if the prompt already exists
-            if check_duplicate_prompt(image_prompt):
+            if check_duplicate_prompt(serial_no, image_prompt):
                 st.warning("This prompt already exists. Please enter a unique prompt.")
             else:
                 # Insert the new prompt if it's unique
                 insert_new_prompt(serial_no, image_prompt)
-                # Re-fetch the data after insertion
-                df = fetch_data_from_db()
 
-df = fetch_data_from_db()
+# Section to bulk import prompts from a file
+st.subheader("Bulk Import Prompts")
+st.caption("CSV with `serial_no` and `image_prompt` columns, or JSONL with the same keys on each line.")
+
+with st.form(key="bulk_import_form"):
+    prompt_file = st.file_uploader("Choose a CSV or JSONL file", type=["csv", "jsonl"], key="prompt_file")
+    import_button = st.form_submit_button("Import Prompts")
+
+    if import_button:
+        if prompt_file:
+            progress_bar = st.progress(0.0, text="Importing prompts...")
+
+            def show_progress(rows_loaded):
+                fraction = min(prompt_file.tell() / max(prompt_file.size, 1), 1.0)
+                progress_bar.progress(fraction, text=f"Loaded {rows_loaded:,} rows...")
+
+            try:
+                summary = import_prompts(iter_prompt_file(prompt_file), on_progress=show_progress)
+                progress_bar.progress(1.0, text="Import complete.")
+                st.success(
+                    f"Imported {summary['inserted']:,} new prompt(s) from {summary['loaded']:,} rows "
+                    f"in {summary['seconds']:.1f}s ({summary['rows_per_second']:,.0f} rows/s)."
+                )
+                if summary["duplicates"]:
+                    st.info(f"Skipped {summary['duplicates']:,} duplicate prompt(s).")
+                if summary["rejected"]:
+                    st.warning(f"Rejected {summary['rejected']:,} row(s) that were malformed or had no numeric serial number or prompt.")
+            except Exception as e:
+                st.error(f"Error importing prompts: {e}")
+        else:
+            st.warning("Please select a file to import.")
 
-if df is not None and not df.empty:
-    st.write("Data from the 'upload_prompts' table:")
-    # Show the data in an interactive table
-    st.dataframe(df, hide_index=True)
-else:
-    st.write("No data available.")
+st.write("Data from the 'upload_prompts' table:")
+# Show one page at a time; filtering and sorting run in the database
+paginated_table("upload_prompts", key_column="serial_nos")